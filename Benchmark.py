@@ -0,0 +1,190 @@
+# Description: Microbenchmarks for XiangqiGame.make_move. The fixtures are the sample games at the
+# end of XiangqiGame.py, replayed to collect (position, move) pairs, plus positions reached by
+# seeded random playouts from them. Every pair is sorted into one or more categories - opening
+# (the first OPENING_PLIES plies), middlegame (the rest), in_check (the move puts the opponent in
+# check, so make_move runs the checkmate scan), evasion (the side to move is in check) and
+# near_stalemate (the side to move has at most NEAR_STALEMATE_MOVES legal moves) - and make_move
+# is timed on each, reporting p50 and p99 latency and throughput per category.
+# Optionally the parallel search's scaling is measured with ParallelSearch.measure_scaling.
+# Results are written as JSON.
+#
+# Run with: python Benchmark.py [--repeats N] [--scaling] [--processes 1,2,4] [--output FILE]
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+import XiangqiGame as xiangqi_module
+from XiangqiGame import XiangqiGame, coordinates_to_square
+
+OPENING_PLIES = 10
+NEAR_STALEMATE_MOVES = 3
+CATEGORIES = ('opening', 'middlegame', 'in_check', 'evasion', 'near_stalemate')
+SAMPLE_GAME_PATTERN = re.compile(r"make_move\('(\w+)',\s*'(\w+)'\)")
+
+
+def load_sample_games(path=None):
+    """Returns the sample games from the docstrings at the end of XiangqiGame.py (or path) as
+    lists of (from_square, to_square) moves."""
+    if path is None:
+        path = xiangqi_module.__file__
+    with open(path) as source_file:
+        source = source_file.read()
+    games = []
+    for chunk in source.split('# ****')[1:]:
+        if 'GAME' not in chunk.split('\n', 1)[0]:
+            continue
+        moves = SAMPLE_GAME_PATTERN.findall(chunk)
+        if moves:
+            games.append(moves)
+    return games
+
+
+def _add_fixture(fixtures, fen, ply, move, gives_check, evading, num_legal_moves):
+    """Sorts a position, given as FEN, with move to be played on it into the fixture categories.
+    gives_check is True if the move puts the opponent in check and evading is True if the side to
+    move is in check."""
+    fixture = (fen, move)
+    fixtures['opening' if ply < OPENING_PLIES else 'middlegame'].append(fixture)
+    if gives_check:
+        fixtures['in_check'].append(fixture)
+    if evading:
+        fixtures['evasion'].append(fixture)
+    if num_legal_moves <= NEAR_STALEMATE_MOVES:
+        fixtures['near_stalemate'].append(fixture)
+
+
+def build_fixtures(games=None, playouts=20, playout_plies=80, seed=0):
+    """Takes sample games (load_sample_games() if None) and returns a dictionary mapping each
+    category to a list of (FEN, (from_square, to_square)) fixtures. Besides the sample games'
+    own moves, playouts random games of up to playout_plies plies are played from positions of
+    the sample games to find more checking, evasion and near-stalemate positions."""
+    if games is None:
+        games = load_sample_games()
+    fixtures = {category: [] for category in CATEGORIES}
+    positions = []
+    for moves in games:
+        game = XiangqiGame()
+        for ply, move in enumerate(moves):
+            if game.get_game_state() != 'UNFINISHED':
+                break
+            fen = game.get_fen()
+            turn = game.get_turn()
+            evading = game.is_in_check(turn)
+            num_legal_moves = len(game.get_legal_moves(turn))
+            if not game.make_move(move[0], move[1]):
+                continue        # the sample games include rejected moves
+            gives_check = game.is_in_check('black' if turn == 'red' else 'red')
+            _add_fixture(fixtures, fen, ply, move, gives_check, evading, num_legal_moves)
+            positions.append((fen, ply))
+
+    generator = random.Random(seed)
+    for playout in range(playouts if positions else 0):
+        fen, ply = generator.choice(positions)
+        game = XiangqiGame()
+        game.set_fen(fen)
+        for ply in range(ply, ply + playout_plies):
+            if game.get_game_state() != 'UNFINISHED':
+                break
+            legal_moves = game.get_legal_moves(game.get_turn())
+            if not legal_moves:
+                break
+            move = generator.choice(legal_moves)
+            move = (coordinates_to_square(move[0], move[1]),
+                    coordinates_to_square(move[2], move[3]))
+            fen = game.get_fen()
+            turn = game.get_turn()
+            evading = game.is_in_check(turn)
+            game.make_move(move[0], move[1])
+            gives_check = game.is_in_check('black' if turn == 'red' else 'red')
+            if gives_check or evading or len(legal_moves) <= NEAR_STALEMATE_MOVES:
+                _add_fixture(fixtures, fen, ply, move, gives_check, evading, len(legal_moves))
+    return fixtures
+
+
+def _percentile(sorted_values, fraction):
+    """Returns the value at fraction (0 to 1) of a sorted list, by the nearest rank."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def benchmark_make_move(fixtures, repeats=5):
+    """Times make_move on every fixture repeats times. Returns a dictionary with the number of
+    calls, the p50, p99 and mean latency in microseconds and the throughput in moves per second.
+    Each call starts from a fresh set_fen, which is not timed."""
+    clock = time.perf_counter_ns
+    latencies = []
+    game = XiangqiGame()
+    for repeat in range(repeats):
+        for fen, (from_square, to_square) in fixtures:
+            game.set_fen(fen)
+            start = clock()
+            game.make_move(from_square, to_square)
+            latencies.append(clock() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return {'calls': len(latencies),
+            'p50_us': _percentile(latencies, 0.5) / 1000,
+            'p99_us': _percentile(latencies, 0.99) / 1000,
+            'mean_us': total / len(latencies) / 1000 if latencies else 0.0,
+            'moves_per_second': len(latencies) / (total / 1e9) if total else 0.0}
+
+
+def run_benchmarks(repeats=5, scaling=False, process_counts=(1, 2), time_limit=1.0,
+                   playouts=20, seed=0):
+    """Runs the make_move benchmark on every category and, if scaling is True, the parallel
+    search scaling measurement on the middlegame positions. Returns the results as a dictionary
+    ready to be written as JSON."""
+    fixtures = build_fixtures(playouts=playouts, seed=seed)
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(),
+               'repeats': repeats,
+               'make_move': {}}
+    for category in CATEGORIES:
+        entry = benchmark_make_move(fixtures[category], repeats)
+        entry['positions'] = len(fixtures[category])
+        results['make_move'][category] = entry
+
+    if scaling:
+        from ParallelSearch import measure_scaling
+        fens = sorted(set(fen for fen, move in fixtures['middlegame']))[:4]
+        results['parallel_scaling'] = measure_scaling(fens, process_counts, time_limit)
+    return results
+
+
+def main(arguments=None):
+    """Parses the command line, runs the benchmarks and writes the JSON results."""
+    parser = argparse.ArgumentParser(description='Benchmarks XiangqiGame.make_move.')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--playouts', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scaling', action='store_true',
+                        help='also measure the parallel search scaling')
+    parser.add_argument('--processes', default='1,2,%d' % (os.cpu_count() or 1),
+                        help='comma separated process counts for --scaling')
+    parser.add_argument('--time-limit', type=float, default=1.0,
+                        help='seconds per position for --scaling')
+    parser.add_argument('--output', help='file to write the JSON to (default stdout)')
+    options = parser.parse_args(arguments)
+
+    process_counts = sorted(set(int(count) for count in options.processes.split(',')))
+    results = run_benchmarks(options.repeats, options.scaling, process_counts,
+                             options.time_limit, options.playouts, options.seed)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+            output_file.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# Description: Renders XiangqiGame boards for spectators. Every format is built as one string and
+# written to a stream with a single write: 'text' (display_board's layout), 'unicode' (Chinese
+# piece characters, black at the top as seen by red), 'json' (a compact JSON object with the FEN,
+# turn, game state and check flags) and 'svg' (a drawing of the board). A BoardRenderer caches what
+# it renders by position key (which games keep up to date as moves are made, so looking it up
+# costs no board scan), game state and format, so rendering one position for many watchers costs
+# one render.
+
+import json
+from collections import OrderedDict
+
+FORMATS = ('text', 'unicode', 'json', 'svg')
+GLYPHS = {'rK': '帥', 'rG': '仕', 'rE': '相', 'rH': '傌', 'rT': '俥', 'rC': '炮', 'rS': '兵',
+          'bK': '將', 'bG': '士', 'bE': '象', 'bH': '馬', 'bT': '車', 'bC': '砲', 'bS': '卒'}
+EMPTY_GLYPH = '＋'      # full width '+', as wide as the piece characters
+SVG_SQUARE = 40             # pixels between two lines of the board
+
+
+def render_text(game):
+    """Returns the board in display_board's layout."""
+    return game.get_board_text()
+
+
+def render_unicode(game):
+    """Returns the board with one Chinese character per point, red at the bottom, with ranks
+    (make_move's numbers) on the left and files on the bottom."""
+    board = game.get_board()
+    lines = []
+    for row in range(9, -1, -1):
+        glyphs = [GLYPHS.get(board[row][column], EMPTY_GLYPH) for column in range(8, -1, -1)]
+        lines.append('%2d %s' % (row + 1, ''.join(glyphs)))
+        if row == 5:
+            lines.append('   ' + '　' * 9)          # the river
+    lines.append('   ' + ''.join(chr(0xFF41 + num) for num in range(9)))
+    return '\n'.join(lines) + '\n'
+
+
+def render_json(game):
+    """Returns the position as a compact JSON object."""
+    return json.dumps({'fen': game.get_fen(), 'turn': game.get_turn(),
+                       'state': game.get_game_state(),
+                       'red_in_check': game.is_in_check('red'),
+                       'black_in_check': game.is_in_check('black')},
+                      separators=(',', ':'))
+
+
+def render_svg(game):
+    """Returns an SVG drawing of the board, red at the bottom."""
+    size = SVG_SQUARE
+    width = size * 10
+    height = size * 11
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+             'viewBox="0 0 %d %d">' % (width, height, width, height),
+             '<rect width="%d" height="%d" fill="#f0d9a0"/>' % (width, height),
+             '<g stroke="#000" stroke-width="1">']
+
+    def x(column):
+        return size * (9 - column)
+
+    def y(row):
+        return size * (10 - row)
+
+    for row in range(10):
+        parts.append('<line x1="%d" y1="%d" x2="%d" y2="%d"/>' % (x(8), y(row), x(0), y(row)))
+    for column in range(9):
+        # files are broken by the river except at the edges
+        if column in (0, 8):
+            parts.append('<line x1="%d" y1="%d" x2="%d" y2="%d"/>' % (
+                x(column), y(0), x(column), y(9)))
+        else:
+            parts.append('<line x1="%d" y1="%d" x2="%d" y2="%d"/>' % (
+                x(column), y(0), x(column), y(4)))
+            parts.append('<line x1="%d" y1="%d" x2="%d" y2="%d"/>' % (
+                x(column), y(5), x(column), y(9)))
+    for low, high in ((0, 2), (7, 9)):
+        parts.append('<line x1="%d" y1="%d" x2="%d" y2="%d"/>' % (x(5), y(low), x(3), y(high)))
+        parts.append('<line x1="%d" y1="%d" x2="%d" y2="%d"/>' % (x(3), y(low), x(5), y(high)))
+    parts.append('</g>')
+
+    board = game.get_board()
+    for row in range(10):
+        for column in range(9):
+            piece = board[row][column]
+            if piece == '--':
+                continue
+            color = '#c00' if piece[0] == 'r' else '#000'
+            parts.append('<circle cx="%d" cy="%d" r="%d" fill="#fff5dc" stroke="%s" '
+                         'stroke-width="2"/>' % (x(column), y(row), size * 9 // 20, color))
+            parts.append('<text x="%d" y="%d" font-size="%d" text-anchor="middle" '
+                         'dominant-baseline="central" fill="%s">%s</text>' % (
+                             x(column), y(row), size // 2, color, GLYPHS[piece]))
+    parts.append('</svg>')
+    return '\n'.join(parts) + '\n'
+
+
+RENDERERS = {'text': render_text, 'unicode': render_unicode, 'json': render_json,
+             'svg': render_svg}
+
+
+class BoardRenderer:
+    """Renders games in any of FORMATS, keeping the last cache_size renders keyed by position
+    key, game state and format."""
+
+    def __init__(self, cache_size=1024):
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+    def render(self, game, board_format='text'):
+        """Returns the game's board rendered in board_format. Raises ValueError for an unknown
+        format."""
+        if board_format not in RENDERERS:
+            raise ValueError('Unknown board format: ' + str(board_format))
+        key = (game.get_position_key(), game.get_game_state(), board_format)
+        output = self._cache.get(key)
+        if output is not None:
+            self._cache.move_to_end(key)
+            return output
+        output = RENDERERS[board_format](game)
+        self._cache[key] = output
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return output
+
+    def write(self, game, stream, board_format='text'):
+        """Writes the game's board rendered in board_format to stream with one write."""
+        stream.write(self.render(game, board_format))
+
+    def clear(self):
+        """Empties the cache."""
+        self._cache.clear()
@@ -0,0 +1,437 @@
+# Description: Differential testing of the move generators and game stores against the reference
+# rules. Random legal games are played on every backend at once and, ply by ply, each backend's
+# legal moves, turn, check flags, game state and position key are compared with those of the
+# 'reference' backend, which tries every piece's move method on all 90 squares and keeps the moves
+# which, made on a copy of the board, leave the mover's General unattacked and the Generals not
+# facing each other - the rules as the Piece subclasses define them, with no shortcuts. The
+# reference works out legality, check flags and position keys from the board alone, never with
+# XiangqiGame's own legality helpers, file masks or incremental key, so bugs in those show up as
+# divergences. Every chosen move is also played with make_move, which must accept it.
+#
+# When backends disagree the position is shrunk: pieces other than the Generals are removed one at
+# a time as long as the backends still disagree on the smaller position (its legal moves, or the
+# result of one of them), which leaves a minimal FEN to reproduce the divergence from. Games are
+# spread over worker processes with multiprocessing, one seed per game, so a run is repeatable and
+# scales with the number of cores. Most of the time goes to make_move, which every backend plays
+# each move with: expect on the order of 75 positions a second per core, so a million positions
+# takes a few hours on one core and minutes only on tens of cores.
+#
+# Backends: 'reference', 'generator' (XiangqiGame.get_legal_moves), 'store' (a GameStore game,
+# which keeps its position key incrementally) and 'snapshot' (a game restored from its
+# PositionSnapshot before every query). New backends, such as other board representations, are
+# added to BACKENDS: a class with load(fen), get_legal_moves() (a set of (from_row, from_column,
+# to_row, to_column) moves, or None if it cannot generate them), play(move) and observe() (a
+# dictionary of OBSERVED_FIELDS, None for any it does not track).
+#
+# Run with: python DifferentialFuzzer.py [--games N] [--plies N] [--processes N] [--seed N]
+#           [--backends reference,generator,store,snapshot] [--no-shrink] [--output FILE]
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+from collections import namedtuple
+
+from GameStore import GameStore
+from XiangqiGame import XiangqiGame, START_FEN, STANDARD_PIECES, ZOBRIST_KEYS, \
+    ZOBRIST_BLACK_TO_MOVE, coordinates_to_square
+
+OBSERVED_FIELDS = ('turn', 'red_in_check', 'black_in_check', 'game_state', 'position_key')
+
+
+class Divergence(namedtuple('Divergence', ['seed', 'ply', 'moves', 'fen', 'shrunk_fen', 'backend',
+                                           'field', 'expected', 'actual'])):
+    """A disagreement between a backend and the reference: the game's seed, the ply it was found
+    at, the moves played (ending with the rejected move for 'make_move'), the position's FEN and
+    the shrunk FEN, the backend, the field that differed ('legal_moves', 'make_move' or one of
+    OBSERVED_FIELDS) and the reference's and the backend's values. For 'legal_moves' these are the
+    moves only the reference generated and the moves only the backend generated."""
+    __slots__ = ()
+
+
+def _find_general(board, color):
+    """Returns the (row, column) of color's General on board, or None."""
+    for row in range(0, 10):
+        for column in range(0, 9):
+            if board[row][column] == color + 'K':
+                return row, column
+    return None
+
+
+def _find_pieces(board, pieces, color):
+    """Returns (row, column, piece object) for every piece of color ('r' or 'b') on board."""
+    return [(row, column, pieces[board[row][column]])
+            for row in range(0, 10) for column in range(0, 9) if board[row][column][0] == color]
+
+
+def _attacked(board, attackers, row, column, color):
+    """Takes the pieces of color ('r' or 'b') listed by _find_pieces and returns True if any of
+    them still on its square of board could move to the square according to its move method.
+    A piece captured since it was listed no longer stands on its square and is skipped."""
+    for from_row, from_column, piece_obj in attackers:
+        if board[from_row][from_column][0] == color and \
+                piece_obj.move(from_row, from_column, row, column, board):
+            return True
+    return False
+
+
+def _generals_facing(board):
+    """Returns True if the two Generals on board stand on one file with no piece between them."""
+    red_row, red_column = _find_general(board, 'r')
+    black_row, black_column = _find_general(board, 'b')
+    if red_column != black_column:
+        return False
+    return all(board[row][red_column] == '--'
+               for row in range(min(red_row, black_row) + 1, max(red_row, black_row)))
+
+
+def _reference_pieces():
+    """Returns a dictionary of piece strings to piece objects of the standard rules."""
+    return {color + letter: piece_class('red' if color == 'r' else 'black')
+            for letter, piece_class in STANDARD_PIECES.items() for color in 'rb'}
+
+
+class ReferenceBackend:
+    """Generates legal moves by calling each piece's move method for every square of the board,
+    with piece objects of its own, and testing each move on its own copy of the board. Check
+    flags and the position key are worked out from the board too. Moves are played with
+    make_move."""
+
+    def __init__(self):
+        self._game = XiangqiGame()
+        self._pieces = _reference_pieces()
+
+    def load(self, fen):
+        self._game.set_fen(fen)
+
+    def get_game(self):
+        """Returns the backend's XiangqiGame."""
+        return self._game
+
+    def get_legal_moves(self):
+        game = self._game
+        board = [row[:] for row in game.get_board()]
+        color = game.get_turn()[0]
+        other = 'b' if color == 'r' else 'r'
+        king_row, king_column = _find_general(board, color)
+        attackers = _find_pieces(board, self._pieces, other)
+        moves = set()
+        for from_row in range(0, 10):
+            for from_column in range(0, 9):
+                piece = board[from_row][from_column]
+                if piece[0] != color:
+                    continue
+                piece_obj = self._pieces[piece]
+                for to_row in range(0, 10):
+                    for to_column in range(0, 9):
+                        if board[to_row][to_column][0] == color:
+                            continue
+                        if not piece_obj.move(from_row, from_column, to_row, to_column, board):
+                            continue
+                        captured = board[to_row][to_column]
+                        board[from_row][from_column] = '--'
+                        board[to_row][to_column] = piece
+                        if piece[1] == 'K':
+                            legal = not _attacked(board, attackers, to_row, to_column, other)
+                        else:
+                            legal = not _attacked(board, attackers, king_row, king_column, other)
+                        legal = legal and not _generals_facing(board)
+                        board[to_row][to_column] = captured
+                        board[from_row][from_column] = piece
+                        if legal:
+                            moves.add((from_row, from_column, to_row, to_column))
+        return moves
+
+    def play(self, move):
+        return self._game.make_move(coordinates_to_square(move[0], move[1]),
+                                    coordinates_to_square(move[2], move[3]))
+
+    def observe(self):
+        game = self._game
+        board = game.get_board()
+        key = 0
+        for row in range(0, 10):
+            for column in range(0, 9):
+                if board[row][column] != '--':
+                    key ^= ZOBRIST_KEYS[board[row][column]][row * 9 + column]
+        if game.get_turn() == 'black':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        red_row, red_column = _find_general(board, 'r')
+        black_row, black_column = _find_general(board, 'b')
+        return {'turn': game.get_turn(),
+                'red_in_check': _attacked(board, _find_pieces(board, self._pieces, 'b'),
+                                          red_row, red_column, 'b'),
+                'black_in_check': _attacked(board, _find_pieces(board, self._pieces, 'r'),
+                                            black_row, black_column, 'r'),
+                'game_state': game.get_game_state(), 'position_key': key}
+
+
+class GeneratorBackend(ReferenceBackend):
+    """Generates legal moves with XiangqiGame.get_legal_moves."""
+
+    def get_legal_moves(self):
+        return set(self._game.get_legal_moves(self._game.get_turn()))
+
+    def observe(self):
+        game = self._game
+        return {'turn': game.get_turn(), 'red_in_check': game.is_in_check('red'),
+                'black_in_check': game.is_in_check('black'), 'game_state': game.get_game_state(),
+                'position_key': game.get_position_key()}
+
+
+class SnapshotBackend(ReferenceBackend):
+    """Rebuilds its game from the game's PositionSnapshot before generating moves and observing,
+    so anything restore_snapshot fails to rebuild shows up."""
+
+    def _restored(self):
+        game = XiangqiGame()
+        game.restore_snapshot(self._game.get_snapshot())
+        return game
+
+    def get_legal_moves(self):
+        game = self._restored()
+        return set(game.get_legal_moves(game.get_turn()))
+
+    def observe(self):
+        game = self._restored()
+        return {'turn': game.get_turn(), 'red_in_check': game.is_in_check('red'),
+                'black_in_check': game.is_in_check('black'), 'game_state': game.get_game_state(),
+                'position_key': game.get_position_key()}
+
+
+class StoreBackend:
+    """Plays the game in a GameStore. It does not generate moves."""
+
+    def __init__(self):
+        self._store = GameStore(capacity=1)
+        self._handle = None
+
+    def load(self, fen):
+        if self._handle is not None:
+            self._store.remove_game(self._handle.get_index())
+        self._handle = self._store.add_game(fen)
+
+    def get_legal_moves(self):
+        return None
+
+    def play(self, move):
+        return self._handle.make_move(coordinates_to_square(move[0], move[1]),
+                                      coordinates_to_square(move[2], move[3]))
+
+    def observe(self):
+        handle = self._handle
+        return {'turn': handle.get_turn(), 'red_in_check': handle.is_in_check('red'),
+                'black_in_check': handle.is_in_check('black'),
+                'game_state': handle.get_game_state(), 'position_key': handle.get_position_key()}
+
+
+BACKENDS = {'reference': ReferenceBackend, 'generator': GeneratorBackend,
+            'store': StoreBackend, 'snapshot': SnapshotBackend}
+
+
+def _backend_names(names):
+    """Returns 'reference' followed by the other names."""
+    return ['reference'] + [name for name in names if name != 'reference']
+
+
+def _make_backends(names):
+    """Returns a reference backend followed by the other named backends."""
+    return [BACKENDS[name]() for name in _backend_names(names)]
+
+
+def _compare(backends, reference_moves):
+    """Compares every backend with the first (the reference), whose legal moves are given, and
+    returns (backend index, field, expected, actual) for the first difference, or None."""
+    expected = backends[0].observe()
+    for num, backend in enumerate(backends[1:], 1):
+        moves = backend.get_legal_moves()
+        if moves is not None and moves != reference_moves:
+            return num, 'legal_moves', sorted(reference_moves - moves), \
+                sorted(moves - reference_moves)
+        actual = backend.observe()
+        for field in OBSERVED_FIELDS:
+            if actual[field] is not None and actual[field] != expected[field]:
+                return num, field, expected[field], actual[field]
+    return None
+
+
+def _play(backends, move):
+    """Plays move on every backend and returns (backend index, 'make_move', True, result) for the
+    first which does not accept it, or None."""
+    for num, backend in enumerate(backends):
+        result = backend.play(move)
+        if result is not True:
+            return num, 'make_move', True, result
+    return None
+
+
+def find_divergence(fen, names):
+    """Loads fen into the reference and the named backends and returns (backend name, field,
+    expected, actual) if they disagree on the position, or on the position after any legal move,
+    otherwise None."""
+    backends = _make_backends(names)
+    for backend in backends:
+        backend.load(fen)
+    reference_moves = backends[0].get_legal_moves()
+    difference = _compare(backends, reference_moves)
+    if difference is None and backends[0].observe()['game_state'] == 'UNFINISHED':
+        for move in sorted(reference_moves):
+            for backend in backends:
+                backend.load(fen)
+            difference = _play(backends, move) or _compare(backends,
+                                                           backends[0].get_legal_moves())
+            if difference is not None:
+                break
+    if difference is None:
+        return None
+    num, field, expected, actual = difference
+    return _backend_names(names)[num], field, expected, actual
+
+
+def _is_legal_position(fen):
+    """Returns True if the position could arise in play: the player who just moved is not in
+    check and the Generals do not face each other. Worked out like the reference's legality."""
+    game = XiangqiGame()
+    game.set_fen(fen)
+    board = game.get_board()
+    mover, other = ('b', 'r') if game.get_turn() == 'red' else ('r', 'b')
+    row, column = _find_general(board, mover)
+    attackers = _find_pieces(board, _reference_pieces(), other)
+    return not _attacked(board, attackers, row, column, other) and \
+        not _generals_facing(board)
+
+
+def shrink_position(fen, names):
+    """Removes pieces other than the Generals from fen, one at a time, as long as the backends
+    still disagree on the smaller position, and returns the smallest FEN found."""
+    changed = True
+    while changed:
+        changed = False
+        game = XiangqiGame()
+        game.set_fen(fen)
+        board = game.get_board()
+        for row in range(0, 10):
+            for column in range(0, 9):
+                piece = board[row][column]
+                if piece == '--' or piece[1] == 'K':
+                    continue
+                board[row][column] = '--'
+                smaller = game.get_fen()
+                board[row][column] = piece
+                if _is_legal_position(smaller) and find_divergence(smaller, names) is not None:
+                    fen = smaller
+                    changed = True
+                    break
+            if changed:
+                break
+    return fen
+
+
+def fuzz_game(seed, max_plies=200, names=('generator', 'store', 'snapshot'), shrink=True):
+    """Plays one random game, chosen by seed, on the reference and the named backends, comparing
+    them at every ply. Returns (positions compared, Divergence or None)."""
+    generator = random.Random(seed)
+    backends = _make_backends(names)
+    for backend in backends:
+        backend.load(START_FEN)
+    moves = []
+    for ply in range(max_plies + 1):
+        reference_moves = backends[0].get_legal_moves()
+        fen = backends[0].get_game().get_fen()
+        difference = _compare(backends, reference_moves)
+        if difference is None and reference_moves and ply < max_plies and \
+                backends[0].observe()['game_state'] == 'UNFINISHED':
+            move = generator.choice(sorted(reference_moves))
+            difference = _play(backends, move)
+            moves.append(move)
+        else:
+            move = None
+        if difference is not None:
+            num, field, expected, actual = difference
+            shrunk_fen = shrink_position(fen, names) if shrink else fen
+            return ply + 1, Divergence(seed, ply, moves, fen, shrunk_fen,
+                                       _backend_names(names)[num], field, expected, actual)
+        if move is None:
+            return ply + 1, None
+    return max_plies + 1, None
+
+
+def _fuzz_task(arguments):
+    """Runs fuzz_game in a worker process."""
+    return fuzz_game(*arguments)
+
+
+def run_fuzz(games=100, max_plies=200, processes=None, seed=0,
+             names=('generator', 'store', 'snapshot'), shrink=True):
+    """Fuzzes games with seeds seed to seed + games - 1 in processes worker processes (all CPUs if
+    None, none if 1) and returns a dictionary of the number of games and positions, the time taken
+    and the divergences found."""
+    for name in names:
+        if name not in BACKENDS:
+            raise ValueError('Unknown backend: ' + str(name))
+    tasks = [(game_seed, max_plies, tuple(names), shrink)
+             for game_seed in range(seed, seed + games)]
+    start_time = time.monotonic()
+    if processes == 1:
+        results = map(_fuzz_task, tasks)
+        positions, divergences = _collect(results)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            positions, divergences = _collect(pool.imap_unordered(_fuzz_task, tasks))
+    seconds = time.monotonic() - start_time
+    return {
+        'games': games,
+        'positions': positions,
+        'seconds': round(seconds, 3),
+        'positions_per_second': round(positions / seconds, 1) if seconds else None,
+        'backends': list(names),
+        'divergences': [divergence._asdict()
+                        for divergence in sorted(divergences, key=lambda found: found.seed)]
+    }
+
+
+def _collect(results):
+    """Adds up the positions and gathers the divergences of fuzz_game results."""
+    positions = 0
+    divergences = []
+    for game_positions, divergence in results:
+        positions += game_positions
+        if divergence is not None:
+            divergences.append(divergence)
+    return positions, divergences
+
+
+def main(arguments=None):
+    """Parses the command line, runs the fuzzer and writes the JSON results. Exits with status 1
+    if any divergence was found."""
+    parser = argparse.ArgumentParser(description='Compares move generation backends.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--plies', type=int, default=200, help='most plies per game')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default all CPUs, 1 for none)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--backends', default='generator,store,snapshot',
+                        help='comma separated backends to compare with the reference')
+    parser.add_argument('--no-shrink', action='store_true',
+                        help='report divergent positions without shrinking them')
+    parser.add_argument('--output', help='file to write the JSON to (default stdout)')
+    options = parser.parse_args(arguments)
+
+    names = [name for name in options.backends.split(',') if name]
+    results = run_fuzz(options.games, options.plies, options.processes, options.seed, names,
+                       not options.no_shrink)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+            output_file.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    if results['divergences']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
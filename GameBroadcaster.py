@@ -0,0 +1,253 @@
+# Description: Streams the moves of live games to spectators instead of having them poll get_turn,
+# get_game_state and display_board. A GameBroadcaster is added to each watched XiangqiGame as a move
+# listener and fans every MoveEvent out, numbered per game, to that game's subscribers through
+# asyncio. Every Subscription has its own bounded queue, so a slow watcher never holds up the game
+# or the other watchers. When a queue is full the policy decides: 'drop_oldest' drops the oldest
+# waiting event and counts it (the watcher sees a gap in the sequence numbers and can fetch a full
+# board, for example from a BoardRenderer, to resync) and 'disconnect' ends the subscription.
+# Producers running in the event loop which would rather wait for their watchers can await
+# wait_for_room before each move, or publish with publish_wait.
+#
+# Games may be played in other threads: events published outside the event loop are handed to it
+# with call_soon_threadsafe. encode_event packs a numbered event into EVENT_SIZE (8) bytes for the
+# wire: sequence number, from and to squares (row * 9 + column), the moved and captured pieces
+# (SNAPSHOT_PIECES codes, four bits each) and a byte of check flags and state code.
+
+import asyncio
+import struct
+import threading
+from collections import deque
+
+from GameStore import STATES, STATE_CODES
+from XiangqiGame import MoveEvent, SNAPSHOT_PIECES, SNAPSHOT_CODES, coordinates_to_square, \
+    square_to_coordinates
+
+POLICIES = ('drop_oldest', 'disconnect')
+EVENT_FORMAT = struct.Struct('<IBBBB')      # sequence, from, to, pieces, flags
+EVENT_SIZE = EVENT_FORMAT.size
+
+
+def encode_event(sequence, event):
+    """Packs a sequence number and a MoveEvent into EVENT_SIZE bytes."""
+    from_row, from_column = square_to_coordinates(event.from_square)
+    to_row, to_column = square_to_coordinates(event.to_square)
+    pieces = SNAPSHOT_CODES[event.piece] << 4 | SNAPSHOT_CODES[event.captured]
+    flags = event.red_in_check | event.black_in_check << 1 | STATE_CODES[event.game_state] << 2
+    return EVENT_FORMAT.pack(sequence & 0xFFFFFFFF, from_row * 9 + from_column,
+                             to_row * 9 + to_column, pieces, flags)
+
+
+def decode_event(data):
+    """Unpacks bytes made by encode_event and returns (sequence, MoveEvent)."""
+    sequence, from_index, to_index, pieces, flags = EVENT_FORMAT.unpack(data)
+    return sequence, MoveEvent(coordinates_to_square(*divmod(from_index, 9)),
+                               coordinates_to_square(*divmod(to_index, 9)),
+                               SNAPSHOT_PIECES[pieces >> 4], SNAPSHOT_PIECES[pieces & 15],
+                               bool(flags & 1), bool(flags & 2), STATES[flags >> 2])
+
+
+class Subscription:
+    """One watcher's stream of (sequence, MoveEvent) pairs for one game, made by
+    GameBroadcaster.subscribe. It is an asynchronous iterator which ends when the subscription is
+    closed, and an asynchronous context manager which closes it."""
+
+    def __init__(self, broadcaster, game_id, queue_size, policy):
+        self._broadcaster = broadcaster
+        self._game_id = game_id
+        self._queue_size = queue_size
+        self._policy = policy
+        self._events = deque()
+        self._ready = asyncio.Event()       # set while events are waiting or once closed
+        self._room = asyncio.Event()        # set while the queue has room
+        self._room.set()
+        self._closed = False
+        self._dropped = 0
+
+    def get_game_id(self):
+        """Returns the id of the game subscribed to."""
+        return self._game_id
+
+    def get_dropped(self):
+        """Returns the number of events dropped because the queue was full."""
+        return self._dropped
+
+    def is_closed(self):
+        """Returns True once the subscription has been closed or disconnected."""
+        return self._closed
+
+    def qsize(self):
+        """Returns the number of events waiting."""
+        return len(self._events)
+
+    def _push(self, item):
+        """Queues an item, applying the policy if the queue is full. Runs in the event loop."""
+        if self._closed:
+            return
+        if len(self._events) >= self._queue_size:
+            if self._policy == 'disconnect':
+                self.close()
+                return
+            self._events.popleft()
+            self._dropped += 1
+        self._events.append(item)
+        self._ready.set()
+        if len(self._events) >= self._queue_size:
+            self._room.clear()
+
+    async def _wait_for_room(self):
+        """Waits until the queue has room or the subscription is closed."""
+        while not self._closed and len(self._events) >= self._queue_size:
+            await self._room.wait()
+
+    async def get(self):
+        """Waits for the next (sequence, MoveEvent) pair and returns it. Returns None once the
+        subscription is closed and its queue is empty."""
+        while not self._events:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        item = self._events.popleft()
+        self._room.set()
+        return item
+
+    def _close(self):
+        self._closed = True
+        self._ready.set()
+        self._room.set()
+
+    def close(self):
+        """Stops the subscription. Events already queued can still be read."""
+        if not self._closed:
+            self._close()
+            self._broadcaster._unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class GameBroadcaster:
+    """Fans the MoveEvents of attached games out to their subscribers. Subscriptions are made in a
+    running event loop, which is the loop every event is delivered in. queue_size and policy (one
+    of POLICIES) are the defaults for new subscriptions."""
+
+    def __init__(self, queue_size=64, policy='drop_oldest'):
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy: ' + str(policy))
+        self._queue_size = queue_size
+        self._policy = policy
+        self._subscribers = {}          # game id: list of Subscriptions
+        self._sequences = {}            # game id: number of the last event published
+        self._listeners = {}            # game id: (game, listener)
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def attach(self, game, game_id):
+        """Adds a move listener to game which publishes its moves under game_id."""
+        def listener(event):
+            self.publish(game_id, event)
+
+        with self._lock:
+            if game_id in self._listeners:
+                raise ValueError('A game is already attached as ' + str(game_id))
+            self._listeners[game_id] = (game, listener)
+            self._sequences.setdefault(game_id, 0)
+        game.add_move_listener(listener)
+
+    def detach(self, game_id, close=True):
+        """Removes the move listener of the game attached as game_id and, with close, closes its
+        subscriptions."""
+        with self._lock:
+            game, listener = self._listeners.pop(game_id)
+        game.remove_move_listener(listener)
+        if close:
+            for subscription in list(self._subscribers.get(game_id, ())):
+                subscription.close()
+
+    def subscribe(self, game_id, queue_size=None, policy=None):
+        """Returns a new Subscription to the events of game_id. Must be called in the event loop
+        the events are to be delivered in."""
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError('GameBroadcaster is used from another event loop')
+        policy = self._policy if policy is None else policy
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy: ' + str(policy))
+        subscription = Subscription(self, game_id, queue_size or self._queue_size, policy)
+        with self._lock:
+            self._subscribers[game_id] = self._subscribers.get(game_id, []) + [subscription]
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.get_game_id(), [])
+            if subscription in subscribers:
+                subscribers = [other for other in subscribers if other is not subscription]
+                if subscribers:
+                    self._subscribers[subscription.get_game_id()] = subscribers
+                else:
+                    del self._subscribers[subscription.get_game_id()]
+
+    def get_num_subscribers(self, game_id):
+        """Returns the number of open subscriptions to game_id."""
+        return len(self._subscribers.get(game_id, ()))
+
+    def get_sequence(self, game_id):
+        """Returns the sequence number of the last event published for game_id, 0 if none."""
+        return self._sequences.get(game_id, 0)
+
+    def _next_item(self, game_id, event):
+        with self._lock:
+            sequence = self._sequences.get(game_id, 0) + 1
+            self._sequences[game_id] = sequence
+            return (sequence, event), self._subscribers.get(game_id, ())
+
+    def publish(self, game_id, event):
+        """Numbers event and queues it for every subscriber of game_id without waiting. Can be
+        called from any thread."""
+        item, subscribers = self._next_item(game_id, event)
+        if not subscribers:
+            return
+        loop = self._loop
+        try:
+            in_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            for subscription in subscribers:
+                subscription._push(item)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(self._deliver, game_id, item)
+
+    def _deliver(self, game_id, item):
+        for subscription in self._subscribers.get(game_id, ()):
+            subscription._push(item)
+
+    async def wait_for_room(self, game_id):
+        """Waits until every subscriber of game_id has room in its queue. A game played in the
+        event loop can await this before each make_move to move at the pace of its slowest
+        watcher."""
+        for subscription in self._subscribers.get(game_id, ()):
+            await subscription._wait_for_room()
+
+    async def publish_wait(self, game_id, event):
+        """Like publish, but first waits until every subscriber of game_id has room for the event.
+        Must be called in the broadcaster's event loop."""
+        await self.wait_for_room(game_id)
+        item, subscribers = self._next_item(game_id, event)
+        for subscription in subscribers:
+            subscription._push(item)
@@ -0,0 +1,321 @@
+# Description: Reads and writes Xiangqi game records in PGN-like files whose moves are in WXF
+# notation ('C2.5', 'H8+7', '+R-1') or ICCS notation ('H2-E2', 'h2e2'). read_games is a generator:
+# it reads a file (or any stream of lines) one line at a time and yields one GameRecord per game,
+# so archives of any size are read in constant memory. Every move is replayed on a XiangqiGame as
+# it is read, which converts it to list coordinates and checks it with make_move; WXF moves are
+# matched against the WXF names of get_legal_moves's moves, which also tells apart two identical
+# pieces on one file. write_game writes a game back in either notation.
+#
+# WXF notation: a piece letter (K, A, E, H, R, C, P; B and N are accepted for E and H), the file it
+# stands on (1 to 9, counted from the right of the player who moves), a direction ('+' forward,
+# '-' backward, '.' or '=' sideways) and either the destination file or, for a General, Chariot,
+# Cannon or Soldier moving forward or backward, the number of ranks moved. When two identical
+# pieces share a file '+' (front) or '-' (rear) replaces the file number, as in '+R.4' or 'R+.4'.
+# Two Advisors or Elephants on one file can still be written with the file number ('A6+5'), since
+# only one of them can move in each direction.
+#
+# Tags are lines such as [FEN "..."] (the starting position), [Format "WXF"] or [Format "ICCS"]
+# and [Result "1-0"]. Move numbers, {comments}, ; comments and (variations) are skipped.
+
+import re
+
+from OpeningBook import RESULTS
+from XiangqiGame import XiangqiGame, START_FEN, coordinates_to_square
+
+# WXF letters of the piece types, and the letters accepted when reading
+PIECE_WXF = {'K': 'K', 'G': 'A', 'E': 'E', 'H': 'H', 'T': 'R', 'C': 'C', 'S': 'P'}
+WXF_ALIASES = {'B': 'E', 'N': 'H'}
+RESULT_TOKENS = {result: token for token, result in RESULTS.items()}
+ICCS_PATTERN = re.compile(r'^([a-i])([0-9])-?([a-i])([0-9])$', re.IGNORECASE)
+WXF_PATTERN = re.compile(r'^([+-]?[KAEHRCPBN]|[KAEHRCPBN][+-])([1-9]?)([+\-.=])([1-9])$',
+                         re.IGNORECASE)
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"(.*)"\]')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+$')
+
+
+class GameRecord:
+    """One game read by read_games: its tags, starting FEN, moves as (from_row, from_column,
+    to_row, to_column) list coordinates and result ('RED_WON', 'BLACK_WON', 'DRAW' or None), plus
+    the XiangqiGame the moves were replayed on, left in the final position."""
+
+    def __init__(self, tags, fen, moves, result, game):
+        self._tags = tags
+        self._fen = fen
+        self._moves = moves
+        self._result = result
+        self._game = game
+
+    def get_tags(self):
+        """Returns the tags as a dictionary."""
+        return self._tags
+
+    def get_fen(self):
+        """Returns the FEN of the starting position."""
+        return self._fen
+
+    def get_moves(self):
+        """Returns the moves as list coordinates."""
+        return self._moves
+
+    def get_result(self):
+        """Returns the result, or None if the game has none."""
+        return self._result
+
+    def get_game(self):
+        """Returns the XiangqiGame in the final position."""
+        return self._game
+
+
+def _file_number(column, color):
+    """Returns the WXF file number (1 to 9 from the player's right) of a board column."""
+    return column + 1 if color == 'r' else 9 - column
+
+
+def wxf_names(game, move):
+    """Takes a XiangqiGame and a move of the player to move in list coordinates and returns the
+    WXF names the move can be written as. The first is the one write_game uses."""
+    board = game.get_board()
+    from_row, from_column, to_row, to_column = move
+    piece = board[from_row][from_column]
+    color = piece[0]
+    letter = PIECE_WXF[piece[1]]
+    forward = 1 if color == 'r' else -1
+
+    if to_row == from_row:
+        direction = '.'
+        target = _file_number(to_column, color)
+    else:
+        direction = '+' if (to_row - from_row) * forward > 0 else '-'
+        if piece[1] in 'GEH':
+            target = _file_number(to_column, color)
+        else:
+            target = abs(to_row - from_row)
+
+    # identical pieces on the same file are told apart by which one is in front
+    rows = sorted((row for row in range(10) if board[row][from_column] == piece),
+                  key=lambda row: -row * forward)
+    name = '%s%d%s%d' % (letter, _file_number(from_column, color), direction, target)
+    if len(rows) > 1 and from_row in (rows[0], rows[-1]):
+        position = '+' if from_row == rows[0] else '-'
+        names = ['%s%s%s%d' % (position, letter, direction, target),
+                 '%s%s%s%d' % (letter, position, direction, target)]
+        if piece[1] in 'GE':
+            # the front one can only move back and the rear one forward, so the file number
+            # still names one piece
+            names.append(name)
+        return names
+    return [name]
+
+
+def _normalize_wxf(token):
+    """Returns a WXF move in the spelling wxf_names uses, or None if it is not a WXF move."""
+    match = WXF_PATTERN.match(token)
+    if not match:
+        return None
+    piece, file_number, direction, target = match.groups()
+    piece = piece.upper()
+    position = piece.strip('KAEHRCPBN')       # '+' or '-' for one of two pieces on a file
+    letter = piece.strip('+-')
+    letter = WXF_ALIASES.get(letter, letter)
+    direction = '.' if direction == '=' else direction
+    if position and not file_number:
+        return position + letter + direction + target
+    if file_number and not position:
+        return letter + file_number + direction + target
+    return None
+
+
+def parse_wxf(game, token):
+    """Takes a XiangqiGame and a WXF move for the player whose turn it is and returns the move as
+    list coordinates. Raises ValueError if no legal move, or more than one, has that name."""
+    name = _normalize_wxf(token)
+    if name is None:
+        raise ValueError('Invalid WXF move: ' + token)
+    matches = [move for move in game.get_legal_moves(game.get_turn())
+               if name in wxf_names(game, move)]
+    if len(matches) != 1:
+        raise ValueError('%s WXF move: %s' % ('Ambiguous' if matches else 'Illegal', token))
+    return matches[0]
+
+
+def format_wxf(game, move):
+    """Takes a XiangqiGame and a move of the player to move and returns its WXF name."""
+    return wxf_names(game, move)[0]
+
+
+def parse_iccs(token):
+    """Takes an ICCS move such as 'H2-E2' or 'h2e2' and returns it as list coordinates. Raises
+    ValueError if it is not an ICCS move."""
+    match = ICCS_PATTERN.match(token)
+    if not match:
+        raise ValueError('Invalid ICCS move: ' + token)
+    from_file, from_rank, to_file, to_rank = match.groups()
+    return (int(from_rank), 'ihgfedcba'.index(from_file.lower()),
+            int(to_rank), 'ihgfedcba'.index(to_file.lower()))
+
+
+def format_iccs(move):
+    """Takes a move in list coordinates and returns it in PGN's ICCS spelling, such as 'H2-E2'."""
+    return '%s%d-%s%d' % ('IHGFEDCBA'[move[1]], move[0], 'IHGFEDCBA'[move[3]], move[2])
+
+
+def _tokens(lines):
+    """Yields ('tag', name, value), ('move', token, None) and ('result', result, None) tokens
+    from lines, skipping move numbers, comments and variations."""
+    in_comment = False
+    variation_depth = 0
+    for line in lines:
+        line = line.strip()
+        if not in_comment and variation_depth == 0 and line.startswith('['):
+            tag = TAG_PATTERN.match(line)
+            if tag:
+                yield 'tag', tag.group(1), tag.group(2)
+            continue
+        for token in re.split(r'(\{|\}|\(|\)|;|\s+)', line):
+            if not token or token.isspace():
+                continue
+            if in_comment:
+                in_comment = token != '}'
+            elif token == '{':
+                in_comment = True
+            elif token == ';':
+                break
+            elif token == '(':
+                variation_depth += 1
+            elif token == ')':
+                variation_depth = max(0, variation_depth - 1)
+            elif variation_depth:
+                continue
+            elif token in RESULTS:
+                yield 'result', RESULTS[token], None
+            else:
+                # move numbers such as '1.' may be written together with the move, as in '1.C2.5'
+                token = re.sub(r'^\d+\.+', '', token)
+                if token and not MOVE_NUMBER_PATTERN.match(token):
+                    yield 'move', token, None
+
+
+class _GameReader:
+    """Collects the tags and moves of the game being read, replaying each move as it comes."""
+
+    def __init__(self, notation):
+        self._notation = notation
+        self._tags = {}
+        self._moves = []
+        self._game = None
+        self._result = None
+
+    def has_moves(self):
+        return bool(self._moves)
+
+    def has_content(self):
+        return bool(self._tags or self._moves)
+
+    def add_tag(self, name, value):
+        self._tags[name] = value
+        if name == 'Result':
+            self._result = RESULTS.get(value)
+
+    def set_result(self, result):
+        if result is not None:
+            self._result = result
+
+    def add_move(self, token):
+        """Converts a move token and plays it. Raises ValueError if it is rejected."""
+        if self._game is None:
+            self._game = XiangqiGame()
+            if self._tags.get('FEN', START_FEN) != START_FEN:
+                self._game.set_fen(self._tags['FEN'])
+        notation = self._notation or self._tags.get('Format', '').upper()
+        if notation == 'ICCS' or (notation != 'WXF' and ICCS_PATTERN.match(token)):
+            move = parse_iccs(token)
+        else:
+            move = parse_wxf(self._game, token)
+        if not self._game.make_move(coordinates_to_square(move[0], move[1]),
+                                    coordinates_to_square(move[2], move[3])):
+            raise ValueError('Illegal move: ' + token)
+        self._moves.append(move)
+
+    def get_record(self):
+        game = self._game
+        if game is None:
+            game = XiangqiGame()
+            if self._tags.get('FEN', START_FEN) != START_FEN:
+                game.set_fen(self._tags['FEN'])
+        return GameRecord(self._tags, self._tags.get('FEN', START_FEN), self._moves,
+                          self._result, game)
+
+
+def read_games(source, notation=None, skip_invalid=False):
+    """Takes a path or an iterable of lines (such as an open file) and yields a GameRecord for
+    every game, reading one line at a time. notation is 'WXF' or 'ICCS'; if None the Format tag
+    decides, and without one coordinate moves are read as ICCS and the rest as WXF. A move which
+    cannot be read or is rejected by make_move raises ValueError, or with skip_invalid drops the
+    rest of that game's moves text and skips the game."""
+    if isinstance(source, str):
+        with open(source) as lines:
+            yield from read_games(lines, notation, skip_invalid)
+        return
+
+    reader = _GameReader(notation)
+    invalid = False
+    for kind, value, tag_value in _tokens(source):
+        if kind == 'tag':
+            if reader.has_moves() or invalid:
+                if not invalid:
+                    yield reader.get_record()
+                reader = _GameReader(notation)
+                invalid = False
+            reader.add_tag(value, tag_value)
+        elif kind == 'result':
+            reader.set_result(value)
+            if not invalid and reader.has_content():
+                yield reader.get_record()
+            reader = _GameReader(notation)
+            invalid = False
+        elif not invalid:
+            try:
+                reader.add_move(value)
+            except ValueError:
+                if not skip_invalid:
+                    raise
+                invalid = True
+    if not invalid and reader.has_moves():
+        yield reader.get_record()
+
+
+def write_game(stream, moves, result=None, fen=None, tags=None, notation='WXF'):
+    """Writes one game to stream: tags (a dictionary), then FEN and Format tags, then the moves
+    (list coordinates, replayed from fen or the starting position) in WXF or ICCS notation with
+    move numbers, then the result. Raises ValueError if a move is rejected by make_move."""
+    tags = dict(tags) if tags else {}
+    tags['Format'] = notation
+    if result is not None or 'Result' not in tags:
+        tags['Result'] = RESULT_TOKENS.get(result, '*')
+    if fen is not None and fen != START_FEN:
+        tags['FEN'] = fen
+    for name, value in tags.items():
+        stream.write('[%s "%s"]\n' % (name, value))
+    stream.write('\n')
+
+    game = XiangqiGame()
+    if fen is not None and fen != START_FEN:
+        game.set_fen(fen)
+    line = ''
+    for ply, move in enumerate(moves):
+        if notation == 'ICCS':
+            text = format_iccs(move)
+        else:
+            text = format_wxf(game, move)
+        if not game.make_move(coordinates_to_square(move[0], move[1]),
+                              coordinates_to_square(move[2], move[3])):
+            raise ValueError('Illegal move: ' + text)
+        if ply % 2 == 0:
+            text = '%d. %s' % (ply // 2 + 1, text)
+        if len(line) + len(text) + 1 > 80:
+            stream.write(line + '\n')
+            line = ''
+        line = line + ' ' + text if line else text
+    if line:
+        line += ' '
+    stream.write(line + tags['Result'] + '\n\n')
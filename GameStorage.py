@@ -0,0 +1,366 @@
+# Description: Persistent storage for live games. GameStorage.make_move plays a move on a
+# XiangqiGame and, if make_move accepts it, appends the move to a log; every snapshot_interval plies
+# (and when a game is started) a PositionSnapshot of the game is logged as well, so restoring a game
+# only replays the moves made since its last snapshot. Records are buffered and written in batches
+# with one fsync (or SQLite commit) per batch: a batch is written once batch_size records are
+# waiting, flush_interval seconds after its first record, or when flush is called. A move is
+# durable once its batch has been written.
+#
+# Two logs are provided. FileMoveLog appends fixed size records with a CRC to one file per shard
+# (game id modulo the number of shards); a record torn by a crash is detected and cut off when the
+# files are opened, and compact rewrites the files keeping only each game's latest snapshot and
+# the moves after it. SqliteMoveLog keeps the latest snapshot of each game and the moves after it
+# in an SQLite database.
+#
+# File record: crc32 (of the rest), game id, ply, kind, then for a move the from and to square
+# indexes (row * 9 + column) and for a snapshot the 90 board bytes followed by the side to move,
+# the General squares, the check flags and the state code.
+#
+# Run with: python GameStorage.py to check that both logs restore a game whose id was reused.
+
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+from GameStore import STATES, STATE_CODES, TURNS
+from XiangqiGame import XiangqiGame, PositionSnapshot, coordinates_to_square, \
+    square_to_coordinates
+
+RECORD_HEADER = struct.Struct('<IIIB')      # crc32, game id, ply, kind
+MOVE_RECORD = struct.Struct('<BB')
+SNAPSHOT_TAIL = struct.Struct('<BBBBBB')
+KIND_MOVE = 0
+KIND_SNAPSHOT = 1
+PAYLOAD_SIZES = {KIND_MOVE: MOVE_RECORD.size, KIND_SNAPSHOT: 90 + SNAPSHOT_TAIL.size}
+
+
+def pack_snapshot(snapshot):
+    """Returns a PositionSnapshot as 96 bytes."""
+    return snapshot.board + SNAPSHOT_TAIL.pack(
+        TURNS.index(snapshot.turn), snapshot.red_king, snapshot.black_king,
+        snapshot.red_in_check, snapshot.black_in_check, STATE_CODES[snapshot.game_state])
+
+
+def unpack_snapshot(data):
+    """Returns the PositionSnapshot packed into data by pack_snapshot."""
+    turn, red_king, black_king, red_in_check, black_in_check, state = \
+        SNAPSHOT_TAIL.unpack_from(data, 90)
+    return PositionSnapshot(bytes(data[:90]), TURNS[turn], red_king, black_king,
+                            bool(red_in_check), bool(black_in_check), STATES[state])
+
+
+class FileMoveLog:
+    """Append-only log files in directory, one per shard."""
+
+    def __init__(self, directory, num_shards=1):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._num_shards = num_shards
+        self._files = []
+        for shard in range(num_shards):
+            path = self._shard_path(shard)
+            self._repair(path)
+            self._files.append(open(path, 'ab'))
+
+    def _shard_path(self, shard):
+        return os.path.join(self._directory, 'shard-%04d.log' % shard)
+
+    def _repair(self, path):
+        """Cuts off a torn or corrupt record at the end of a shard file left by a crash."""
+        if not os.path.exists(path):
+            return
+        good_size = 0
+        for record, offset in _read_records(path):
+            good_size = offset
+        if good_size != os.path.getsize(path):
+            with open(path, 'r+b') as shard_file:
+                shard_file.truncate(good_size)
+
+    def write_batch(self, records):
+        """Appends records - (game id, ply, move, packed snapshot) tuples with either a move
+        (from index, to index) or a snapshot - and fsyncs every shard written to."""
+        written = set()
+        for game_id, ply, move, snapshot in records:
+            if move is not None:
+                kind, payload = KIND_MOVE, MOVE_RECORD.pack(move[0], move[1])
+            else:
+                kind, payload = KIND_SNAPSHOT, snapshot
+            body = RECORD_HEADER.pack(0, game_id, ply, kind)[4:] + payload
+            shard = game_id % self._num_shards
+            self._files[shard].write(struct.pack('<I', zlib.crc32(body)) + body)
+            written.add(shard)
+        for shard in written:
+            self._files[shard].flush()
+            os.fsync(self._files[shard].fileno())
+
+    def load_all(self, game_id=None):
+        """Returns a dictionary mapping every game id (or just game_id) to (ply, packed snapshot,
+        moves since the snapshot)."""
+        shards = range(self._num_shards) if game_id is None else [game_id % self._num_shards]
+        games = {}
+        for shard in shards:
+            for (record_id, ply, kind, payload), offset in _read_records(self._shard_path(shard)):
+                if game_id is not None and record_id != game_id:
+                    continue
+                if kind == KIND_SNAPSHOT:
+                    games[record_id] = (ply, payload, [])
+                elif record_id in games:
+                    games[record_id][2].append(MOVE_RECORD.unpack(payload))
+        return games
+
+    def compact(self):
+        """Rewrites every shard keeping only each game's latest snapshot and the moves after it."""
+        games = self.load_all()
+        for shard in range(self._num_shards):
+            path = self._shard_path(shard)
+            self._files[shard].close()
+            with open(path + '.tmp', 'wb') as shard_file:
+                self._files[shard] = shard_file
+                records = []
+                for game_id, (ply, snapshot, moves) in games.items():
+                    if game_id % self._num_shards != shard:
+                        continue
+                    records.append((game_id, ply, None, snapshot))
+                    records += [(game_id, ply + num + 1, move, None)
+                                for num, move in enumerate(moves)]
+                self.write_batch(records)
+            os.replace(path + '.tmp', path)
+            self._files[shard] = open(path, 'ab')
+
+    def close(self):
+        for shard_file in self._files:
+            shard_file.close()
+        self._files = []
+
+
+def _read_records(path):
+    """Yields ((game id, ply, kind, payload), offset after the record) for every intact record of
+    a shard file, stopping at the first torn or corrupt one."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as shard_file:
+        data = shard_file.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        crc, game_id, ply, kind = RECORD_HEADER.unpack_from(data, offset)
+        if kind not in PAYLOAD_SIZES:
+            return
+        end = offset + RECORD_HEADER.size + PAYLOAD_SIZES[kind]
+        if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+            return
+        yield (game_id, ply, kind, data[offset + RECORD_HEADER.size:end]), end
+        offset = end
+
+
+class SqliteMoveLog:
+    """An SQLite database holding each game's latest snapshot and the moves made after it."""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=FULL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS snapshots '
+                                 '(game_id INTEGER PRIMARY KEY, ply INTEGER, data BLOB)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS moves (game_id INTEGER, '
+                                 'ply INTEGER, from_index INTEGER, to_index INTEGER, '
+                                 'PRIMARY KEY (game_id, ply))')
+        self._connection.commit()
+
+    def write_batch(self, records):
+        """Writes records, as for FileMoveLog.write_batch, in one transaction."""
+        with self._connection:
+            for game_id, ply, move, snapshot in records:
+                if move is not None:
+                    self._connection.execute('INSERT OR REPLACE INTO moves VALUES (?, ?, ?, ?)',
+                                             (game_id, ply, move[0], move[1]))
+                else:
+                    self._connection.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)',
+                                             (game_id, ply, snapshot))
+                    # a game's records arrive in order, so every move logged before the
+                    # snapshot is older than it - including the moves of an earlier game which
+                    # was logged under the same id and went on past this ply
+                    self._connection.execute('DELETE FROM moves WHERE game_id = ?', (game_id,))
+
+    def load_all(self, game_id=None):
+        """Returns a dictionary mapping every game id (or just game_id) to (ply, packed snapshot,
+        moves since the snapshot)."""
+        condition = '' if game_id is None else ' WHERE game_id = ?'
+        parameters = () if game_id is None else (game_id,)
+        games = {}
+        for record_id, ply, data in self._connection.execute(
+                'SELECT game_id, ply, data FROM snapshots' + condition, parameters):
+            games[record_id] = (ply, bytes(data), [])
+        for record_id, ply, from_index, to_index in self._connection.execute(
+                'SELECT game_id, ply, from_index, to_index FROM moves' + condition +
+                ' ORDER BY game_id, ply', parameters):
+            if record_id in games and ply > games[record_id][0]:
+                games[record_id][2].append((from_index, to_index))
+        return games
+
+    def compact(self):
+        """Nothing to do: old moves are deleted whenever a snapshot is written."""
+
+    def close(self):
+        self._connection.close()
+
+
+class GameStorage:
+    """Logs the moves of live games to a FileMoveLog or SqliteMoveLog and restores games from
+    it. Games are identified by integer ids (0 to 2**32 - 1). New and restored games are played
+    by rules, a GameRules object (standard rules if None)."""
+
+    def __init__(self, log, snapshot_interval=32, batch_size=256, flush_interval=0.05,
+                 rules=None):
+        self._log = log
+        self._rules = rules
+        self._snapshot_interval = snapshot_interval
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._plies = {}
+        self._pending = []
+        self._pending_since = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._flusher = None
+        if flush_interval:
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+
+    def new_game(self, game_id, game=None):
+        """Starts logging a game (a new XiangqiGame if None) under game_id, replacing any game
+        logged under it before. Returns the game."""
+        if game is None:
+            game = XiangqiGame(self._rules)
+        self._plies[game_id] = 0
+        self._append((game_id, 0, None, pack_snapshot(game.get_snapshot())))
+        return game
+
+    def make_move(self, game_id, game, from_square, to_square):
+        """Calls game.make_move and logs the move if it is accepted. Returns make_move's
+        result."""
+        if not game.make_move(from_square, to_square):
+            return False
+        from_row, from_column = square_to_coordinates(from_square)
+        to_row, to_column = square_to_coordinates(to_square)
+        ply = self._plies.get(game_id, 0) + 1
+        self._plies[game_id] = ply
+        self._append((game_id, ply, (from_row * 9 + from_column, to_row * 9 + to_column), None))
+        if ply % self._snapshot_interval == 0:
+            self._append((game_id, ply, None, pack_snapshot(game.get_snapshot())))
+        return True
+
+    def _append(self, record):
+        """Buffers a record, writing the buffer if it is full."""
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(record)
+            full = len(self._pending) >= self._batch_size
+        if full:
+            self.flush()
+
+    def _flush_periodically(self):
+        """Runs on the flusher thread: writes the buffer flush_interval after its first record."""
+        while not self._closing.wait(self._flush_interval / 2):
+            since = self._pending_since
+            if since is not None and time.monotonic() - since >= self._flush_interval:
+                self.flush()
+
+    def flush(self):
+        """Writes every buffered record to the log and waits until it is on disk."""
+        with self._write_lock:
+            with self._lock:
+                records = self._pending
+                self._pending = []
+                self._pending_since = None
+            if records:
+                self._log.write_batch(records)
+
+    def _restore(self, entry):
+        """Returns a XiangqiGame restored from a (ply, packed snapshot, moves) log entry."""
+        ply, snapshot, moves = entry
+        game = XiangqiGame(self._rules)
+        game.restore_snapshot(unpack_snapshot(snapshot))
+        for from_index, to_index in moves:
+            if not game.make_move(coordinates_to_square(from_index // 9, from_index % 9),
+                                  coordinates_to_square(to_index // 9, to_index % 9)):
+                raise ValueError('Logged move rejected while restoring a game')
+        return game
+
+    def restore_game(self, game_id):
+        """Returns the logged game with game_id, replayed from its last snapshot, or None. Later
+        moves are logged after the restored ones."""
+        self.flush()
+        with self._write_lock:
+            entry = self._log.load_all(game_id).get(game_id)
+        if entry is None:
+            return None
+        self._plies[game_id] = entry[0] + len(entry[2])
+        return self._restore(entry)
+
+    def restore_all(self):
+        """Returns a dictionary mapping the id of every logged game to the restored game."""
+        self.flush()
+        with self._write_lock:
+            entries = self._log.load_all()
+        games = {}
+        for game_id, entry in entries.items():
+            self._plies[game_id] = entry[0] + len(entry[2])
+            games[game_id] = self._restore(entry)
+        return games
+
+    def compact(self):
+        """Writes the buffer and compacts the log."""
+        with self._write_lock:
+            with self._lock:
+                records = self._pending
+                self._pending = []
+                self._pending_since = None
+            if records:
+                self._log.write_batch(records)
+            self._log.compact()
+
+    def close(self):
+        """Writes the buffer and closes the log."""
+        self._closing.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self._log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def check_id_reuse(log):
+    """Starts a game under id 1 in log, plays two moves, starts a new game under the same id,
+    plays one move and restores it. Returns True if the restored game is the new one."""
+    storage = GameStorage(log, flush_interval=0)
+    try:
+        game = storage.new_game(1)
+        storage.make_move(1, game, 'h3', 'e3')
+        storage.make_move(1, game, 'h8', 'e8')
+        game = storage.new_game(1)
+        storage.make_move(1, game, 'b3', 'e3')
+        restored = storage.restore_game(1)
+    finally:
+        storage.close()
+    return restored.get_snapshot() == game.get_snapshot()
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        results = {'file': check_id_reuse(FileMoveLog(os.path.join(directory, 'file'))),
+                   'sqlite': check_id_reuse(SqliteMoveLog(os.path.join(directory, 'games.db')))}
+    for name, passed in results.items():
+        print(name, 'log restores a reused game id:', 'ok' if passed else 'FAILED')
+    sys.exit(0 if all(results.values()) else 1)
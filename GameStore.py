@@ -0,0 +1,204 @@
+# Description: Keeps many live games in a few contiguous arrays instead of one XiangqiGame (with
+# its 14 piece objects and list of lists of strings) per game. A GameStore holds, for every game,
+# 90 board bytes (SNAPSHOT_PIECES codes), the side to move, the two General squares, the check
+# flags, a state code and the 64 bit position key: about 105 bytes a game. GameHandle objects give
+# each game the make_move, get_game_state and is_in_check methods of XiangqiGame.
+#
+# A move is played by loading the game into one shared XiangqiGame with restore_snapshot, calling
+# its make_move and writing the result back, so stored games follow exactly the same rules.
+# get_numpy_arrays returns NumPy views of the arrays for vectorised bulk queries such as "every
+# game where red is to move", and get_games_to_move answers that one without NumPy.
+
+import threading
+from array import array
+
+from XiangqiGame import XiangqiGame, PositionSnapshot
+
+STATES = ('UNFINISHED', 'RED_WON', 'BLACK_WON', 'DRAW')
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+FREE = 255          # state code of a slot whose game has been removed
+TURNS = ('red', 'black')
+
+
+class GameStore:
+    """Holds any number of games in arrays which grow as games are added. Slots of removed games
+    are reused. One lock serialises moves, so handles can be used from several threads. Every
+    game is played by rules, a GameRules object (standard rules if None)."""
+
+    def __init__(self, capacity=16, rules=None):
+        self._capacity = 0
+        self._size = 0
+        self._free = []
+        self._boards = bytearray()
+        self._turns = bytearray()
+        self._kings = bytearray()           # red General square, black General square
+        self._checks = bytearray()          # red in check, black in check
+        self._states = bytearray()
+        self._keys = array('Q')
+        self._worker = XiangqiGame(rules)
+        self._start_fen = self._worker.get_fen()
+        self._lock = threading.Lock()
+        self._grow(max(capacity, 1))
+
+    def _grow(self, capacity):
+        """Reallocates the arrays to hold capacity games. Earlier views of the arrays keep
+        pointing at the old copies."""
+        def resized(old, width):
+            new = bytearray(capacity * width)
+            new[:len(old)] = old
+            return new
+
+        self._boards = resized(self._boards, 90)
+        self._turns = resized(self._turns, 1)
+        self._kings = resized(self._kings, 2)
+        self._checks = resized(self._checks, 2)
+        states = bytearray([FREE]) * capacity
+        states[:len(self._states)] = self._states
+        self._states = states
+        keys = array('Q', bytes(8 * capacity))
+        keys[:len(self._keys)] = self._keys
+        self._keys = keys
+        self._capacity = capacity
+
+    def __len__(self):
+        return self._size - len(self._free)
+
+    def get_capacity(self):
+        """Returns the number of games the arrays can hold before they grow."""
+        return self._capacity
+
+    def add_game(self, fen=None):
+        """Adds a game in the starting position (the rules' FEN if they have one), or the FEN
+        position, and returns its handle."""
+        with self._lock:
+            if self._free:
+                index = self._free.pop()
+            else:
+                if self._size == self._capacity:
+                    self._grow(self._capacity * 2)
+                index = self._size
+                self._size += 1
+            game = self._worker
+            game.set_fen(self._start_fen if fen is None else fen)
+            self._write(index, game.get_snapshot())
+            self._keys[index] = game.get_position_key()
+        return GameHandle(self, index)
+
+    def remove_game(self, index):
+        """Removes a game. Its slot, and handle index, may be reused by a later add_game."""
+        with self._lock:
+            if self._states[index] != FREE:
+                self._states[index] = FREE
+                self._free.append(index)
+
+    def get_handle(self, index):
+        """Returns a handle for the game at index. Raises ValueError if there is none."""
+        if index < 0 or index >= self._size or self._states[index] == FREE:
+            raise ValueError('No game at index ' + str(index))
+        return GameHandle(self, index)
+
+    def get_indexes(self):
+        """Returns the indexes of every stored game."""
+        return [index for index in range(self._size) if self._states[index] != FREE]
+
+    def get_games_to_move(self, red_or_black):
+        """Returns the indexes of the unfinished games where red_or_black is to move."""
+        turn = TURNS.index(red_or_black)
+        turns = self._turns
+        states = self._states
+        return [index for index in range(self._size)
+                if turns[index] == turn and states[index] == 0]
+
+    def get_numpy_arrays(self):
+        """Returns NumPy views of the stored games' arrays: 'boards' (int8, games x 90), 'turns'
+        (0 red, 1 black), 'kings' (games x 2), 'checks' (games x 2), 'states' (STATES codes, FREE
+        for empty slots) and 'keys' (uint64). The views share memory with the store until it
+        grows. Requires NumPy."""
+        import numpy
+        size = self._size
+        return {
+            'boards': numpy.frombuffer(self._boards, numpy.int8, size * 90).reshape(size, 90),
+            'turns': numpy.frombuffer(self._turns, numpy.uint8, size),
+            'kings': numpy.frombuffer(self._kings, numpy.uint8, size * 2).reshape(size, 2),
+            'checks': numpy.frombuffer(self._checks, numpy.uint8, size * 2).reshape(size, 2),
+            'states': numpy.frombuffer(self._states, numpy.uint8, size),
+            'keys': numpy.frombuffer(self._keys, numpy.uint64, size)
+        }
+
+    def get_snapshot(self, index):
+        """Returns the PositionSnapshot of the game at index."""
+        kings = self._kings
+        checks = self._checks
+        return PositionSnapshot(bytes(self._boards[index * 90:index * 90 + 90]),
+                                TURNS[self._turns[index]], kings[2 * index], kings[2 * index + 1],
+                                bool(checks[2 * index]), bool(checks[2 * index + 1]),
+                                STATES[self._states[index]])
+
+    def _write(self, index, snapshot):
+        """Stores a PositionSnapshot in the slot at index."""
+        self._boards[index * 90:index * 90 + 90] = snapshot.board
+        self._turns[index] = TURNS.index(snapshot.turn)
+        self._kings[2 * index] = snapshot.red_king
+        self._kings[2 * index + 1] = snapshot.black_king
+        self._checks[2 * index] = snapshot.red_in_check
+        self._checks[2 * index + 1] = snapshot.black_in_check
+        self._states[index] = STATE_CODES[snapshot.game_state]
+
+    def make_move(self, index, from_square, to_square):
+        """Plays a move in the game at index, like XiangqiGame.make_move. Returns False if the
+        move is rejected."""
+        with self._lock:
+            if self._states[index] != 0:
+                return False
+            game = self._worker
+            game.restore_snapshot(self.get_snapshot(index), self._keys[index])
+            if not game.make_move(from_square, to_square):
+                return False
+            self._keys[index] = game.get_position_key()
+            self._write(index, game.get_snapshot())
+            return True
+
+    def get_game(self, index):
+        """Returns a new XiangqiGame in the position of the game at index."""
+        game = self._worker.clone()
+        game.restore_snapshot(self.get_snapshot(index), self._keys[index])
+        return game
+
+
+class GameHandle:
+    """A reference to one game in a GameStore, with the XiangqiGame methods a server needs. Handles
+    are small and can be created and thrown away freely."""
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def get_index(self):
+        """Returns the game's index in the store."""
+        return self._index
+
+    def make_move(self, from_square, to_square):
+        """Like XiangqiGame.make_move."""
+        return self._store.make_move(self._index, from_square, to_square)
+
+    def get_game_state(self):
+        """Returns 'UNFINISHED', 'RED_WON', 'BLACK_WON' or 'DRAW'."""
+        return STATES[self._store._states[self._index]]
+
+    def get_turn(self):
+        """Returns 'red' or 'black'."""
+        return TURNS[self._store._turns[self._index]]
+
+    def is_in_check(self, red_or_black):
+        """Takes 'red' or 'black' and returns True if that player is in check."""
+        return bool(self._store._checks[2 * self._index + TURNS.index(red_or_black)])
+
+    def get_position_key(self):
+        """Returns the position key, equal to XiangqiGame.get_position_key's."""
+        return self._store._keys[self._index]
+
+    def get_game(self):
+        """Returns a new XiangqiGame in the game's position."""
+        return self._store.get_game(self._index)
@@ -0,0 +1,207 @@
+# Description: Instrumentation for XiangqiGame.make_move. A MoveProfiler counts the calls and the
+# cumulative time of each phase of make_move (parsing the squares, validating the move with the
+# piece's move method, the self_in_check probe, opponent_in_check, the checkmate scan and the
+# stalemate scan, plus make_move as a whole) and counts the calls of each piece type's move method.
+#
+# Profiling is turned on for one game with attach(game), or for every game with enable_profiling().
+# Both work by wrapping the phase methods and the pieces' move methods, and detaching puts the
+# originals back, so a game which is not being profiled runs exactly the code it always did.
+#
+# Phases nest: the checkmate and stalemate scans call self_in_check for every candidate move, so the
+# self_in_check counts include those probes and their time is part of the scans' time as well.
+# Calls made outside make_move, such as get_legal_moves's self_in_check probes, are counted too.
+# Counters are read with get_counters() or exported in the Prometheus text format with
+# to_prometheus().
+#
+# Piece moves are counted by piece type, named after the standard class of the type, so the
+# replacement piece classes of a game's GameRules are counted under the piece they replace.
+# enable_profiling wraps the replacement classes of the rules it is given as well.
+
+import time
+
+from XiangqiGame import XiangqiGame, STANDARD_PIECES
+
+# maps each phase to the XiangqiGame method which runs it
+PHASE_METHODS = {
+    'make_move': 'make_move',
+    'parsing': '_parse_move',
+    'validation': '_validate_move',
+    'self_in_check': 'self_in_check',
+    'opponent_in_check': 'opponent_in_check',
+    'mate_scan': '_checkmate_scan',
+    'stalemate_scan': '_stalemate_scan'
+}
+# the name each piece type's move calls are counted under, by piece letter
+PIECE_NAMES = {letter: piece_class.__name__ for letter, piece_class in STANDARD_PIECES.items()}
+
+_global_profiler = None
+_global_originals = {}
+
+
+class _CountingPiece:
+    """Stands in for a piece object in a profiled game's piece dictionary and counts the calls of
+    its move method."""
+
+    def __init__(self, piece, piece_moves, name):
+        self._piece = piece
+        self._piece_moves = piece_moves
+        self._name = name
+
+    def get_color(self):
+        return self._piece.get_color()
+
+    def get_piece(self):
+        return self._piece.get_piece()
+
+    def move(self, from_row, from_column, to_row, to_column, board):
+        self._piece_moves[self._name] += 1
+        return self._piece.move(from_row, from_column, to_row, to_column, board)
+
+
+class MoveProfiler:
+    """Holds the phase and piece move counters of the games it is attached to."""
+
+    def __init__(self):
+        self._calls = dict.fromkeys(PHASE_METHODS, 0)
+        self._nanoseconds = dict.fromkeys(PHASE_METHODS, 0)
+        self._piece_moves = dict.fromkeys(PIECE_NAMES.values(), 0)
+        self._games = {}        # id of each attached game -> (game, its original piece dictionary)
+
+    def _timed(self, phase, method):
+        """Returns a function which calls method and adds the call and its time to phase."""
+        calls = self._calls
+        nanoseconds = self._nanoseconds
+        clock = time.perf_counter_ns
+
+        def timed(*args):
+            start = clock()
+            try:
+                return method(*args)
+            finally:
+                nanoseconds[phase] += clock() - start
+                calls[phase] += 1
+
+        return timed
+
+    def _counted(self, name, owner, move):
+        """Returns a replacement for the move method of the piece class owner which counts its
+        calls under name. A call is only counted for pieces whose own class's move method is
+        this one, so a subclass's move which calls its base class's is counted once."""
+        piece_moves = self._piece_moves
+        owners = {}         # piece class -> the class whose move method its pieces use
+
+        def counted(piece, from_row, from_column, to_row, to_column, board):
+            piece_class = type(piece)
+            if piece_class not in owners:
+                owners[piece_class] = next(base for base in piece_class.__mro__
+                                           if 'move' in base.__dict__)
+            if owners[piece_class] is owner:
+                piece_moves[name] += 1
+            return move(piece, from_row, from_column, to_row, to_column, board)
+
+        return counted
+
+    def attach(self, game):
+        """Starts profiling a XiangqiGame. Attaching a game which is already attached does
+        nothing."""
+        if id(game) in self._games:
+            return
+        self._games[id(game)] = (game, game._obj_dictionary)
+        for phase, name in PHASE_METHODS.items():
+            setattr(game, name, self._timed(phase, getattr(game, name)))
+        game._obj_dictionary = {code: _CountingPiece(piece, self._piece_moves,
+                                                     PIECE_NAMES[code[1]])
+                                for code, piece in game._obj_dictionary.items()}
+
+    def detach(self, game):
+        """Stops profiling a XiangqiGame, leaving the counters as they are."""
+        if id(game) not in self._games:
+            return
+        game, obj_dictionary = self._games.pop(id(game))
+        for name in PHASE_METHODS.values():
+            delattr(game, name)
+        game._obj_dictionary = obj_dictionary
+
+    def detach_all(self):
+        """Stops profiling every game attached with attach."""
+        for game, obj_dictionary in list(self._games.values()):
+            self.detach(game)
+
+    def reset(self):
+        """Sets every counter back to zero."""
+        for phase in self._calls:
+            self._calls[phase] = 0
+            self._nanoseconds[phase] = 0
+        for name in self._piece_moves:
+            self._piece_moves[name] = 0
+
+    def get_counters(self):
+        """Returns the counters as a dictionary: 'phases' maps each phase to its 'calls' and
+        cumulative 'seconds', and 'piece_moves' maps each standard piece class name to the number
+        of calls of the move method of that piece type."""
+        return {
+            'phases': {phase: {'calls': self._calls[phase],
+                               'seconds': self._nanoseconds[phase] / 1e9}
+                       for phase in self._calls},
+            'piece_moves': dict(self._piece_moves)
+        }
+
+    def to_prometheus(self, prefix='xiangqi'):
+        """Returns the counters in the Prometheus text exposition format, with metric names
+        starting with prefix."""
+        lines = ['# HELP %s_make_move_phase_calls_total Calls of each make_move phase.' % prefix,
+                 '# TYPE %s_make_move_phase_calls_total counter' % prefix]
+        for phase, calls in self._calls.items():
+            lines.append('%s_make_move_phase_calls_total{phase="%s"} %d' % (prefix, phase, calls))
+        lines += ['# HELP %s_make_move_phase_seconds_total Time spent in each make_move phase.'
+                  % prefix,
+                  '# TYPE %s_make_move_phase_seconds_total counter' % prefix]
+        for phase, nanoseconds in self._nanoseconds.items():
+            lines.append('%s_make_move_phase_seconds_total{phase="%s"} %.9f' % (
+                prefix, phase, nanoseconds / 1e9))
+        lines += ['# HELP %s_piece_move_calls_total Calls of each piece type\'s move method.'
+                  % prefix,
+                  '# TYPE %s_piece_move_calls_total counter' % prefix]
+        for name, calls in self._piece_moves.items():
+            lines.append('%s_piece_move_calls_total{piece="%s"} %d' % (prefix, name, calls))
+        return '\n'.join(lines) + '\n'
+
+
+def enable_profiling(profiler=None, rules=None):
+    """Profiles every XiangqiGame, existing and new, with profiler (a new MoveProfiler if None)
+    until disable_profiling is called, replacing any profiler enabled before. The move methods of
+    the replacement piece classes of rules (a GameRules object, or None) are counted too. Returns
+    the profiler."""
+    global _global_profiler
+    disable_profiling()
+    if profiler is None:
+        profiler = MoveProfiler()
+    for phase, name in PHASE_METHODS.items():
+        _global_originals[(XiangqiGame, name)] = XiangqiGame.__dict__[name]
+        setattr(XiangqiGame, name, profiler._timed(phase, XiangqiGame.__dict__[name]))
+    piece_classes = list(STANDARD_PIECES.items())
+    if rules is not None and rules.piece_classes:
+        piece_classes += list(rules.piece_classes.items())
+    for letter, piece in piece_classes:
+        # classes which inherit move are counted by the class they inherit it from
+        if 'move' not in piece.__dict__ or (piece, 'move') in _global_originals:
+            continue
+        _global_originals[(piece, 'move')] = piece.__dict__['move']
+        setattr(piece, 'move', profiler._counted(PIECE_NAMES[letter], piece,
+                                                 piece.__dict__['move']))
+    _global_profiler = profiler
+    return profiler
+
+
+def disable_profiling():
+    """Stops profiling every game, restoring the original methods."""
+    global _global_profiler
+    for (owner, name), method in _global_originals.items():
+        setattr(owner, name, method)
+    _global_originals.clear()
+    _global_profiler = None
+
+
+def get_global_profiler():
+    """Returns the profiler enabled with enable_profiling, or None."""
+    return _global_profiler
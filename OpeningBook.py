@@ -0,0 +1,204 @@
+# Description: An opening book for XiangqiGame. Book entries are keyed by XiangqiGame's position key
+# and hold weighted moves in make_move notation. The book is stored as a sorted binary file which is
+# memory-mapped, so probing a position is a binary search over the file without loading it.
+# OpeningBookBuilder builds the file from game archives.
+#
+# File layout: an 8 byte header (b'XQBK', then the number of entries as a little endian uint32)
+# followed by 12 byte entries sorted by key: key (uint64), from square index (uint8), to square
+# index (uint8) and weight (uint16). A square's index is row * 9 + column.
+
+import mmap
+import random
+import re
+import struct
+
+from XiangqiGame import XiangqiGame, coordinates_to_square, square_to_coordinates
+
+BOOK_MAGIC = b'XQBK'
+HEADER = struct.Struct('<4sI')
+ENTRY = struct.Struct('<QBBH')
+MAX_WEIGHT = 65535
+
+
+def square_index(square):
+    """Takes a square string such as 'e3' and returns its square index, row * 9 + column."""
+    row, column = square_to_coordinates(square)
+    return row * 9 + column
+
+
+def index_square(index):
+    """Takes a square index and returns the square string in make_move notation."""
+    return coordinates_to_square(index // 9, index % 9)
+
+
+class OpeningBook:
+    """A read-only opening book backed by a memory-mapped book file. probe returns the weighted
+    moves stored for a position key and choose_move picks one of them for a XiangqiGame."""
+
+    def __init__(self, path):
+        self._path = path
+        self._file = open(path, 'rb')
+        header = self._file.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError('Not an opening book file: ' + path)
+        magic, self._num_entries = HEADER.unpack(header)
+        if magic != BOOK_MAGIC:
+            raise ValueError('Not an opening book file: ' + path)
+        if self._num_entries > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+        self._random = random.Random()
+
+    def get_num_entries(self):
+        """Returns the number of (position, move) entries in the book."""
+        return self._num_entries
+
+    def _key_at(self, num):
+        """Returns the key of entry number num."""
+        return struct.unpack_from('<Q', self._data, HEADER.size + num * ENTRY.size)[0]
+
+    def probe(self, key):
+        """Takes a position key and returns a list of (from_square, to_square, weight) for every
+        book move stored for it, or an empty list if the position is not in the book."""
+
+        # binary search for the first entry with this key
+        low = 0
+        high = self._num_entries
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        moves = []
+        num = low
+        while num < self._num_entries:
+            entry_key, from_index, to_index, weight = ENTRY.unpack_from(
+                self._data, HEADER.size + num * ENTRY.size)
+            if entry_key != key:
+                break
+            moves.append((index_square(from_index), index_square(to_index), weight))
+            num += 1
+        return moves
+
+    def choose_move(self, game):
+        """Takes a XiangqiGame and returns a (from_square, to_square) book move for its position,
+        chosen at random in proportion to the move weights, or None if the position is not in the
+        book. Moves that do not start from a piece of the player to move are ignored."""
+        board = game.get_board()
+        candidates = []
+        for from_square, to_square, weight in self.probe(game.get_position_key()):
+            row, column = square_to_coordinates(from_square)
+            if board[row][column][0] == game.get_turn()[0] and weight > 0:
+                candidates.append((from_square, to_square, weight))
+        if not candidates:
+            return None
+        pick = self._random.randrange(sum(weight for _, _, weight in candidates))
+        for from_square, to_square, weight in candidates:
+            if pick < weight:
+                return from_square, to_square
+            pick -= weight
+
+    def close(self):
+        """Closes the book file."""
+        if self._num_entries > 0:
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class OpeningBookBuilder:
+    """Collects book moves from replayed games and writes them as a book file. Every time a move is
+    played from a position within the first max_ply plies its weight goes up by one, or by
+    win_weight if the player who made it went on to win the game."""
+
+    def __init__(self, max_ply=20, win_weight=2):
+        self._max_ply = max_ply
+        self._win_weight = win_weight
+        self._weights = {}          # (key, from index, to index) -> weight
+
+    def add_game(self, moves, result=None):
+        """Takes a list of (from_square, to_square) moves and optionally the game result ('RED_WON',
+        'BLACK_WON' or anything else for a draw or unknown result) and adds its opening moves.
+        Stops at the first move make_move rejects. Returns the number of moves added."""
+        game = XiangqiGame()
+        added = 0
+        for from_square, to_square in moves[:self._max_ply]:
+            key = game.get_position_key()
+            mover = game.get_turn()
+            if not game.make_move(from_square, to_square):
+                break
+            if (result == 'RED_WON' and mover == 'red') or \
+                    (result == 'BLACK_WON' and mover == 'black'):
+                weight = self._win_weight
+            else:
+                weight = 1
+            entry = (key, square_index(from_square), square_index(to_square))
+            self._weights[entry] = self._weights.get(entry, 0) + weight
+            added += 1
+        return added
+
+    def add_archive(self, path):
+        """Takes the path of a PGN-like game archive and adds every game in it. Returns the number
+        of games added. See read_archive for the accepted format."""
+        num_games = 0
+        for moves, result in read_archive(path):
+            self.add_game(moves, result)
+            num_games += 1
+        return num_games
+
+    def write(self, path):
+        """Writes the collected entries to a book file at path, sorted by key."""
+        with open(path, 'wb') as book_file:
+            book_file.write(HEADER.pack(BOOK_MAGIC, len(self._weights)))
+            for entry in sorted(self._weights):
+                key, from_index, to_index = entry
+                book_file.write(ENTRY.pack(key, from_index, to_index,
+                                           min(self._weights[entry], MAX_WEIGHT)))
+
+
+# a move in make_move notation, optionally separated by '-', such as 'h3-e3', 'h3e3' or 'i10-i9'
+MOVE_PATTERN = re.compile(r'^([a-i](?:10|[1-9]))-?([a-i](?:10|[1-9]))$')
+RESULTS = {'1-0': 'RED_WON', '0-1': 'BLACK_WON', '1/2-1/2': 'DRAW', '*': None}
+
+
+def read_archive(path):
+    """Takes the path of a PGN-like game archive and yields a (moves, result) pair for every game,
+    one game at a time. Games are made of optional tag lines such as [Result "1-0"] followed by
+    move text in make_move notation ('h3-e3' or 'h3e3'). Move numbers are skipped and a result
+    token (1-0, 0-1, 1/2-1/2 or *) or the next tag section ends the game."""
+    moves = []
+    result = None
+    with open(path) as archive:
+        for line in archive:
+            line = line.strip()
+            if line.startswith('['):
+                if moves:
+                    yield moves, result
+                    moves = []
+                    result = None
+                tag = re.match(r'\[(\w+)\s+"(.*)"\]', line)
+                if tag and tag.group(1) == 'Result':
+                    result = RESULTS.get(tag.group(2))
+                continue
+            for token in line.split():
+                if token in RESULTS:
+                    if RESULTS[token] is not None:
+                        result = RESULTS[token]
+                    if moves:
+                        yield moves, result
+                    moves = []
+                    result = None
+                    continue
+                match = MOVE_PATTERN.match(token)
+                if match:
+                    moves.append((match.group(1), match.group(2)))
+    if moves:
+        yield moves, result
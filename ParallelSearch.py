@@ -0,0 +1,227 @@
+# Description: Lazy SMP search for XiangqiGame across processes. ParallelSearcher searches the same
+# position in the calling process and in helper processes at once. Every searcher reads and writes
+# one transposition table kept in shared memory (multiprocessing.shared_memory), so the helpers fill
+# the table with results the others reuse. Helpers search the root moves in different orders to
+# spread the work. When the main search runs out of time, or is stopped, the helpers are stopped
+# too and the result from the deepest completed search is played. Helpers search by the game's
+# GameRules, which are sent to them with the position, so its adjudicators and piece classes must
+# be defined at module level to be pickled. measure_scaling reports how the search speeds up with
+# more processes.
+
+import multiprocessing
+import random
+import struct
+import time
+from multiprocessing import shared_memory
+
+from XiangqiGame import XiangqiGame
+from XiangqiEngine import Searcher, INFINITY
+
+ENTRY = struct.Struct('<QQ')        # key XOR data, data
+NO_MOVE = 127
+
+
+class SharedTranspositionTable:
+    """A fixed size transposition table in a shared memory block which any number of processes
+    can read and write without locks. Each 16 byte slot holds the position key XORed with the
+    packed entry and the packed entry itself; an entry half overwritten by another process no
+    longer matches its key and is ignored. The creating process passes name to the others."""
+
+    def __init__(self, num_entries=1 << 20, name=None):
+        self._num_entries = num_entries
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=num_entries * ENTRY.size)
+            self._owner = True
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        self._buffer = self._memory.buf
+
+    def get_name(self):
+        """Returns the name other processes attach to the table with."""
+        return self._memory.name
+
+    def get_num_entries(self):
+        """Returns the number of slots in the table."""
+        return self._num_entries
+
+    def get(self, key):
+        """Returns the (depth, score, flag, best move) stored for a position key, or None."""
+        checked_key, data = ENTRY.unpack_from(self._buffer, (key % self._num_entries) * ENTRY.size)
+        if data == 0 or checked_key ^ data != key:
+            return None
+        depth = data & 0xFF
+        flag = (data >> 8) & 0x3
+        score = ((data >> 10) & 0xFFFF) - 32768
+        from_index = (data >> 26) & 0x7F
+        to_index = (data >> 33) & 0x7F
+        move = None
+        if from_index != NO_MOVE:
+            move = (from_index // 9, from_index % 9, to_index // 9, to_index % 9)
+        return depth, score, flag, move
+
+    def store(self, key, depth, score, flag, move):
+        """Stores a search result for a position key, replacing whatever was in its slot."""
+        if move is None:
+            from_index = to_index = NO_MOVE
+        else:
+            from_index = move[0] * 9 + move[1]
+            to_index = move[2] * 9 + move[3]
+        data = min(depth, 255) | flag << 8 | (score + 32768) << 10 | from_index << 26 | \
+            to_index << 33 | 1 << 40
+        ENTRY.pack_into(self._buffer, (key % self._num_entries) * ENTRY.size, key ^ data, data)
+
+    def clear(self):
+        """Removes every entry."""
+        self._buffer[:] = bytes(len(self._buffer))
+
+    def close(self):
+        """Detaches from the shared memory, and frees it if this process created it."""
+        self._buffer = None
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+def _helper_main(table_name, num_entries, tasks, results, stop_event, helper_num):
+    """Runs in a helper process: searches every task from the tasks queue until it gets None."""
+    table = SharedTranspositionTable(num_entries, table_name)
+    searcher = Searcher(tt=table, stop_event=stop_event)
+    shuffler = random.Random(helper_num)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, fen, rules, max_depth, node_limit = task
+            game = XiangqiGame(rules)
+            game.set_fen(fen)
+            root_moves = game.get_legal_moves(game.get_turn())
+            shuffler.shuffle(root_moves)
+            best_move, score, depth = searcher.search(game, max_depth, node_limit=node_limit,
+                                                      root_moves=root_moves, use_book=False)
+            results.put((task_id, best_move, score, depth, searcher.get_nodes()))
+    finally:
+        table.close()
+
+
+class ParallelSearcher:
+    """Searches with the calling process plus processes - 1 helper processes sharing one
+    transposition table. The helpers are started once and reused for every search."""
+
+    def __init__(self, processes=None, tt_entries=1 << 20):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self._table = SharedTranspositionTable(tt_entries)
+        self._stop_event = multiprocessing.Event()
+        self._tasks = []
+        self._results = multiprocessing.Queue()
+        self._helpers = []
+        for helper_num in range(1, processes):
+            tasks = multiprocessing.Queue()
+            helper = multiprocessing.Process(
+                target=_helper_main, daemon=True,
+                args=(self._table.get_name(), tt_entries, tasks, self._results,
+                      self._stop_event, helper_num))
+            helper.start()
+            self._tasks.append(tasks)
+            self._helpers.append(helper)
+        self._searcher = Searcher(tt=self._table, stop_event=self._stop_event)
+        self._task_id = 0
+        self._nodes = 0
+
+    def get_processes(self):
+        """Returns the number of searching processes, including the calling one."""
+        return len(self._helpers) + 1
+
+    def get_nodes(self):
+        """Returns the nodes searched by all processes in the last search."""
+        return self._nodes
+
+    def stop(self):
+        """Stops a running search. Safe to call from another thread."""
+        self._stop_event.set()
+
+    def clear(self):
+        """Empties the shared transposition table and the main searcher's move ordering tables."""
+        self._searcher.clear()
+
+    def search(self, game, max_depth=64, time_limit=None, node_limit=None, info_callback=None,
+               time_manager=None):
+        """Takes a XiangqiGame and searches it in every process until the calling process's
+        search ends by depth, time_limit, node_limit (per process) or time_manager, or stop is
+        called. Returns (best_move, score, depth) like Searcher.search, taken from whichever
+        process completed the greatest depth (the calling process wins ties)."""
+        self._task_id += 1
+        self._stop_event.clear()
+        book_move = game.get_book_move()
+        if book_move is None:
+            fen = game.get_fen()
+            for tasks in self._tasks:
+                tasks.put((self._task_id, fen, game.get_rules(), max_depth, node_limit))
+
+        result = self._searcher.search(game, max_depth, time_limit, node_limit,
+                                       info_callback=info_callback, time_manager=time_manager)
+        self._nodes = self._searcher.get_nodes()
+        if book_move is not None:
+            return result
+
+        # stops the helpers and collects their results
+        self._stop_event.set()
+        best_move, best_score, best_depth = result
+        waiting = len(self._tasks)
+        while waiting:
+            task_id, move, score, depth, nodes = self._results.get()
+            if task_id != self._task_id:
+                continue        # a result left over from an earlier search
+            waiting -= 1
+            self._nodes += nodes
+            if move is not None and depth > best_depth and score > -INFINITY:
+                best_move, best_score, best_depth = move, score, depth
+        return best_move, best_score, best_depth
+
+    def close(self):
+        """Shuts down the helper processes and frees the shared transposition table."""
+        self._stop_event.set()
+        for tasks in self._tasks:
+            tasks.put(None)
+        for helper in self._helpers:
+            helper.join()
+        self._helpers = []
+        self._tasks = []
+        self._table.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def measure_scaling(fens, process_counts, time_limit=1.0, max_depth=64, rules=None):
+    """Searches every FEN position, played by rules (a GameRules object, standard rules if None),
+    for time_limit seconds with each number of processes in process_counts and returns a list of
+    dictionaries, one per process count, with the total nodes, nodes per second, average
+    completed depth and the speedup in nodes per second over the first process count."""
+    report = []
+    for processes in process_counts:
+        nodes = 0
+        depth_total = 0
+        elapsed = 0.0
+        with ParallelSearcher(processes) as searcher:
+            for fen in fens:
+                game = XiangqiGame(rules)
+                game.set_fen(fen)
+                searcher.clear()
+                start = time.monotonic()
+                best_move, score, depth = searcher.search(game, max_depth, time_limit)
+                elapsed += time.monotonic() - start
+                nodes += searcher.get_nodes()
+                depth_total += depth
+        report.append({'processes': processes, 'nodes': nodes,
+                       'nodes_per_second': nodes / elapsed if elapsed else 0.0,
+                       'average_depth': depth_total / len(fens) if fens else 0.0})
+    for entry in report:
+        base = report[0]['nodes_per_second']
+        entry['speedup'] = entry['nodes_per_second'] / base if base else 0.0
+    return report
@@ -0,0 +1,185 @@
+# Description: Encodes XiangqiGame positions as feature planes for machine learning. Every plane is
+# a 10 x 9 grid laid out like XiangqiGame's board (row 0 is red's back rank, column 0 is file 'i').
+# There is one plane per piece type and color, a side to move plane, a plane for each check flag
+# and two legal move mask planes (squares moved from and squares moved to). encode_position returns
+# a contiguous NumPy array and DatasetWriter streams encoded positions from replayed games into
+# fixed size .npy shards, so memory use is bounded by the shard size and not the dataset size.
+# NumPy is only needed by encode_position and DatasetWriter, encode_planes works without it.
+
+import json
+import os
+
+from XiangqiGame import XiangqiGame, square_to_coordinates
+
+# piece strings in plane order, planes 0-6 are red and planes 7-13 are black
+PLANE_PIECES = ['rK', 'rG', 'rE', 'rH', 'rT', 'rC', 'rS',
+                'bK', 'bG', 'bE', 'bH', 'bT', 'bC', 'bS']
+SIDE_TO_MOVE_PLANE = 14         # all ones when red is to move, all zeros when black is to move
+RED_IN_CHECK_PLANE = 15
+BLACK_IN_CHECK_PLANE = 16
+LEGAL_FROM_PLANE = 17           # squares the side to move can legally move a piece from
+LEGAL_TO_PLANE = 18             # squares the side to move can legally move a piece to
+NUM_PLANES = 19
+PLANE_SIZE = 90                 # 10 rows x 9 columns
+
+PIECE_PLANE = {piece: num for num, piece in enumerate(PLANE_PIECES)}
+
+
+def encode_planes(game):
+    """Takes a XiangqiGame and returns its feature planes as a bytearray of NUM_PLANES * 90 bytes,
+    plane by plane, row by row. Every byte is 0 or 1."""
+
+    planes = bytearray(NUM_PLANES * PLANE_SIZE)
+    board = game.get_board()
+    for row in range(0, 10):
+        for column in range(0, 9):
+            piece = board[row][column]
+            if piece != '--':
+                planes[PIECE_PLANE[piece] * PLANE_SIZE + row * 9 + column] = 1
+
+    if game.get_turn() == 'red':
+        start = SIDE_TO_MOVE_PLANE * PLANE_SIZE
+        planes[start:start + PLANE_SIZE] = b'\x01' * PLANE_SIZE
+    if game.is_in_check('red'):
+        start = RED_IN_CHECK_PLANE * PLANE_SIZE
+        planes[start:start + PLANE_SIZE] = b'\x01' * PLANE_SIZE
+    if game.is_in_check('black'):
+        start = BLACK_IN_CHECK_PLANE * PLANE_SIZE
+        planes[start:start + PLANE_SIZE] = b'\x01' * PLANE_SIZE
+
+    if game.get_game_state() == 'UNFINISHED':
+        for from_row, from_column, to_row, to_column in game.get_legal_moves(game.get_turn()):
+            planes[LEGAL_FROM_PLANE * PLANE_SIZE + from_row * 9 + from_column] = 1
+            planes[LEGAL_TO_PLANE * PLANE_SIZE + to_row * 9 + to_column] = 1
+
+    return planes
+
+
+def encode_position(game):
+    """Takes a XiangqiGame and returns its feature planes as a contiguous uint8 NumPy array with
+    shape (NUM_PLANES, 10, 9)."""
+    import numpy
+
+    return numpy.frombuffer(encode_planes(game), dtype=numpy.uint8).reshape(NUM_PLANES, 10, 9)
+
+
+def encode_move(from_square, to_square):
+    """Takes a move in make_move notation and returns it as a single integer label,
+    from_index * 90 + to_index where a square's index is row * 9 + column."""
+    from_row, from_column = square_to_coordinates(from_square)
+    to_row, to_column = square_to_coordinates(to_square)
+    return (from_row * 9 + from_column) * PLANE_SIZE + to_row * 9 + to_column
+
+
+class DatasetWriter:
+    """Streams encoded positions into a directory of shards. Each shard is a pair of .npy files,
+    shard_NNNNN_planes.npy with shape (count, NUM_PLANES, 10, 9) and shard_NNNNN_moves.npy holding
+    the encode_move label of the move played from each position (-1 if none was played). Only one
+    shard is held at a time. With use_memmap the shard is written straight into memory-mapped
+    files; a partially filled last shard then keeps its full length and its real count is read
+    from the manifest.json file written by close."""
+
+    def __init__(self, directory, shard_size=4096, use_memmap=False):
+        import numpy
+
+        self._numpy = numpy
+        self._directory = directory
+        self._shard_size = shard_size
+        self._use_memmap = use_memmap
+        self._shard_num = 0
+        self._count = 0                 # positions in the current shard
+        self._shards = []               # [file name prefix, count] for every written shard
+        self._planes = None
+        self._moves = None
+        os.makedirs(directory, exist_ok=True)
+
+    def get_shards(self):
+        """Returns a list of [file name prefix, position count] for every shard written so far."""
+        return self._shards
+
+    def _shard_prefix(self):
+        """Returns the file name prefix of the current shard."""
+        return 'shard_%05d' % self._shard_num
+
+    def _open_shard(self):
+        """Allocates the buffers, or memory-mapped files, for a new shard."""
+        numpy = self._numpy
+        shape = (self._shard_size, NUM_PLANES, 10, 9)
+        if self._use_memmap:
+            prefix = os.path.join(self._directory, self._shard_prefix())
+            self._planes = numpy.lib.format.open_memmap(prefix + '_planes.npy', mode='w+',
+                                                        dtype=numpy.uint8, shape=shape)
+            self._moves = numpy.lib.format.open_memmap(prefix + '_moves.npy', mode='w+',
+                                                       dtype=numpy.int16,
+                                                       shape=(self._shard_size,))
+        else:
+            self._planes = numpy.empty(shape, dtype=numpy.uint8)
+            self._moves = numpy.empty((self._shard_size,), dtype=numpy.int16)
+        self._count = 0
+
+    def add_position(self, game, move=None):
+        """Takes a XiangqiGame and optionally the (from_square, to_square) move played from it and
+        appends the encoded position to the current shard, flushing the shard once it is full."""
+        if self._planes is None:
+            self._open_shard()
+        self._planes[self._count] = encode_position(game)
+        if move is None:
+            self._moves[self._count] = -1
+        else:
+            self._moves[self._count] = encode_move(move[0], move[1])
+        self._count += 1
+        if self._count == self._shard_size:
+            self.flush()
+
+    def add_game(self, moves):
+        """Takes an iterable of (from_square, to_square) moves and replays them from the opening
+        position, adding every position reached before each move. Stops at the first move
+        make_move rejects. Returns the number of positions added."""
+        game = XiangqiGame()
+        added = 0
+        for from_square, to_square in moves:
+            if game.get_game_state() != 'UNFINISHED':
+                break
+            encoded = encode_position(game)
+            if not game.make_move(from_square, to_square):
+                break
+            if self._planes is None:
+                self._open_shard()
+            self._planes[self._count] = encoded
+            self._moves[self._count] = encode_move(from_square, to_square)
+            self._count += 1
+            added += 1
+            if self._count == self._shard_size:
+                self.flush()
+        return added
+
+    def flush(self):
+        """Writes out the current shard if it holds any positions and starts a new one."""
+        if self._planes is None or self._count == 0:
+            return
+        if self._use_memmap:
+            self._planes.flush()
+            self._moves.flush()
+        else:
+            prefix = os.path.join(self._directory, self._shard_prefix())
+            self._numpy.save(prefix + '_planes.npy', self._planes[:self._count])
+            self._numpy.save(prefix + '_moves.npy', self._moves[:self._count])
+        self._shards.append([self._shard_prefix(), self._count])
+        self._shard_num += 1
+        self._planes = None
+        self._moves = None
+        self._count = 0
+
+    def close(self):
+        """Flushes the last shard and writes manifest.json describing every shard."""
+        self.flush()
+        manifest = {'num_planes': NUM_PLANES, 'plane_pieces': PLANE_PIECES,
+                    'shards': self._shards}
+        with open(os.path.join(self._directory, 'manifest.json'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
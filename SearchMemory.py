@@ -0,0 +1,142 @@
+# Description: Keeps a Searcher's move ordering statistics - its history and countermove tables -
+# and, optionally, a compact snapshot of its transposition table in a file between games, so the
+# first searches of a new game or a new process start warm instead of cold. Searcher.save_memory
+# writes the file and Searcher.load_memory reads it back through SearchMemory, which memory-maps
+# it: the two tables are fixed size arrays read straight from the map, followed by the table
+# entries. Files are written to a temporary file which then replaces the old one, so a crash never
+# leaves half a file behind.
+#
+# File layout (little endian): a 12 byte header (b'XQSM', the format version as a uint16, two
+# unused bytes and the number of transposition table entries as a uint32), then HISTORY_SIZE
+# history scores (uint32), one per piece and destination square with pieces numbered by
+# SNAPSHOT_CODES from 1 and squares numbered row * 9 + column, then HISTORY_SIZE countermoves
+# (uint16) in the same order - the reply which last refuted a move of that piece to that square,
+# as from square * 90 + to square + 1, or 0 for none - and then the table entries, 14 bytes each:
+# key (uint64), depth (uint8), flag (uint8), score (int16) and best move (uint16, encoded like
+# the countermoves).
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from XiangqiGame import SNAPSHOT_PIECES, SNAPSHOT_CODES
+
+MEMORY_MAGIC = b'XQSM'
+MEMORY_VERSION = 1
+HEADER = struct.Struct('<4sHxxI')
+TT_ENTRY = struct.Struct('<QBBhH')
+HISTORY_SIZE = 14 * 90
+# the largest history score: Searcher orders countermoves at 40000 and killers, captures and the
+# table move above them, so history scores must stay below that to rank after all of them
+MAX_HISTORY = 39999
+
+
+def _encode_move(move):
+    """Packs a move, or None, into one number: from square * 90 + to square + 1, 0 for None."""
+    if move is None:
+        return 0
+    return (move[0] * 9 + move[1]) * 90 + move[2] * 9 + move[3] + 1
+
+
+def _decode_move(code):
+    """Unpacks a number made by _encode_move."""
+    if code == 0:
+        return None
+    from_index, to_index = divmod(code - 1, 90)
+    return from_index // 9, from_index % 9, to_index // 9, to_index % 9
+
+
+def _table_index(piece, to_row, to_column):
+    """Returns the slot of a (piece, to_row, to_column) key in the history and countermove
+    arrays."""
+    return (SNAPSHOT_CODES[piece] - 1) * 90 + to_row * 9 + to_column
+
+
+def _table_key(index):
+    """Returns the (piece, to_row, to_column) key of a slot of the history and countermove
+    arrays."""
+    piece_code, square = divmod(index, 90)
+    return SNAPSHOT_PIECES[piece_code + 1], square // 9, square % 9
+
+
+def write_search_memory(path, history, countermoves, tt_entries=()):
+    """Writes a search memory file. history maps (piece, to_row, to_column) keys to scores,
+    countermoves maps the same keys to moves and tt_entries is a sequence of (key, (depth, score,
+    flag, best move)) transposition table entries. History scores are capped at MAX_HISTORY."""
+    history_array = array('I', bytes(4 * HISTORY_SIZE))
+    for key, score in history.items():
+        history_array[_table_index(*key)] = max(0, min(score, MAX_HISTORY))
+    countermove_array = array('H', bytes(2 * HISTORY_SIZE))
+    for key, move in countermoves.items():
+        countermove_array[_table_index(*key)] = _encode_move(move)
+    entries = list(tt_entries)
+    if sys.byteorder == 'big':
+        history_array.byteswap()
+        countermove_array.byteswap()
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as memory_file:
+        memory_file.write(HEADER.pack(MEMORY_MAGIC, MEMORY_VERSION, len(entries)))
+        memory_file.write(history_array.tobytes())
+        memory_file.write(countermove_array.tobytes())
+        memory_file.write(b''.join(TT_ENTRY.pack(key, depth, flag, score, _encode_move(move))
+                                   for key, (depth, score, flag, move) in entries))
+        memory_file.flush()
+        os.fsync(memory_file.fileno())
+    os.replace(temporary_path, path)
+
+
+class SearchMemory:
+    """A read-only view of a search memory file, memory-mapped."""
+
+    def __init__(self, path):
+        self._path = path
+        with open(path, 'rb') as memory_file:
+            self._data = mmap.mmap(memory_file.fileno(), 0, access=mmap.ACCESS_READ)
+        tables_size = HEADER.size + 6 * HISTORY_SIZE
+        if len(self._data) < tables_size:
+            self._data.close()
+            raise ValueError('Not a search memory file: ' + path)
+        magic, version, self._num_entries = HEADER.unpack_from(self._data, 0)
+        if magic != MEMORY_MAGIC or version != MEMORY_VERSION or \
+                len(self._data) != tables_size + self._num_entries * TT_ENTRY.size:
+            self._data.close()
+            raise ValueError('Not a search memory file, or one of another version: ' + path)
+
+    def get_num_tt_entries(self):
+        """Returns the number of transposition table entries in the file."""
+        return self._num_entries
+
+    def get_history(self, shift=0):
+        """Returns the history table as a dictionary of (piece, to_row, to_column) keys to scores,
+        each capped at MAX_HISTORY and divided by 2 ** shift so old statistics weigh less than new
+        ones."""
+        scores = struct.unpack_from('<%dI' % HISTORY_SIZE, self._data, HEADER.size)
+        return {_table_key(index): min(score, MAX_HISTORY) >> shift
+                for index, score in enumerate(scores) if min(score, MAX_HISTORY) >> shift}
+
+    def get_countermoves(self):
+        """Returns the countermove table as a dictionary of (piece, to_row, to_column) keys to
+        moves."""
+        codes = struct.unpack_from('<%dH' % HISTORY_SIZE, self._data,
+                                   HEADER.size + 4 * HISTORY_SIZE)
+        return {_table_key(index): _decode_move(code) for index, code in enumerate(codes) if code}
+
+    def get_tt_entries(self):
+        """Yields the transposition table entries as (key, depth, score, flag, best move)."""
+        offset = HEADER.size + 6 * HISTORY_SIZE
+        for key, depth, flag, score, move in TT_ENTRY.iter_unpack(
+                self._data[offset:offset + self._num_entries * TT_ENTRY.size]):
+            yield key, depth, score, flag, _decode_move(move)
+
+    def close(self):
+        """Unmaps the file."""
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
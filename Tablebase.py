@@ -0,0 +1,447 @@
+# Description: Endgame tablebases for small material Xiangqi endings. generate_tablebase solves
+# every position of a material set, such as rK rT against bK bG bG, by retrograde analysis and
+# writes the result to a file which Tablebase memory-maps and probes. Moves are generated with the
+# Piece subclasses' move methods, so the tables follow exactly the same rules as XiangqiGame. As in
+# XiangqiGame, a player with no legal moves has lost, whether or not they are in check, and no
+# move may leave the two Generals facing each other on an open file.
+#
+# Index scheme: every piece only takes the squares it can ever stand on (9 palace squares for a
+# General, 5 for a Guard, 7 for an Elephant, 55 for a Soldier and 90 for the others), and a
+# position's index is the mixed radix number made of each piece's square number within its own
+# list, times two, plus one if black is to move.
+#
+# Table file layout: b'XQT2', then the length of the material name as a little endian uint16, the
+# material name (such as 'rK-rT-bK'), and one little endian int16 value per index. A value of 0 is
+# a draw, n > 0 is a win for the player to move in n plies, n < 0 (other than INVALID) is a loss in
+# -n - 1 plies and INVALID marks an index which is not a legal position.
+
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+from array import array
+
+from XiangqiGame import General, Guard, Elephant, Horse, Chariot, Cannon, Soldier, \
+    candidate_squares
+
+TABLE_MAGIC = b'XQT2'         # b'XQTB' tables were made before facing Generals were detected
+INVALID = -32768
+PIECE_ORDER = 'KGEHTCS'
+PIECE_CLASSES = {'K': General, 'G': Guard, 'E': Elephant, 'H': Horse, 'T': Chariot,
+                 'C': Cannon, 'S': Soldier}
+
+
+def material_key(pieces):
+    """Takes a list of piece strings, such as ['bG', 'rT', 'bK', 'rK', 'bG'], and returns them as
+    a tuple in the canonical order used to name and index tables: red before black, then by
+    type in PIECE_ORDER."""
+    return tuple(sorted(pieces, key=lambda piece: (piece[0] != 'r', PIECE_ORDER.index(piece[1]))))
+
+
+def table_name(material):
+    """Returns the file name of the table for a material key, such as 'rK-rT-bK.xtb'."""
+    return '-'.join(material) + '.xtb'
+
+
+def piece_domain(piece):
+    """Takes a piece string and returns the list of square indexes (row * 9 + column) it can ever
+    stand on, from red's point of view and mirrored for black."""
+    if piece[1] == 'K':
+        squares = [(row, column) for row in range(0, 3) for column in range(3, 6)]
+    elif piece[1] == 'G':
+        squares = [(0, 3), (0, 5), (1, 4), (2, 3), (2, 5)]
+    elif piece[1] == 'E':
+        squares = [(0, 2), (0, 6), (2, 0), (2, 4), (2, 8), (4, 2), (4, 6)]
+    elif piece[1] == 'S':
+        # a soldier starts on an even column of row 3 and cannot retreat
+        squares = [(row, column) for row in (3, 4) for column in range(0, 9, 2)]
+        squares += [(row, column) for row in range(5, 10) for column in range(0, 9)]
+    else:
+        squares = [(row, column) for row in range(0, 10) for column in range(0, 9)]
+    if piece[0] == 'b':
+        squares = [(9 - row, column) for row, column in squares]
+    return sorted(row * 9 + column for row, column in squares)
+
+
+class TablebaseIndexer:
+    """Converts between positions of one material set and table indexes. A position is a list of
+    square indexes in material order plus the side to move (0 red, 1 black)."""
+
+    def __init__(self, material):
+        self._material = material
+        self._domains = [piece_domain(piece) for piece in material]
+        self._lookups = [{square: num for num, square in enumerate(domain)}
+                         for domain in self._domains]
+        self._size = 2
+        for domain in self._domains:
+            self._size *= len(domain)
+
+    def get_material(self):
+        """Returns the material key."""
+        return self._material
+
+    def get_size(self):
+        """Returns the number of indexes in the table."""
+        return self._size
+
+    def index(self, squares, side):
+        """Returns the table index of a position, or None if a piece is off its domain."""
+        index = 0
+        for num, square in enumerate(squares):
+            place = self._lookups[num].get(square)
+            if place is None:
+                return None
+            index = index * len(self._domains[num]) + place
+        return index * 2 + side
+
+    def unindex(self, index):
+        """Returns the (squares, side) position of a table index."""
+        side = index % 2
+        index //= 2
+        squares = [0] * len(self._domains)
+        for num in range(len(self._domains) - 1, -1, -1):
+            domain = self._domains[num]
+            squares[num] = domain[index % len(domain)]
+            index //= len(domain)
+        return squares, side
+
+
+class Tablebase:
+    """Probes tablebase files stored in a directory. Tables are opened and memory-mapped the first
+    time a position with their material is probed."""
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._tables = {}           # material key -> (indexer, mmap, offset of the values) or None
+
+    def _open_table(self, material):
+        """Returns the (indexer, data, offset) of a table, or None if there is no file for it."""
+        if material in self._tables:
+            return self._tables[material]
+        path = os.path.join(self._directory, table_name(material))
+        table = None
+        if os.path.exists(path):
+            with open(path, 'rb') as table_file:
+                data = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, name_length = struct.unpack_from('<4sH', data, 0)
+            if magic != TABLE_MAGIC:
+                raise ValueError('Not a tablebase file, or one made by an older version: ' + path)
+            table = (TablebaseIndexer(material), data, 6 + name_length)
+        self._tables[material] = table
+        return table
+
+    def probe_value(self, material, squares, side):
+        """Takes a material key, the matching list of square indexes and the side to move and
+        returns the raw table value, or None if there is no table for the material."""
+        table = self._open_table(material)
+        if table is None:
+            return None
+        indexer, data, offset = table
+        index = indexer.index(squares, side)
+        if index is None:
+            return INVALID
+        return struct.unpack_from('<h', data, offset + 2 * index)[0]
+
+    def probe(self, game):
+        """Takes a XiangqiGame and returns (result, distance_to_mate) for the player to move, where
+        result is 'WIN', 'LOSS' or 'DRAW' and distance_to_mate is the number of plies to mate
+        with best play (None for a draw). Returns None if no table covers the position, or if the
+        game is played by house rules which change how games end."""
+        if not game.get_rules().is_standard():
+            return None
+        pieces = []
+        board = game.get_board()
+        for row in range(0, 10):
+            for column in range(0, 9):
+                if board[row][column] != '--':
+                    pieces.append((board[row][column], row * 9 + column))
+        material = material_key([piece for piece, square in pieces])
+        # identical pieces are interchangeable, so sorting by material order is enough
+        pieces.sort(key=lambda entry: (entry[0][0] != 'r', PIECE_ORDER.index(entry[0][1])))
+        squares = [square for piece, square in pieces]
+        side = 0 if game.get_turn() == 'red' else 1
+        value = self.probe_value(material, squares, side)
+        if value is None or value == INVALID:
+            return None
+        return decode_value(value)
+
+    def close(self):
+        """Closes every open table."""
+        for table in self._tables.values():
+            if table is not None:
+                table[1].close()
+        self._tables = {}
+
+
+def decode_value(value):
+    """Takes a raw table value and returns (result, distance_to_mate) for the player to move."""
+    if value > 0:
+        return 'WIN', value
+    if value < 0:
+        return 'LOSS', -value - 1
+    return 'DRAW', None
+
+
+# *************************************************************************************************
+# Generation. Workers each take a range of indexes, generate the legal moves of every position in
+# it and return what they found. The parent then propagates results backwards from the positions
+# with no legal moves (retrograde analysis).
+# *************************************************************************************************
+
+_worker = {}        # per process generation state, set by _init_worker
+
+
+def _init_worker(material, directory):
+    """Sets up the piece objects, indexers and sub-table access used by _analyse_range."""
+    _worker['material'] = material
+    _worker['indexer'] = TablebaseIndexer(material)
+    _worker['tablebase'] = Tablebase(directory)
+    _worker['objects'] = {}
+    for piece in material:
+        color = 'red' if piece[0] == 'r' else 'black'
+        _worker['objects'][piece] = PIECE_CLASSES[piece[1]](color)
+
+
+def _attacked(board, pieces, squares, skip, square, color):
+    """Returns True if any piece of color other than number skip can move to square."""
+    objects = _worker['objects']
+    row, column = divmod(square, 9)
+    for num, piece in enumerate(pieces):
+        if num != skip and piece[0] == color:
+            from_row, from_column = divmod(squares[num], 9)
+            if objects[piece].move(from_row, from_column, row, column, board):
+                return True
+    return False
+
+
+def _generals_facing(squares, kings, skip):
+    """Returns True if the Generals (the pieces numbered kings[0] and kings[1]) stand on the same
+    file with no piece other than number skip between them."""
+    red_row, red_column = divmod(squares[kings[0]], 9)
+    black_row, black_column = divmod(squares[kings[1]], 9)
+    if red_column != black_column:
+        return False
+    for num, square in enumerate(squares):
+        if num != skip and square % 9 == red_column and red_row < square // 9 < black_row:
+            return False
+    return True
+
+
+def _analyse_range(bounds):
+    """Takes a (start, stop) index range and returns, for every index in it: its number of legal
+    moves (-1 if it is not a legal position), the successor indexes of its moves that stay in
+    the table, and the best and worst results of its captures, which end in smaller tables."""
+    start, stop = bounds
+    material = _worker['material']
+    indexer = _worker['indexer']
+    tablebase = _worker['tablebase']
+    objects = _worker['objects']
+    kings = [material.index('rK'), material.index('bK')]
+
+    num_moves = array('h')
+    successor_counts = array('h')
+    successors = array('l')
+    capture_win = array('h')        # smallest win distance reachable by a capture, 0 if none
+    capture_loss = array('h')       # largest loss distance forced by captures, 0 if none
+    capture_draw = array('b')       # 1 if a capture leads to a draw
+
+    board = [['--'] * 9 for num in range(10)]
+    for index in range(start, stop):
+        squares, side = indexer.unindex(index)
+        win = loss = draw = 0
+        count = 0
+        in_table = 0
+        if len(set(squares)) != len(squares):
+            num_moves.append(-1)
+            successor_counts.append(0)
+            capture_win.append(0)
+            capture_loss.append(0)
+            capture_draw.append(0)
+            continue
+        for num, piece in enumerate(material):
+            board[squares[num] // 9][squares[num] % 9] = piece
+
+        color, other = ('r', 'b') if side == 0 else ('b', 'r')
+        # the player who just moved may not have left their General in check or facing the other
+        if _attacked(board, material, squares, -1, squares[kings[1 - side]], color) or \
+                _generals_facing(squares, kings, -1):
+            count = -1
+        else:
+            for num, piece in enumerate(material):
+                if piece[0] != color:
+                    continue
+                from_row, from_column = divmod(squares[num], 9)
+                for to_row, to_column in candidate_squares(piece, from_row, from_column):
+                    target = board[to_row][to_column]
+                    if target[0] == color or target[1] == 'K':
+                        continue
+                    if not objects[piece].move(from_row, from_column, to_row, to_column, board):
+                        continue
+                    to_square = to_row * 9 + to_column
+                    captured = -1
+                    if target != '--':
+                        captured = squares.index(to_square)
+                    # make the move and test it does not leave the mover's General in check
+                    board[from_row][from_column] = '--'
+                    board[to_row][to_column] = piece
+                    new_squares = list(squares)
+                    new_squares[num] = to_square
+                    in_check = _attacked(board, material, new_squares, captured,
+                                         new_squares[kings[side]], other) or \
+                        _generals_facing(new_squares, kings, captured)
+                    board[to_row][to_column] = target
+                    board[from_row][from_column] = piece
+                    if in_check:
+                        continue
+                    count += 1
+                    if captured == -1:
+                        successors.append(indexer.index(new_squares, 1 - side))
+                        in_table += 1
+                        continue
+                    sub_material = material[:captured] + material[captured + 1:]
+                    sub_squares = new_squares[:captured] + new_squares[captured + 1:]
+                    value = tablebase.probe_value(sub_material, sub_squares, 1 - side)
+                    if value is None:
+                        raise ValueError('Missing table for ' + '-'.join(sub_material))
+                    if value < 0:
+                        # the opponent loses after this capture
+                        distance = -value
+                        if win == 0 or distance < win:
+                            win = distance
+                    elif value > 0:
+                        loss = max(loss, value + 1)
+                    else:
+                        draw = 1
+
+        for num in range(len(material)):
+            board[squares[num] // 9][squares[num] % 9] = '--'
+        num_moves.append(count)
+        successor_counts.append(in_table)
+        capture_win.append(win)
+        capture_loss.append(loss)
+        capture_draw.append(draw)
+
+    return (start, num_moves.tobytes(), successor_counts.tobytes(), successors.tobytes(),
+            capture_win.tobytes(), capture_loss.tobytes(), capture_draw.tobytes())
+
+
+def _sub_materials(material):
+    """Returns the material keys reachable from material by one capture."""
+    subs = set()
+    for num, piece in enumerate(material):
+        if piece[1] != 'K':
+            subs.add(material[:num] + material[num + 1:])
+    return sorted(subs)
+
+
+def generate_tablebase(pieces, directory, processes=None, chunk_size=4096):
+    """Takes a list of piece strings (which must include 'rK' and 'bK') and solves every position
+    of that material set, first generating any missing tables for the smaller material sets that
+    captures lead to. Move generation runs on a pool of processes (one per core by default).
+    Writes the table into directory and returns its path."""
+    material = material_key(pieces)
+    if material.count('rK') != 1 or material.count('bK') != 1:
+        raise ValueError('A material set needs exactly one rK and one bK')
+    path = os.path.join(directory, table_name(material))
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    for sub_material in _sub_materials(material):
+        generate_tablebase(sub_material, directory, processes, chunk_size)
+
+    indexer = TablebaseIndexer(material)
+    size = indexer.get_size()
+    num_moves = array('h', bytes(2 * size))
+    successor_counts = array('h', bytes(2 * size))
+    capture_win = array('h', bytes(2 * size))
+    capture_loss = array('h', bytes(2 * size))
+    capture_draw = array('b', bytes(size))
+    chunk_successors = {}
+
+    ranges = [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+    with multiprocessing.Pool(processes, _init_worker, (material, directory)) as pool:
+        for result in pool.imap_unordered(_analyse_range, ranges):
+            start = result[0]
+            stop = start + len(result[1]) // 2
+            num_moves[start:stop] = array('h', result[1])
+            successor_counts[start:stop] = array('h', result[2])
+            chunk_successors[start] = array('l', result[3])
+            capture_win[start:stop] = array('h', result[4])
+            capture_loss[start:stop] = array('h', result[5])
+            capture_draw[start:stop] = array('b', result[6])
+
+    # builds the predecessor lists: the predecessors of index n are
+    # predecessors[offsets[n]:offsets[n + 1]]
+    offsets = array('l', bytes(array('l').itemsize * (size + 1)))
+    for start in chunk_successors:
+        for successor in chunk_successors[start]:
+            offsets[successor + 1] += 1
+    for index in range(size):
+        offsets[index + 1] += offsets[index]
+    fill = array('l', offsets)
+    predecessors = array('l', bytes(array('l').itemsize * offsets[size]))
+    for start in sorted(chunk_successors):
+        position = 0
+        successors = chunk_successors[start]
+        for index in range(start, min(start + chunk_size, size)):
+            for num in range(successor_counts[index]):
+                successor = successors[position]
+                predecessors[fill[successor]] = index
+                fill[successor] += 1
+                position += 1
+    del chunk_successors, fill
+
+    # seeds the search: positions without moves are lost, captures may already win or lose
+    values = array('h', bytes(2 * size))
+    solved = bytearray(size)
+    buckets = {}            # distance -> list of (index, is_win)
+    for index in range(size):
+        if num_moves[index] == -1:
+            values[index] = INVALID
+            solved[index] = 1
+        elif num_moves[index] == 0:
+            buckets.setdefault(0, []).append((index, False))
+        else:
+            if capture_win[index]:
+                buckets.setdefault(capture_win[index], []).append((index, True))
+            elif successor_counts[index] == 0 and not capture_draw[index]:
+                buckets.setdefault(capture_loss[index], []).append((index, False))
+
+    # retrograde propagation in order of distance, so every value found is the shortest mate
+    distance = 0
+    while buckets:
+        for index, is_win in buckets.pop(distance, []):
+            if solved[index]:
+                continue
+            solved[index] = 1
+            if is_win:
+                values[index] = distance
+                for num in range(offsets[index], offsets[index + 1]):
+                    predecessor = predecessors[num]
+                    if solved[predecessor]:
+                        continue
+                    successor_counts[predecessor] -= 1
+                    capture_loss[predecessor] = max(capture_loss[predecessor], distance + 1)
+                    if successor_counts[predecessor] == 0 and not capture_win[predecessor] \
+                            and not capture_draw[predecessor]:
+                        buckets.setdefault(capture_loss[predecessor], []).append(
+                            (predecessor, False))
+            else:
+                values[index] = -distance - 1
+                for num in range(offsets[index], offsets[index + 1]):
+                    predecessor = predecessors[num]
+                    if not solved[predecessor]:
+                        buckets.setdefault(distance + 1, []).append((predecessor, True))
+        distance += 1
+    # every position left unsolved is a draw, which is already stored as 0
+
+    name = '-'.join(material).encode()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as table_file:
+        table_file.write(TABLE_MAGIC + struct.pack('<H', len(name)) + name)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        table_file.write(values.tobytes())
+    os.replace(temp_path, path)
+    return path
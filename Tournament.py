@@ -0,0 +1,273 @@
+# Description: Runs engine-vs-engine matches between two search configurations. Games are scheduled
+# on a process pool, start from openings picked at random from a list of FEN positions, optionally
+# followed by a few random moves (each opening is played twice with colors swapped), and are
+# recorded one line per game in a compact game format. Elo and SPRT statistics are updated as
+# each game finishes and progress is streamed as one line per game, including the throughput in
+# games per hour per core.
+#
+# An engine is a dictionary with a 'name' and optional 'max_depth', 'time_per_move' (seconds) and
+# 'node_limit' search limits, for example {'name': 'depth3', 'max_depth': 3}.
+#
+# Compact game format: '<opening FEN>|<moves in ICCS notation separated by spaces>|<result>',
+# where the result is RED_WON, BLACK_WON or DRAW.
+
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+from XiangqiGame import XiangqiGame, START_FEN, coordinates_to_square, iccs_to_move, \
+    move_to_iccs
+from XiangqiEngine import Searcher
+
+
+def format_game_record(fen, moves, result):
+    """Takes an opening FEN, a list of ICCS moves and a result and returns the compact record."""
+    return '%s|%s|%s' % (fen, ' '.join(moves), result)
+
+
+def parse_game_record(line):
+    """Takes a compact game record line and returns (fen, list of ICCS moves, result)."""
+    fen, moves, result = line.strip().split('|')
+    return fen, moves.split(), result
+
+
+def replay_game_record(line):
+    """Takes a compact game record line and returns the XiangqiGame reached by replaying it, or
+    raises ValueError if one of its moves is rejected by make_move."""
+    fen, moves, result = parse_game_record(line)
+    game = XiangqiGame()
+    if fen != START_FEN:
+        game.set_fen(fen)
+    for iccs in moves:
+        move = iccs_to_move(iccs)
+        if not game.make_move(coordinates_to_square(move[0], move[1]),
+                              coordinates_to_square(move[2], move[3])):
+            raise ValueError('Illegal move in game record: ' + iccs)
+    return game
+
+
+def play_game(task):
+    """Plays one game and returns its result. task is (game number, opening FEN, red engine,
+    black engine, maximum plies, whether the match's first engine is red); a game reaching the
+    maximum plies is a draw. Runs in the pool's worker processes."""
+    game_num, fen, red_engine, black_engine, max_plies, a_is_red = task
+    start = time.monotonic()
+    game = XiangqiGame()
+    if fen != START_FEN:
+        game.set_fen(fen)
+    searchers = {'red': Searcher(), 'black': Searcher()}
+    engines = {'red': red_engine, 'black': black_engine}
+    moves = []
+    result = None
+    while result is None and len(moves) < max_plies:
+        engine = engines[game.get_turn()]
+        move = searchers[game.get_turn()].search(
+            game, engine.get('max_depth', 64), engine.get('time_per_move'),
+            engine.get('node_limit'), use_book=False)[0]
+        if move is None:
+            # no legal moves loses
+            result = 'BLACK_WON' if game.get_turn() == 'red' else 'RED_WON'
+            break
+        game.make_move(coordinates_to_square(move[0], move[1]),
+                       coordinates_to_square(move[2], move[3]))
+        moves.append(move_to_iccs(move))
+        if game.get_game_state() != 'UNFINISHED':
+            result = game.get_game_state()
+    if result is None:
+        result = 'DRAW'
+    return {'game_num': game_num, 'fen': fen, 'red': red_engine['name'],
+            'black': black_engine['name'], 'a_is_red': a_is_red, 'moves': moves,
+            'result': result, 'seconds': time.monotonic() - start}
+
+
+class MatchStatistics:
+    """Keeps the score of engine A against engine B and derives the Elo difference and the SPRT
+    log-likelihood ratio for the hypotheses elo0 (H0) and elo1 (H1), updated one game at a time."""
+
+    def __init__(self, elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05):
+        self._wins = 0
+        self._draws = 0
+        self._losses = 0
+        self._elo0 = elo0
+        self._elo1 = elo1
+        self._lower_bound = math.log(beta / (1 - alpha))
+        self._upper_bound = math.log((1 - beta) / alpha)
+
+    def add_result(self, score):
+        """Adds one game, scored 1, 0.5 or 0 from engine A's point of view."""
+        if score == 1:
+            self._wins += 1
+        elif score == 0:
+            self._losses += 1
+        else:
+            self._draws += 1
+
+    def get_games(self):
+        """Returns the number of games played."""
+        return self._wins + self._draws + self._losses
+
+    def get_record(self):
+        """Returns engine A's (wins, draws, losses)."""
+        return self._wins, self._draws, self._losses
+
+    def get_score(self):
+        """Returns engine A's average score per game."""
+        games = self.get_games()
+        if games == 0:
+            return 0.5
+        return (self._wins + 0.5 * self._draws) / games
+
+    def get_elo(self):
+        """Returns (Elo difference, 95% error margin) of engine A over engine B."""
+        games = self.get_games()
+        if games == 0:
+            return 0.0, float('inf')
+        score = self.get_score()
+        variance = (self._wins * (1 - score) ** 2 + self._draws * (0.5 - score) ** 2 +
+                    self._losses * score ** 2) / games
+        margin = 1.96 * math.sqrt(variance / games)
+        return _score_to_elo(score), (_score_to_elo(min(score + margin, 0.999)) -
+                                      _score_to_elo(max(score - margin, 0.001))) / 2
+
+    def get_llr(self):
+        """Returns the SPRT log-likelihood ratio of H1 against H0 (normal approximation)."""
+        games = self.get_games()
+        if games == 0 or self._wins + self._losses == 0:
+            return 0.0
+        score = self.get_score()
+        variance = (self._wins * (1 - score) ** 2 + self._draws * (0.5 - score) ** 2 +
+                    self._losses * score ** 2) / games
+        if variance <= 0:
+            return 0.0
+        score0 = _elo_to_score(self._elo0)
+        score1 = _elo_to_score(self._elo1)
+        return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    def get_bounds(self):
+        """Returns the (lower, upper) SPRT bounds for the log-likelihood ratio."""
+        return self._lower_bound, self._upper_bound
+
+    def get_sprt_status(self):
+        """Returns 'H1' if the test accepts elo1, 'H0' if it accepts elo0, otherwise None."""
+        llr = self.get_llr()
+        if llr >= self._upper_bound:
+            return 'H1'
+        if llr <= self._lower_bound:
+            return 'H0'
+        return None
+
+
+def _score_to_elo(score):
+    """Converts an expected score to an Elo difference."""
+    score = min(max(score, 0.001), 0.999)
+    return -400 * math.log10(1 / score - 1)
+
+
+def _elo_to_score(elo):
+    """Converts an Elo difference to an expected score."""
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+class Tournament:
+    """Plays engine_a against engine_b on a pool of processes (one per core by default). Openings
+    are FEN positions picked at random (with seed) from openings, or the starting position,
+    followed by random_plies random legal moves."""
+
+    def __init__(self, engine_a, engine_b, openings=None, processes=None, max_plies=200, seed=0,
+                 elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05, record_path=None,
+                 progress_stream=None, random_plies=0):
+        self._engine_a = engine_a
+        self._engine_b = engine_b
+        self._openings = openings if openings else [START_FEN]
+        self._random_plies = random_plies
+        self._processes = processes if processes else multiprocessing.cpu_count()
+        self._max_plies = max_plies
+        self._random = random.Random(seed)
+        self._statistics = MatchStatistics(elo0, elo1, alpha, beta)
+        self._record_path = record_path
+        self._progress = progress_stream if progress_stream is not None else sys.stdout
+        self._start_time = None
+
+    def get_statistics(self):
+        """Returns the MatchStatistics of the match."""
+        return self._statistics
+
+    def get_games_per_hour_per_core(self):
+        """Returns the throughput of the match so far."""
+        if self._start_time is None:
+            return 0.0
+        hours = (time.monotonic() - self._start_time) / 3600
+        if hours <= 0:
+            return 0.0
+        return self._statistics.get_games() / hours / self._processes
+
+    def _tasks(self, num_games):
+        """Yields the game tasks: each opening is played once with each engine as red."""
+        for game_num in range(num_games):
+            if game_num % 2 == 0:
+                fen = self._pick_opening()
+                yield game_num, fen, self._engine_a, self._engine_b, self._max_plies, True
+            else:
+                yield game_num, fen, self._engine_b, self._engine_a, self._max_plies, False
+
+    def _pick_opening(self):
+        """Returns the FEN of a random opening followed by random_plies random legal moves."""
+        fen = self._random.choice(self._openings)
+        if self._random_plies == 0:
+            return fen
+        game = XiangqiGame()
+        game.set_fen(fen)
+        for ply in range(self._random_plies):
+            moves = game.get_legal_moves(game.get_turn())
+            if not moves or game.get_game_state() != 'UNFINISHED':
+                break
+            move = self._random.choice(moves)
+            game.make_move(coordinates_to_square(move[0], move[1]),
+                           coordinates_to_square(move[2], move[3]))
+        if game.get_game_state() != 'UNFINISHED':
+            return fen
+        return game.get_fen()
+
+    def run(self, num_games, stop_on_sprt=False):
+        """Plays num_games games, or fewer if stop_on_sprt is True and the SPRT finishes, and
+        returns the MatchStatistics."""
+        self._start_time = time.monotonic()
+        record_file = open(self._record_path, 'a') if self._record_path else None
+        try:
+            with multiprocessing.Pool(self._processes) as pool:
+                for game in pool.imap_unordered(play_game, self._tasks(num_games)):
+                    self._add_game(game, record_file)
+                    if stop_on_sprt and self._statistics.get_sprt_status() is not None:
+                        pool.terminate()
+                        break
+        finally:
+            if record_file is not None:
+                record_file.close()
+        return self._statistics
+
+    def _add_game(self, game, record_file):
+        """Updates the statistics with a finished game, records it and reports progress."""
+        if game['result'] == 'DRAW':
+            score = 0.5
+        elif (game['result'] == 'RED_WON') == game['a_is_red']:
+            score = 1
+        else:
+            score = 0
+        self._statistics.add_result(score)
+        if record_file is not None:
+            record_file.write(format_game_record(game['fen'], game['moves'], game['result']) +
+                              '\n')
+            record_file.flush()
+
+        wins, draws, losses = self._statistics.get_record()
+        elo, margin = self._statistics.get_elo()
+        lower, upper = self._statistics.get_bounds()
+        self._progress.write(
+            'game %d %s-%s %s plies %d | %s +%d =%d -%d | elo %.1f +/- %.1f | llr %.2f '
+            '[%.2f, %.2f] | %.1f games/hour/core\n' % (
+                game['game_num'] + 1, game['red'], game['black'], game['result'],
+                len(game['moves']), self._engine_a['name'], wins, draws, losses, elo, margin,
+                self._statistics.get_llr(), lower, upper, self.get_games_per_hour_per_core()))
+        self._progress.flush()
@@ -0,0 +1,234 @@
+# Description: Runs XiangqiGame as a headless engine speaking the UCCI protocol (and the matching
+# UCI commands) over stdin and stdout, so it can be driven by GUIs, match runners and tournament
+# harnesses. Positions are given in FEN with moves in ICCS notation. Searches run on a worker
+# thread so that 'stop' and 'quit' are handled while the engine is thinking. One long-lived
+# process can play any number of games.
+#
+# Supported commands: ucci, uci, isready, setoption, position, go, ponderhit, stop, quit. go
+# accepts depth, nodes, movetime, time, increment and movestogo (the side to move's clock), UCI's
+# wtime, btime, winc and binc, infinite and ponder. All times are in milliseconds. With a clock the
+# time for the move is left to XiangqiEngine's TimeManager. 'go ponder' searches the position
+# after the expected reply (sent with 'bestmove <move> ponder <reply>') until 'ponderhit' turns
+# it into a normal timed search or 'stop' ends it. 'go infinite' reports its move only after
+# 'stop', even if the search finishes first. 'setoption memoryfile <path>' loads the search's
+# history, countermove and transposition tables from a search memory file, and saves them back to
+# it on 'quit', so each engine process starts where the last one stopped.
+#
+# Run with: python UcciEngine.py
+
+import os
+import sys
+import threading
+
+from OpeningBook import OpeningBook
+from XiangqiGame import XiangqiGame, coordinates_to_square, iccs_to_move, move_to_iccs
+from XiangqiEngine import Searcher, TimeManager
+
+ENGINE_NAME = 'XiangqiGame'
+
+
+class UcciEngine:
+    """Reads protocol commands from input_stream and writes responses to output_stream. The
+    current position is kept as a XiangqiGame and searched with a Searcher on a worker thread."""
+
+    def __init__(self, input_stream=None, output_stream=None):
+        self._input = input_stream if input_stream is not None else sys.stdin
+        self._output = output_stream if output_stream is not None else sys.stdout
+        self._output_lock = threading.Lock()
+        self._searcher = Searcher()
+        self._game = XiangqiGame()
+        self._search_thread = None
+        # set once a ponder or infinite search may report its move
+        self._ponder_done = threading.Event()
+        self._infinite = False          # True while an infinite search waits for 'stop'
+        self._protocol = 'ucci'
+        self._memory_path = None
+
+    def send(self, line):
+        """Writes one line to the output stream and flushes it."""
+        with self._output_lock:
+            self._output.write(line + '\n')
+            self._output.flush()
+
+    def run(self):
+        """Reads and handles commands until 'quit' or the end of the input."""
+        for line in self._input:
+            if not self.handle_command(line):
+                break
+        self.stop_search()
+
+    def handle_command(self, line):
+        """Handles one command line. Returns False when the engine should exit."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == 'ucci' or command == 'uci':
+            self._protocol = command
+            self.send('id name ' + ENGINE_NAME)
+            self.send(command + 'ok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'setoption':
+            self.set_option(tokens[1:])
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(tokens[1:])
+        elif command == 'go':
+            self.stop_search()
+            self.go(tokens[1:])
+        elif command == 'ponderhit':
+            self._searcher.ponder_hit()
+            if not self._infinite:
+                self._ponder_done.set()
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'quit':
+            self.stop_search()
+            self.save_memory()
+            if self._protocol == 'ucci':
+                self.send('bye')
+            return False
+        return True
+
+    def set_option(self, tokens):
+        """Handles setoption. 'bookfiles <path>' opens an opening book which is probed before
+        every search, 'memoryfile <path>' loads the search tables from a search memory file (if
+        it exists) and saves them to it on quit, 'clearhash' (or UCI's 'name Clear Hash') empties
+        the search tables and other options are accepted and ignored."""
+        words = [token.lower() for token in tokens]
+        if words[:1] == ['bookfiles'] and len(tokens) > 1:
+            try:
+                self._game.set_opening_book(OpeningBook(' '.join(tokens[1:])))
+            except (OSError, ValueError):
+                self.send('info string cannot open book ' + ' '.join(tokens[1:]))
+        elif words[:1] == ['memoryfile'] and len(tokens) > 1:
+            self.stop_search()
+            self._memory_path = ' '.join(tokens[1:])
+            if os.path.exists(self._memory_path):
+                try:
+                    self._searcher.load_memory(self._memory_path)
+                except (OSError, ValueError):
+                    self.send('info string cannot load memory file ' + self._memory_path)
+        elif words[:1] == ['clearhash'] or ('clear' in words and 'hash' in words):
+            self._searcher.clear()
+
+    def save_memory(self):
+        """Saves the search tables to the memory file set with 'setoption memoryfile', if any."""
+        if self._memory_path is None:
+            return
+        try:
+            self._searcher.save_memory(self._memory_path)
+        except OSError:
+            self.send('info string cannot save memory file ' + self._memory_path)
+
+    def set_position(self, tokens):
+        """Handles 'position {fen <fen> | startpos} [moves <move> ...]'. Moves are replayed with
+        make_move; replaying stops at the first move make_move rejects."""
+        game = XiangqiGame()
+        if 'moves' in tokens:
+            moves = tokens[tokens.index('moves') + 1:]
+            tokens = tokens[:tokens.index('moves')]
+        else:
+            moves = []
+        if tokens and tokens[0] == 'fen':
+            try:
+                game.set_fen(' '.join(tokens[1:]))
+            except ValueError:
+                self.send('info string invalid fen')
+                return
+        for iccs in moves:
+            try:
+                move = iccs_to_move(iccs)
+            except ValueError:
+                self.send('info string invalid move ' + iccs)
+                break
+            if not game.make_move(coordinates_to_square(move[0], move[1]),
+                                  coordinates_to_square(move[2], move[3])):
+                self.send('info string illegal move ' + iccs)
+                break
+        game.set_opening_book(self._game.get_opening_book())
+        self._game = game
+
+    def go(self, tokens):
+        """Handles go: works out the search limits and starts the search on a worker thread."""
+        options = {}
+        num = 0
+        while num < len(tokens):
+            if num + 1 < len(tokens) and tokens[num + 1].lstrip('-').isdigit():
+                options[tokens[num]] = int(tokens[num + 1])
+                num += 2
+            else:
+                options[tokens[num]] = None
+                num += 1
+
+        max_depth = options.get('depth') or 64
+        node_limit = options.get('nodes')
+        time_limit = None
+        time_manager = None
+        if options.get('movetime') is not None:
+            time_limit = options['movetime'] / 1000
+        else:
+            red = self._game.get_turn() == 'red'
+            remaining = options.get('time', options.get('wtime' if red else 'btime'))
+            increment = options.get('increment', options.get('winc' if red else 'binc')) or 0
+            if remaining is not None:
+                time_manager = TimeManager(remaining / 1000, increment / 1000,
+                                           options.get('movestogo'))
+        if 'infinite' in options:
+            max_depth = 64
+            time_limit = None
+            time_manager = None
+        ponder = 'ponder' in options
+
+        # an infinite search, like a ponder search, may only report its move once stopped
+        self._infinite = 'infinite' in options
+        if ponder or self._infinite:
+            self._ponder_done.clear()
+        else:
+            self._ponder_done.set()
+        self._searcher.prepare_search(ponder)
+        self._search_thread = threading.Thread(
+            target=self._search,
+            args=(self._game, max_depth, time_limit, node_limit, time_manager, ponder),
+            daemon=True)
+        self._search_thread.start()
+
+    def _search(self, game, max_depth, time_limit, node_limit, time_manager, ponder):
+        """Runs on the worker thread: searches and reports the best move. A ponder search only
+        reports once it has been turned into a normal search or stopped, and an infinite search
+        once it has been stopped."""
+
+        def report(depth, score, nodes, seconds, variation):
+            self.send('info depth %d score %d nodes %d time %d pv %s' % (
+                depth, score, nodes, int(seconds * 1000),
+                ' '.join(move_to_iccs(move) for move in variation)))
+
+        if game.get_game_state() != 'UNFINISHED':
+            self._ponder_done.wait()
+            self.send('nobestmove')
+            return
+        best_move, score, depth = self._searcher.search(game, max_depth, time_limit, node_limit,
+                                                        info_callback=report,
+                                                        time_manager=time_manager, ponder=ponder)
+        self._ponder_done.wait()
+        if best_move is None:
+            self.send('nobestmove')
+            return
+        reply = self._searcher.get_ponder_move()
+        if reply is None:
+            self.send('bestmove ' + move_to_iccs(best_move))
+        else:
+            self.send('bestmove %s ponder %s' % (move_to_iccs(best_move), move_to_iccs(reply)))
+
+    def stop_search(self):
+        """Stops a running search and waits for it to report its best move."""
+        if self._search_thread is not None:
+            self._searcher.stop()
+            self._ponder_done.set()
+            self._search_thread.join()
+            self._search_thread = None
+
+
+if __name__ == '__main__':
+    UcciEngine().run()
@@ -0,0 +1,277 @@
+# Description: A tree of variations for analysing XiangqiGame games. Each node holds one move and a
+# pointer to its parent, so variations which start the same way share the nodes of their common
+# moves instead of each keeping a whole XiangqiGame. Nodes are numbered from 0 (the starting
+# position) and kept in parallel arrays, which keeps large trees small (about 18 bytes a node) and
+# makes navigation - jumping to a node, its parent, first child, next sibling or the mainline -
+# constant time per step.
+#
+# Positions are not stored with the nodes. get_game rebuilds a node's position by replaying the
+# moves from the nearest ancestor whose PositionSnapshot is cached. Snapshots are cached for the
+# nodes asked for and every checkpoint_interval plies along the way, in a cache of at most
+# max_snapshots entries from which the least recently used snapshot is evicted.
+#
+# The first child of a node is its mainline continuation; later children are variations.
+
+from array import array
+from collections import OrderedDict
+
+from XiangqiGame import XiangqiGame, coordinates_to_square
+
+NO_NODE = -1
+ROOT = 0
+
+
+class VariationTree:
+    """Holds the variations from a starting position (START_FEN, or fen) and a current node which
+    can be moved around the tree. Moves are (from_row, from_column, to_row, to_column) list
+    coordinates like those returned by get_legal_moves."""
+
+    def __init__(self, fen=None, max_snapshots=4096, checkpoint_interval=8):
+        game = XiangqiGame()
+        if fen is not None:
+            game.set_fen(fen)
+        self._template = game
+        self._root_snapshot = game.get_snapshot()
+        self._parent = array('i', [NO_NODE])
+        self._first_child = array('i', [NO_NODE])
+        self._next_sibling = array('i', [NO_NODE])
+        self._move = array('H', [0])          # from square * 90 + to square
+        self._depth = array('I', [0])
+        self._comments = {}
+        self._snapshots = OrderedDict()
+        self._max_snapshots = max_snapshots
+        self._checkpoint_interval = checkpoint_interval
+        self._current = ROOT
+
+    def __len__(self):
+        return len(self._parent)
+
+    def get_num_nodes(self):
+        """Returns the number of nodes, including the root."""
+        return len(self._parent)
+
+    def get_root(self):
+        """Returns the root node, which stands for the starting position."""
+        return ROOT
+
+    def get_parent(self, node):
+        """Returns the parent of node, or NO_NODE for the root."""
+        return self._parent[node]
+
+    def get_first_child(self, node):
+        """Returns the mainline continuation of node, or NO_NODE if it has no children."""
+        return self._first_child[node]
+
+    def get_next_sibling(self, node):
+        """Returns the next variation from node's parent, or NO_NODE if node is the last one."""
+        return self._next_sibling[node]
+
+    def get_children(self, node):
+        """Yields the children of node, the mainline continuation first."""
+        child = self._first_child[node]
+        while child != NO_NODE:
+            yield child
+            child = self._next_sibling[child]
+
+    def get_move(self, node):
+        """Returns the move which leads to node, or None for the root."""
+        if node == ROOT:
+            return None
+        from_index, to_index = divmod(self._move[node], 90)
+        return from_index // 9, from_index % 9, to_index // 9, to_index % 9
+
+    def get_depth(self, node):
+        """Returns the number of moves from the root to node."""
+        return self._depth[node]
+
+    def get_comment(self, node):
+        """Returns the comment of node, or None."""
+        return self._comments.get(node)
+
+    def set_comment(self, node, comment):
+        """Sets the comment of node. A comment of None removes it."""
+        if comment is None:
+            self._comments.pop(node, None)
+        else:
+            self._comments[node] = comment
+
+    def get_path(self, node):
+        """Returns the nodes from the root's child down to node, in order."""
+        path = []
+        while node != ROOT:
+            path.append(node)
+            node = self._parent[node]
+        path.reverse()
+        return path
+
+    def get_moves(self, node):
+        """Returns the moves from the starting position to node, in order."""
+        return [self.get_move(step) for step in self.get_path(node)]
+
+    def get_mainline(self, node=ROOT):
+        """Returns the nodes of the mainline continuation after node, following first children."""
+        line = []
+        node = self._first_child[node]
+        while node != NO_NODE:
+            line.append(node)
+            node = self._first_child[node]
+        return line
+
+    def is_mainline(self, node):
+        """Returns True if every node from the root to node is its parent's first child."""
+        while node != ROOT:
+            parent = self._parent[node]
+            if self._first_child[parent] != node:
+                return False
+            node = parent
+        return True
+
+    def find_child(self, node, move):
+        """Returns the child of node reached by move, or NO_NODE."""
+        code = _encode_move(move)
+        child = self._first_child[node]
+        while child != NO_NODE:
+            if self._move[child] == code:
+                return child
+            child = self._next_sibling[child]
+        return NO_NODE
+
+    def add_move(self, node, move, validate=True):
+        """Adds move as a child of node and returns the child. If node already has a child with
+        that move it is returned instead, so variations share their common moves. The new child
+        becomes the mainline if node had no children, otherwise its last variation. With validate
+        the move is checked with make_move on node's position and ValueError is raised if it is
+        rejected; bulk loaders of trusted moves can skip that."""
+        child = self.find_child(node, move)
+        if child != NO_NODE:
+            return child
+        if validate:
+            game = self.get_game(node)
+            if not game.make_move(coordinates_to_square(move[0], move[1]),
+                                  coordinates_to_square(move[2], move[3])):
+                raise ValueError('Illegal move in variation: ' + str(move))
+
+        child = len(self._parent)
+        self._parent.append(node)
+        self._first_child.append(NO_NODE)
+        self._next_sibling.append(NO_NODE)
+        self._move.append(_encode_move(move))
+        self._depth.append(self._depth[node] + 1)
+
+        # adds the child at the end of node's children
+        if self._first_child[node] == NO_NODE:
+            self._first_child[node] = child
+        else:
+            last = self._first_child[node]
+            while self._next_sibling[last] != NO_NODE:
+                last = self._next_sibling[last]
+            self._next_sibling[last] = child
+
+        if validate:
+            self._store_snapshot(child, game.get_snapshot())
+        return child
+
+    def add_line(self, node, moves, validate=True):
+        """Adds a sequence of moves starting from node and returns the last node reached."""
+        for move in moves:
+            node = self.add_move(node, move, validate)
+        return node
+
+    def promote(self, node):
+        """Makes node its parent's first child, so its variation becomes the mainline from there."""
+        parent = self._parent[node]
+        if parent == NO_NODE or self._first_child[parent] == node:
+            return
+        previous = self._first_child[parent]
+        while self._next_sibling[previous] != node:
+            previous = self._next_sibling[previous]
+        self._next_sibling[previous] = self._next_sibling[node]
+        self._next_sibling[node] = self._first_child[parent]
+        self._first_child[parent] = node
+
+    def get_current(self):
+        """Returns the current node."""
+        return self._current
+
+    def jump(self, node):
+        """Makes node the current node."""
+        if node < 0 or node >= len(self._parent):
+            raise ValueError('No such node: ' + str(node))
+        self._current = node
+
+    def forward(self):
+        """Moves the current node to its mainline continuation. Returns False at the end of a
+        line."""
+        child = self._first_child[self._current]
+        if child == NO_NODE:
+            return False
+        self._current = child
+        return True
+
+    def back(self):
+        """Moves the current node to its parent. Returns False at the root."""
+        if self._current == ROOT:
+            return False
+        self._current = self._parent[self._current]
+        return True
+
+    def next_variation(self):
+        """Moves the current node to its next sibling. Returns False if there is none."""
+        sibling = self._next_sibling[self._current]
+        if sibling == NO_NODE:
+            return False
+        self._current = sibling
+        return True
+
+    def play(self, move):
+        """Adds move after the current node, checked with make_move, and makes it the current
+        node."""
+        self._current = self.add_move(self._current, move)
+        return self._current
+
+    def get_game(self, node=None):
+        """Returns a new XiangqiGame in the position at node (the current node if None), replayed
+        from the nearest cached snapshot. Raises ValueError if a move added without validation is
+        rejected by make_move."""
+        if node is None:
+            node = self._current
+        target = node
+        path = []
+        snapshot = None
+        while node != ROOT:
+            snapshot = self._snapshots.get(node)
+            if snapshot is not None:
+                self._snapshots.move_to_end(node)
+                break
+            path.append(node)
+            node = self._parent[node]
+        if snapshot is None:
+            snapshot = self._root_snapshot
+
+        game = self._template.clone()
+        game.restore_snapshot(snapshot)
+        for node in reversed(path):
+            move = self.get_move(node)
+            if not game.make_move(coordinates_to_square(move[0], move[1]),
+                                  coordinates_to_square(move[2], move[3])):
+                raise ValueError('Illegal move in variation: ' + str(move))
+            if node == target or self._depth[node] % self._checkpoint_interval == 0:
+                self._store_snapshot(node, game.get_snapshot())
+        return game
+
+    def _store_snapshot(self, node, snapshot):
+        """Caches the snapshot of node, evicting the least recently used one if the cache is
+        full."""
+        self._snapshots[node] = snapshot
+        self._snapshots.move_to_end(node)
+        if len(self._snapshots) > self._max_snapshots:
+            self._snapshots.popitem(last=False)
+
+    def get_num_snapshots(self):
+        """Returns the number of cached snapshots."""
+        return len(self._snapshots)
+
+
+def _encode_move(move):
+    """Packs a move into one number: from square * 90 + to square."""
+    return (move[0] * 9 + move[1]) * 90 + move[2] * 9 + move[3]
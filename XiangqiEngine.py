@@ -0,0 +1,640 @@
+# Description: A move search for XiangqiGame. Searcher runs an iterative deepening alpha-beta
+# (negamax) search with a transposition table, killer moves, a history table and a countermove
+# table for move ordering. Moves are generated with XiangqiGame's get_legal_moves, so the search
+# plays by exactly the same rules as make_move. A search can be limited by depth, time or nodes and
+# stopped from another thread with stop. The history and countermove tables and the deepest
+# transposition table entries can be saved to a SearchMemory file and loaded by a later process.
+
+import heapq
+import threading
+import time
+
+from SearchMemory import MAX_HISTORY, SearchMemory, write_search_memory
+from XiangqiGame import ZOBRIST_KEYS, ZOBRIST_BLACK_TO_MOVE, coordinates_to_square, \
+    square_to_coordinates
+
+MATE_SCORE = 30000
+MATE_BOUND = MATE_SCORE - 1000      # scores beyond this are mates, at MATE_SCORE - their distance
+INFINITY = 32000
+PIECE_VALUES = {'K': 0, 'G': 20, 'E': 20, 'H': 40, 'T': 90, 'C': 45, 'S': 10}
+CROSSED_SOLDIER_BONUS = 10      # a soldier across the river can also move sideways
+
+# time management
+MOVES_TO_GO = 30                # moves assumed to be left on the clock when not given
+MAXIMUM_TIME_FACTOR = 4         # the most time for a move, as a multiple of the optimum time
+STABLE_TIME_SCALE = 0.5         # share of the optimum time used when the best move is stable
+SCORE_DROP_MARGIN = 30          # score drop at a new depth which marks an unstable position
+
+# transposition table entry flags
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+
+# search memory files (see save_memory)
+MEMORY_TT_ENTRIES = 65536       # transposition table entries saved, the deepest first
+MEMORY_HISTORY_SHIFT = 1        # loaded history scores are halved, so new games soon outweigh them
+
+
+class SearchStopped(Exception):
+    """Raised inside the search when it has to stop before finishing a depth."""
+    pass
+
+
+class TimeManager:
+    """Decides how long to think about a move from the player's remaining clock time and
+    increment (in seconds). The search aims for an optimum time, which it shortens when the best
+    move has stayed the same for several depths and lengthens when the best move keeps changing
+    or the score drops, but never passes a hard maximum."""
+
+    def __init__(self, remaining, increment=0, moves_to_go=None, move_overhead=0.05):
+        if not moves_to_go:
+            moves_to_go = MOVES_TO_GO
+        remaining = max(remaining - move_overhead, 0.001)
+        self._optimum = min(remaining / moves_to_go + increment * 0.8, remaining * 0.5)
+        self._maximum = min(self._optimum * MAXIMUM_TIME_FACTOR, remaining * 0.8)
+        self._optimum = max(self._optimum, 0.001)
+        self._maximum = max(self._maximum, self._optimum)
+        self._start_time = time.monotonic()
+
+    def start(self):
+        """Starts counting the time for the move from now."""
+        self._start_time = time.monotonic()
+
+    def get_optimum(self):
+        """Returns the time, in seconds, normally spent on the move."""
+        return self._optimum
+
+    def get_maximum(self):
+        """Returns the most time, in seconds, that may be spent on the move."""
+        return self._maximum
+
+    def get_deadline(self):
+        """Returns the time.monotonic() value at which the search must stop."""
+        return self._start_time + self._maximum
+
+    def elapsed(self):
+        """Returns the seconds spent on the move so far."""
+        return time.monotonic() - self._start_time
+
+    def continue_iterating(self, best_move_changes, score_drop):
+        """Called after every completed depth with the decaying count of recent best move changes
+        and how much the score fell at that depth. Returns True if another depth should be
+        started."""
+        scale = 1.0
+        if best_move_changes < 0.2:
+            scale = STABLE_TIME_SCALE       # the same best move for several depths
+        else:
+            scale += best_move_changes
+        if score_drop > SCORE_DROP_MARGIN:
+            scale *= 1.5
+        target = min(self._optimum * scale, self._maximum)
+        # the next depth usually takes several times longer than all the depths before it, so
+        # do not start one that is unlikely to finish
+        return self.elapsed() < target * 0.5
+
+
+class TranspositionTable:
+    """Stores search results by position key in a dictionary, which is emptied when it reaches
+    size entries."""
+
+    def __init__(self, size=1000000):
+        self._entries = {}
+        self._size = size
+
+    def get(self, key):
+        """Returns the (depth, score, flag, best move) stored for a position key, or None."""
+        return self._entries.get(key)
+
+    def store(self, key, depth, score, flag, move):
+        """Stores a search result for a position key."""
+        if len(self._entries) >= self._size:
+            self._entries = {}
+        self._entries[key] = (depth, score, flag, move)
+
+    def clear(self):
+        """Removes every entry."""
+        self._entries = {}
+
+    def items(self):
+        """Returns the (key, (depth, score, flag, best move)) entries."""
+        return self._entries.items()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Searcher:
+    """Searches XiangqiGame positions for the best move. The transposition table, history and
+    countermove tables are kept between searches, so consecutive searches of related positions
+    start warm, and save_memory and load_memory carry them over to later games and processes. A
+    Searcher runs one search at a time."""
+
+    def __init__(self, tt_size=1000000, tt=None, stop_event=None):
+        # position key -> (depth, score, flag, best move); any object with the
+        # TranspositionTable methods can be shared in through tt
+        self._tt = tt if tt is not None else TranspositionTable(tt_size)
+        self._external_stop = stop_event    # an extra Event, set by the owner to stop the search
+        self._history = {}          # (piece, to_row, to_column) -> history score
+        self._killers = {}          # ply -> list of up to two moves which caused cut-offs
+        # (piece, to_row, to_column) of a move -> the reply which last caused a cut-off after it
+        self._countermoves = {}
+        self._move_stack = []       # (piece, to_row, to_column) of the moves made in the search
+        self._stop_event = threading.Event()
+        self._nodes = 0
+        self._node_limit = None
+        self._time_limit = None
+        self._time_manager = None
+        self._pondering = False
+        self._ponder_state = None       # None, 'pending', 'hit' or 'pondering'
+        self._ponder_lock = threading.Lock()
+        self._pending_time_manager = None
+        self._prepared = False          # True once prepare_search has run for the next search
+        self._deadline = None
+        self._variation = []        # principal variation of the last completed depth
+        self._game = None
+        self._key = 0
+        self._stalemate_draws = False
+
+    def stop(self):
+        """Asks a running search to stop as soon as possible. Safe to call from another thread."""
+        self._stop_event.set()
+
+    def get_nodes(self):
+        """Returns the number of nodes searched by the current or last search."""
+        return self._nodes
+
+    def clear(self):
+        """Empties the transposition table, killer moves, history and countermove tables."""
+        self._tt.clear()
+        self._history = {}
+        self._killers = {}
+        self._countermoves = {}
+
+    def save_memory(self, path, tt_entries=MEMORY_TT_ENTRIES):
+        """Writes the history and countermove tables and up to tt_entries of the deepest
+        transposition table entries (none if 0, or if the table cannot list its entries) to a
+        search memory file for load_memory. Must not be called during a search."""
+        entries = []
+        if tt_entries and hasattr(self._tt, 'items'):
+            entries = heapq.nlargest(tt_entries, self._tt.items(), key=lambda entry: entry[1][0])
+        write_search_memory(path, self._history, self._countermoves, entries)
+
+    def load_memory(self, path, load_tt=True):
+        """Reads a file written by save_memory. Its history scores, scaled down, replace the
+        history table, its countermoves are added to the countermove table and, with load_tt, its
+        transposition table entries are stored in the table. Raises OSError if the file cannot
+        be read and ValueError if it is not a search memory file. Must not be called during a
+        search."""
+        with SearchMemory(path) as memory:
+            self._history = memory.get_history(MEMORY_HISTORY_SHIFT)
+            self._countermoves.update(memory.get_countermoves())
+            if load_tt:
+                for key, depth, score, flag, move in memory.get_tt_entries():
+                    self._tt.store(key, depth, score, flag, move)
+
+    def search(self, game, max_depth=64, time_limit=None, node_limit=None, root_moves=None,
+               use_book=True, info_callback=None, time_manager=None, ponder=False):
+        """Takes a XiangqiGame and searches the position of the player whose turn it is. Searches
+        to max_depth plies, or until time_limit seconds or node_limit nodes have been used, or
+        the time_manager (a TimeManager) decides to stop, or stop is called. root_moves
+        optionally restricts, and orders, the moves searched at the root. If use_book is True
+        and the game's opening book has a move it is returned without searching. info_callback,
+        if given, is called after every completed depth with (depth, score, nodes, seconds,
+        principal variation).
+
+        With ponder True the search runs without a time limit, as when thinking on the
+        opponent's time, until ponder_hit is called; time_limit and time_manager then apply
+        from that moment.
+
+        When the search runs on its own thread, call prepare_search first from the thread that
+        starts it, so that a stop or ponder_hit arriving before the search begins is not lost.
+
+        Returns (best_move, score, depth), where best_move is (from_row, from_column, to_row,
+        to_column) or None if there are no legal moves, score is in centipawn-like units from the
+        point of view of the player to move and depth is the last completed depth."""
+
+        with self._ponder_lock:
+            if not self._prepared:
+                self._stop_event.clear()
+                self._ponder_state = 'pending' if ponder else None
+            self._prepared = False
+        self._nodes = 0
+        self._node_limit = node_limit
+        self._variation = []
+        self._killers = {}
+        start_time = time.monotonic()
+        with self._ponder_lock:
+            self._time_limit = time_limit
+            self._time_manager = time_manager
+            self._deadline = None
+            if ponder and self._ponder_state == 'hit':
+                # ponder_hit came before the search started
+                if self._pending_time_manager is not None:
+                    self._time_manager = self._pending_time_manager
+                ponder = False
+            self._pondering = ponder
+            self._ponder_state = 'pondering' if ponder else None
+            if not ponder:
+                self._start_clock()
+        try:
+            return self._iterate(game, max_depth, root_moves, use_book, info_callback,
+                                 start_time)
+        finally:
+            with self._ponder_lock:
+                self._pondering = False
+                self._ponder_state = None
+
+    def _iterate(self, game, max_depth, root_moves, use_book, info_callback, start_time):
+        """Runs the iterative deepening loop of search and returns its result."""
+
+        if use_book:
+            book_move = game.get_book_move()
+            if book_move is not None:
+                return tuple(square_to_coordinates(book_move[0]) +
+                             square_to_coordinates(book_move[1])), 0, 0
+
+        self._game = game.clone()
+        self._game.set_opening_book(None)
+        self._key = self._game.get_position_key()
+        self._move_stack = []
+        # a player without legal moves scores 0 instead of being mated if the game's rules make
+        # stalemate a draw; other house rules' adjudicators are not searched
+        self._stalemate_draws = self._game.get_rules().stalemate == 'draw'
+
+        moves = self._game.get_legal_moves(self._game.get_turn())
+        if root_moves is not None:
+            # keeps the caller's order, which decides the order the root moves are searched in
+            moves = [move for move in root_moves if move in moves]
+        if not moves:
+            return None, -MATE_SCORE, 0
+
+        best_move = moves[0]
+        best_score = -INFINITY
+        completed_depth = 0
+        best_move_changes = 0.0     # decaying count of iterations which changed the best move
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._search_root(moves, depth)
+            except SearchStopped:
+                break
+            best_move_changes /= 2
+            if completed_depth > 0 and move != best_move:
+                best_move_changes += 1
+            score_drop = best_score - score if completed_depth > 0 else 0
+            best_move = move
+            best_score = score
+            completed_depth = depth
+            # searches the best move first at the next depth
+            moves.remove(move)
+            moves.insert(0, move)
+            self._variation = self.get_principal_variation(depth)
+            if info_callback is not None:
+                info_callback(depth, score, self._nodes, time.monotonic() - start_time,
+                              self._variation)
+            if abs(score) >= MATE_SCORE - depth:
+                break           # a forced mate has been found
+            if self._pondering:
+                continue
+            if self._time_manager is not None and \
+                    not self._time_manager.continue_iterating(best_move_changes, score_drop):
+                break
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                break
+        return best_move, best_score, completed_depth
+
+    def prepare_search(self, ponder=False):
+        """Readies the Searcher for a search about to be started on another thread, with ponder
+        matching the search's own argument. A stop or ponder_hit made after this call applies to
+        that search even if it has not begun yet."""
+        with self._ponder_lock:
+            self._stop_event.clear()
+            self._prepared = True
+            self._ponder_state = 'pending' if ponder else None
+            self._pending_time_manager = None
+
+    def ponder_hit(self, time_manager=None):
+        """Turns a ponder search into a normal search: its time limit, or time_manager (which
+        replaces the one given to search if not None), starts counting now. Safe to call from
+        another thread."""
+        with self._ponder_lock:
+            if self._ponder_state == 'pending':
+                self._ponder_state = 'hit'
+                self._pending_time_manager = time_manager
+            elif self._ponder_state == 'pondering':
+                if time_manager is not None:
+                    self._time_manager = time_manager
+                self._start_clock()
+                self._pondering = False
+                self._ponder_state = None
+
+    def get_ponder_move(self):
+        """Returns the opponent's reply expected after the best move of the last completed depth,
+        or None if it is not known."""
+        if len(self._variation) > 1:
+            return self._variation[1]
+        return None
+
+    def _start_clock(self):
+        """Starts counting the search's time limit and time manager from now."""
+        if self._time_manager is not None:
+            self._time_manager.start()
+            self._deadline = self._time_manager.get_deadline()
+        elif self._time_limit is not None:
+            self._deadline = time.monotonic() + self._time_limit
+
+    def get_principal_variation(self, depth):
+        """Returns up to depth moves of the expected line of play from the searched position,
+        read back from the transposition table."""
+        variation = []
+        undo = []
+        for num in range(depth):
+            entry = self._tt.get(self._key)
+            if entry is None or entry[3] is None:
+                break
+            move = entry[3]
+            if move not in self._game.get_legal_moves(self._game.get_turn()):
+                break
+            variation.append(move)
+            undo.append((move, self._do_move(move)))
+        for move, captured in reversed(undo):
+            self._undo_move(move, captured)
+        return variation
+
+    def _check_limits(self):
+        """Raises SearchStopped if the search has been stopped or has used up its budget."""
+        if self._stop_event.is_set():
+            raise SearchStopped()
+        if self._external_stop is not None and self._external_stop.is_set():
+            raise SearchStopped()
+        if self._node_limit is not None and self._nodes >= self._node_limit:
+            raise SearchStopped()
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            raise SearchStopped()
+
+    def _in_check(self):
+        """Returns True if the player to move on the search's board is in check."""
+        game = self._game
+        if game.get_turn() == 'red':
+            row, column = game.get_rk_position()
+            return game.square_attacked(row, column, 'black')
+        row, column = game.get_bk_position()
+        return game.square_attacked(row, column, 'red')
+
+    def _do_move(self, move):
+        """Makes a move on the search's board, updating the General positions, the file
+        occupancy masks, the turn and the position key. Returns the captured piece string ('--'
+        if none)."""
+        from_row, from_column, to_row, to_column = move
+        board = self._game.get_board()
+        piece = board[from_row][from_column]
+        captured = board[to_row][to_column]
+        board[to_row][to_column] = piece
+        board[from_row][from_column] = '--'
+        file_masks = self._game.get_file_occupancy()
+        file_masks[from_column] &= ~(1 << from_row)
+        file_masks[to_column] |= 1 << to_row
+        self._move_stack.append((piece, to_row, to_column))
+        if piece == 'rK':
+            self._game.set_rk_position(to_row, to_column)
+        elif piece == 'bK':
+            self._game.set_bk_position(to_row, to_column)
+        self._game.end_turn()
+        self._key ^= ZOBRIST_KEYS[piece][from_row * 9 + from_column] ^ \
+            ZOBRIST_KEYS[piece][to_row * 9 + to_column] ^ ZOBRIST_BLACK_TO_MOVE
+        if captured != '--':
+            self._key ^= ZOBRIST_KEYS[captured][to_row * 9 + to_column]
+        self._game.set_position_key(self._key)
+        return captured
+
+    def _undo_move(self, move, captured):
+        """Takes back a move made by _do_move."""
+        from_row, from_column, to_row, to_column = move
+        board = self._game.get_board()
+        piece = board[to_row][to_column]
+        board[from_row][from_column] = piece
+        board[to_row][to_column] = captured
+        file_masks = self._game.get_file_occupancy()
+        file_masks[from_column] |= 1 << from_row
+        if captured == '--':
+            file_masks[to_column] &= ~(1 << to_row)
+        self._move_stack.pop()
+        if piece == 'rK':
+            self._game.set_rk_position(from_row, from_column)
+        elif piece == 'bK':
+            self._game.set_bk_position(from_row, from_column)
+        self._game.end_turn()
+        self._key ^= ZOBRIST_KEYS[piece][from_row * 9 + from_column] ^ \
+            ZOBRIST_KEYS[piece][to_row * 9 + to_column] ^ ZOBRIST_BLACK_TO_MOVE
+        if captured != '--':
+            self._key ^= ZOBRIST_KEYS[captured][to_row * 9 + to_column]
+        self._game.set_position_key(self._key)
+
+    def _evaluate(self):
+        """Returns the material balance from the point of view of the player to move."""
+        score = 0
+        for row_num, row in enumerate(self._game.get_board()):
+            for piece in row:
+                if piece == '--':
+                    continue
+                value = PIECE_VALUES[piece[1]]
+                if piece[1] == 'S' and (row_num >= 5) == (piece[0] == 'r'):
+                    value += CROSSED_SOLDIER_BONUS
+                score += value if piece[0] == 'r' else -value
+        return score if self._game.get_turn() == 'red' else -score
+
+    def _order_moves(self, moves, tt_move, ply):
+        """Sorts moves so the transposition table move comes first, then captures of the most
+        valuable pieces, then killer moves, then the countermove of the previous move and then
+        moves with the best history scores."""
+        board = self._game.get_board()
+        killers = self._killers.get(ply, ())
+        countermove = None
+        if self._move_stack:
+            countermove = self._countermoves.get(self._move_stack[-1])
+
+        def move_order(move):
+            if move == tt_move:
+                return -1000000
+            target = board[move[2]][move[3]]
+            if target != '--':
+                return -100000 - PIECE_VALUES[target[1]] * 10 + \
+                    PIECE_VALUES[board[move[0]][move[1]][1]]
+            if move in killers:
+                return -50000
+            if move == countermove:
+                return -40000
+            return -self._history.get((board[move[0]][move[1]], move[2], move[3]), 0)
+
+        moves.sort(key=move_order)
+
+    def _store_cutoff(self, move, depth, ply):
+        """Records a quiet move which caused a beta cut-off in the killer, history and
+        countermove tables. History scores are halved whenever one passes MAX_HISTORY."""
+        board = self._game.get_board()
+        if board[move[2]][move[3]] != '--':
+            return
+        killers = self._killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        history_key = (board[move[0]][move[1]], move[2], move[3])
+        score = self._history.get(history_key, 0) + depth * depth
+        self._history[history_key] = score
+        if score > MAX_HISTORY:
+            # halves every score, which keeps their order but keeps them all below the scores
+            # _order_moves gives countermoves, killers and captures
+            self._history = {key: value >> 1 for key, value in self._history.items() if value > 1}
+        if self._move_stack:
+            self._countermoves[self._move_stack[-1]] = move
+
+    def _store_tt(self, depth, score, flag, move, ply):
+        """Stores a search result for the current position, ply plies from the root. Mate scores
+        count plies from the root, so they are stored as the distance from this position, which
+        is the same wherever in a search (or in which game) the position is reached again."""
+        if score > MATE_BOUND:
+            score += ply
+        elif score < -MATE_BOUND:
+            score -= ply
+        self._tt.store(self._key, depth, score, flag, move)
+
+    def _search_root(self, moves, depth):
+        """Searches every root move to depth and returns (best score, best move)."""
+        alpha = -INFINITY
+        best_move = moves[0]
+        for move in moves:
+            captured = self._do_move(move)
+            try:
+                score = -self._negamax(depth - 1, -INFINITY, -alpha, 1)
+            finally:
+                self._undo_move(move, captured)
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self._store_tt(depth, alpha, TT_EXACT, best_move, 0)
+        return alpha, best_move
+
+    def _negamax(self, depth, alpha, beta, ply):
+        """Returns the score of the current position searched to depth plies, from the point of
+        view of the player to move, within the (alpha, beta) window."""
+        self._nodes += 1
+        if self._nodes % 1024 == 0:
+            self._check_limits()
+        if depth <= 0:
+            return self._evaluate()
+
+        original_alpha = alpha
+        tt_move = None
+        entry = self._tt.get(self._key)
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, tt_move = entry
+            # turns a stored mate distance from the position back into one from the root
+            if entry_score > MATE_BOUND:
+                entry_score -= ply
+            elif entry_score < -MATE_BOUND:
+                entry_score += ply
+            if entry_depth >= depth:
+                if entry_flag == TT_EXACT:
+                    return entry_score
+                if entry_flag == TT_LOWER and entry_score >= beta:
+                    return entry_score
+                if entry_flag == TT_UPPER and entry_score <= alpha:
+                    return entry_score
+
+        moves = self._game.get_legal_moves(self._game.get_turn())
+        if not moves:
+            # no legal moves loses, whether in check or not, unless the rules make stalemate a draw
+            if self._stalemate_draws and not self._in_check():
+                return 0
+            return -MATE_SCORE + ply
+        self._order_moves(moves, tt_move, ply)
+
+        best_score = -INFINITY
+        best_move = None
+        for move in moves:
+            captured = self._do_move(move)
+            try:
+                score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                self._undo_move(move, captured)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self._store_cutoff(move, depth, ply)
+                break
+
+        if best_score <= original_alpha:
+            flag = TT_UPPER
+        elif best_score >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        self._store_tt(depth, best_score, flag, best_move, ply)
+        return best_score
+
+
+class EnginePlayer:
+    """Plays one side of a game with a Searcher, managing its clock and pondering. After each of
+    its moves it can search the position after the opponent's expected reply on a background
+    thread. If the opponent plays that reply, the background search simply continues as the
+    search for the next move (a ponder hit); otherwise it is stopped and a new search starts, still
+    using the transposition table the ponder search filled."""
+
+    def __init__(self, searcher=None, max_depth=64):
+        self._searcher = searcher if searcher is not None else Searcher()
+        self._max_depth = max_depth
+        self._ponder_thread = None
+        self._ponder_key = None         # position key of the position being pondered
+        self._ponder_result = None
+
+    def get_searcher(self):
+        """Returns the player's Searcher."""
+        return self._searcher
+
+    def choose_move(self, game, remaining, increment=0, moves_to_go=None):
+        """Takes a XiangqiGame and the player's remaining clock time and increment in seconds and
+        returns the (from_row, from_column, to_row, to_column) move to play, or None if there are
+        no legal moves."""
+        time_manager = TimeManager(remaining, increment, moves_to_go)
+        if self._ponder_thread is not None:
+            if self._ponder_key == game.get_position_key():
+                self._searcher.ponder_hit(time_manager)
+                self._ponder_thread.join()
+                self._ponder_thread = None
+                return self._ponder_result[0]
+            self.stop_pondering()
+        return self._searcher.search(game, self._max_depth, time_manager=time_manager)[0]
+
+    def start_pondering(self, game):
+        """Takes the XiangqiGame after the player's own move and starts searching, in the
+        background, the position after the opponent's expected reply. Returns False if there is no
+        expected reply to ponder on."""
+        self.stop_pondering()
+        reply = self._searcher.get_ponder_move()
+        if reply is None or game.get_game_state() != 'UNFINISHED':
+            return False
+        ponder_game = game.clone()
+        if not ponder_game.make_move(coordinates_to_square(reply[0], reply[1]),
+                                     coordinates_to_square(reply[2], reply[3])):
+            return False
+        if ponder_game.get_game_state() != 'UNFINISHED':
+            return False
+        self._ponder_key = ponder_game.get_position_key()
+        self._ponder_result = None
+
+        def ponder():
+            self._ponder_result = self._searcher.search(ponder_game, self._max_depth, ponder=True)
+
+        self._searcher.prepare_search(ponder=True)
+        self._ponder_thread = threading.Thread(target=ponder, daemon=True)
+        self._ponder_thread.start()
+        return True
+
+    def stop_pondering(self):
+        """Stops a background ponder search, if one is running."""
+        if self._ponder_thread is not None:
+            self._searcher.stop()
+            self._ponder_thread.join()
+            self._ponder_thread = None
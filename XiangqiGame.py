@@ -6,6 +6,169 @@
 # method which will allows for tracking piece movement. Classes are XiangqiGame, Piece, General,
 # Guard, Cannon, Soldier, Elephant, Chariot and Horse.
 
+import sys
+from collections import namedtuple
+
+
+def square_to_coordinates(square):
+    """Takes a square string such as 'e3' or 'i10' and returns the matching [row, column] list
+    coordinates of the board."""
+    return [int(square[1:]) - 1, 'ihgfedcba'.index(square[0])]
+
+
+def coordinates_to_square(row, column):
+    """Takes [row, column] list coordinates and returns the matching square string, such as 'e3',
+    in the notation accepted by make_move."""
+    return 'ihgfedcba'[column] + str(row + 1)
+
+
+def iccs_to_move(iccs):
+    """Takes a move in ICCS notation, such as 'h2e2', where files 'a' to 'i' match make_move's
+    letters and ranks run from 0 on red's back rank to 9, and returns the
+    (from_row, from_column, to_row, to_column) list coordinates of the move."""
+    iccs = iccs.lower()
+    if len(iccs) != 4 or iccs[0] not in 'abcdefghi' or iccs[2] not in 'abcdefghi' or \
+            not iccs[1].isdigit() or not iccs[3].isdigit():
+        raise ValueError('Invalid ICCS move: ' + iccs)
+    return (int(iccs[1]), 'ihgfedcba'.index(iccs[0]), int(iccs[3]), 'ihgfedcba'.index(iccs[2]))
+
+
+def move_to_iccs(move):
+    """Takes (from_row, from_column, to_row, to_column) list coordinates and returns the move in
+    ICCS notation."""
+    from_row, from_column, to_row, to_column = move
+    return 'ihgfedcba'[from_column] + str(from_row) + 'ihgfedcba'[to_column] + str(to_row)
+
+
+def candidate_squares(piece, row, column):
+    """Takes a piece string and its list coordinates and returns every on-board square the piece
+    could possibly reach. The piece's move method still decides which of them are valid; this only
+    avoids calling it for squares it could never reach."""
+    if piece[1] == 'T' or piece[1] == 'C':
+        # Chariots and Cannons can reach any square in their row or column
+        squares = [(row, num) for num in range(0, 9) if num != column]
+        squares += [(num, column) for num in range(0, 10) if num != row]
+        return squares
+    squares = []
+    for row_offset, column_offset in PIECE_OFFSETS[piece[1]]:
+        to_row = row + row_offset
+        to_column = column + column_offset
+        if 0 <= to_row <= 9 and 0 <= to_column <= 8:
+            squares.append((to_row, to_column))
+    return squares
+
+
+# offsets from the 'from square' for every square a short range piece could move to
+PIECE_OFFSETS = {
+    'K': ((1, 0), (-1, 0), (0, 1), (0, -1)),
+    'G': ((1, 1), (1, -1), (-1, 1), (-1, -1)),
+    'E': ((2, 2), (2, -2), (-2, 2), (-2, -2)),
+    'H': ((1, 2), (-1, 2), (1, -2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1)),
+    'S': ((1, 0), (-1, 0), (0, 1), (0, -1))
+}
+
+
+def _build_zobrist_keys():
+    """Returns a dictionary mapping every piece string to a list of 90 random 64 bit numbers, one
+    per square. A fixed seed keeps position keys the same across runs so they can be stored."""
+    import random
+    generator = random.Random(0x58696E67)
+    keys = {}
+    for piece in ['rK', 'rG', 'rE', 'rH', 'rT', 'rC', 'rS',
+                  'bK', 'bG', 'bE', 'bH', 'bT', 'bC', 'bS']:
+        keys[piece] = [generator.getrandbits(64) for num in range(90)]
+    return keys
+
+
+# random numbers XORed together to build position keys (Zobrist hashing)
+ZOBRIST_KEYS = _build_zobrist_keys()
+ZOBRIST_BLACK_TO_MOVE = 0x9D39247E33776D41
+
+# FEN piece letters (upper case red, lower case black) and the piece types they stand for
+FEN_PIECES = {'K': 'K', 'A': 'G', 'B': 'E', 'E': 'E', 'N': 'H', 'H': 'H', 'R': 'T', 'C': 'C',
+              'P': 'S'}
+PIECE_FEN = {'K': 'K', 'G': 'A', 'E': 'B', 'H': 'N', 'T': 'R', 'C': 'C', 'S': 'P'}
+START_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1'
+
+# the piece strings in the order of their byte codes in a PositionSnapshot's board
+SNAPSHOT_PIECES = ('--', 'rK', 'rG', 'rE', 'rH', 'rT', 'rC', 'rS',
+                   'bK', 'bG', 'bE', 'bH', 'bT', 'bC', 'bS')
+SNAPSHOT_CODES = {piece: code for code, piece in enumerate(SNAPSHOT_PIECES)}
+
+# the number of hint results (see attacked_squares) a game keeps before its cache is emptied
+HINT_CACHE_SIZE = 64
+
+
+def _between_mask(low_row, high_row):
+    """Returns the bits of the rows strictly between two rows of a file."""
+    low_row, high_row = min(low_row, high_row), max(low_row, high_row)
+    return ((1 << high_row) - 1) & ~((1 << (low_row + 1)) - 1)
+
+
+# BETWEEN_MASKS[red_row][black_row] has a bit set for every row between the two Generals' rows, so
+# the Generals face each other when their file's occupancy mask has none of those bits set
+BETWEEN_MASKS = [[_between_mask(red_row, black_row) for black_row in range(10)]
+                 for red_row in range(10)]
+
+# the game states set when red or black has no legal move, indexed by whether they are in check,
+# for each GameRules stalemate setting
+STALEMATE_RESULTS = {
+    'loses': (('BLACK_WON', 'BLACK_WON'), ('RED_WON', 'RED_WON')),
+    'draw': (('DRAW', 'BLACK_WON'), ('DRAW', 'RED_WON'))
+}
+
+
+class PositionSnapshot(namedtuple('PositionSnapshot', ['board', 'turn', 'red_king', 'black_king',
+                                                       'red_in_check', 'black_in_check',
+                                                       'game_state'])):
+    """An immutable, hashable copy of a game's position, made by XiangqiGame.get_snapshot. board
+    is 90 bytes, one SNAPSHOT_PIECES code per square in row * 9 + column order, and red_king and
+    black_king are the Generals' squares in the same numbering. Snapshots of equal positions are
+    equal, so they can be used as dictionary keys or stored in sets."""
+    __slots__ = ()
+
+
+class GameRules(namedtuple('GameRules', ['stalemate', 'insufficient_material', 'adjudicators',
+                                         'fen', 'piece_classes'],
+                           defaults=('loses', False, (), None, None))):
+    """House rules for a XiangqiGame, given when it is constructed. stalemate is 'loses' (a
+    player with no legal move loses, the standard rule of this game) or 'draw' (they draw unless
+    they are in check). With insufficient_material the game is drawn once neither side has a
+    Horse, Chariot, Cannon or Soldier left. adjudicators is a sequence of functions, each called
+    with the game after every move which leaves it unfinished, which return a game state to end
+    the game with or None. fen is the starting position for setup variants, such as handicap
+    games. piece_classes maps piece letters ('K', 'G', 'E', 'H', 'T', 'C', 'S') to Piece classes
+    which replace the standard ones. The game resolves all of these into tables and piece objects
+    when it is constructed, so a variant game makes its moves as fast as a standard one."""
+    __slots__ = ()
+
+    def is_standard(self):
+        """Returns True if games under these rules move and end like standard games, whatever
+        their starting position."""
+        return self.stalemate == 'loses' and not self.insufficient_material and \
+            not self.adjudicators and not self.piece_classes
+
+
+STANDARD_RULES = GameRules()
+
+
+def insufficient_material(game):
+    """An adjudicator which returns 'DRAW' if neither side has a Horse, Chariot, Cannon or Soldier
+    left, so neither can mate, otherwise None."""
+    for row in game.get_board():
+        for piece in row:
+            if piece[1] in 'HTCS':
+                return None
+    return 'DRAW'
+
+
+class MoveEvent(namedtuple('MoveEvent', ['from_square', 'to_square', 'piece', 'captured',
+                                         'red_in_check', 'black_in_check', 'game_state'])):
+    """What a XiangqiGame passes to its move listeners after every accepted move: the move's
+    squares in make_move's notation, the piece moved, the piece captured ('--' if none), the check
+    flags and the game state after the move."""
+    __slots__ = ()
+
 
 class XiangqiGame:
     """Contains a data member for the current player's turn, the game state, whether Red is in check
@@ -13,28 +176,37 @@ class XiangqiGame:
     piece data members which make up all of the game pieces and two data members for tracking the
     location of bK and rK (black General/King and red General/King). There are getter and setter
     methods, an is_in_check method, a move method, a self_in_check method, an opponent_in_check
-    method and a display_board method."""
-
-    def __init__(self):
+    method, a get_legal_moves method, clone, get_snapshot and restore_snapshot methods, hint
+    methods (attacked_squares, hanging_pieces, checking_moves and captures), move listeners which
+    are sent a MoveEvent for every accepted move, file occupancy masks which make the Generals
+    facing test (are_generals_facing, move_faces_generals) constant time and a display_board
+    method. A GameRules object may be given to play by house rules."""
+
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = STANDARD_RULES
+        self._apply_rules(rules)
+        pieces = dict(STANDARD_PIECES)
+        pieces.update(rules.piece_classes or {})
         self._turn = 'red'
         self._game_state = 'UNFINISHED'
         self._red_in_check = False
         self._black_in_check = False
         self._board = [['--'] * 9 for num in range(10)]
-        self._black_general = General('black')  #
-        self._red_general = General('red')  #
-        self._black_guard = Guard('black')  #
-        self._red_guard = Guard('red')
-        self._black_cannon = Cannon('black')
-        self._red_cannon = Cannon('red')
-        self._black_soldier = Soldier("black")
-        self._red_soldier = Soldier('red')
-        self._black_elephant = Elephant('black')
-        self._red_elephant = Elephant('red')
-        self._black_chariot = Chariot('black')
-        self._red_chariot = Chariot('red')
-        self._black_horse = Horse('black')
-        self._red_horse = Horse('red')
+        self._black_general = pieces['K']('black')
+        self._red_general = pieces['K']('red')
+        self._black_guard = pieces['G']('black')
+        self._red_guard = pieces['G']('red')
+        self._black_cannon = pieces['C']('black')
+        self._red_cannon = pieces['C']('red')
+        self._black_soldier = pieces['S']('black')
+        self._red_soldier = pieces['S']('red')
+        self._black_elephant = pieces['E']('black')
+        self._red_elephant = pieces['E']('red')
+        self._black_chariot = pieces['T']('black')
+        self._red_chariot = pieces['T']('red')
+        self._black_horse = pieces['H']('black')
+        self._red_horse = pieces['H']('red')
 
         self._board[9][4] = self._black_general.get_piece()
         self._board[9][3] = self._board[9][5] = self._black_guard.get_piece()
@@ -55,6 +227,54 @@ class XiangqiGame:
             self._board[3][8] = self._red_soldier.get_piece()
         self._bK_position = [9, 4]
         self._rK_position = [0, 4]
+        self._file_masks = self._build_file_masks()
+        self._position_key = self._build_position_key()
+        self._opening_book = None
+        self._hint_cache = {}
+        self._move_listeners = []
+
+        self._obj_dictionary = self._build_obj_dictionary()
+        if rules.fen is not None:
+            self.set_fen(rules.fen)
+
+    def _apply_rules(self, rules):
+        """Checks a GameRules object and resolves it into the tables and functions make_move
+        uses. Raises ValueError for an unknown setting."""
+        if rules.stalemate not in STALEMATE_RESULTS:
+            raise ValueError('Unknown stalemate rule: ' + str(rules.stalemate))
+        for letter in rules.piece_classes or {}:
+            if letter not in STANDARD_PIECES:
+                raise ValueError('Unknown piece letter: ' + str(letter))
+        adjudicators = tuple(rules.adjudicators)
+        if rules.insufficient_material:
+            adjudicators = (insufficient_material,) + adjudicators
+        self._rules = rules
+        self._stalemate_results = STALEMATE_RESULTS[rules.stalemate]
+        self._adjudicators = adjudicators
+
+    def get_rules(self):
+        """Returns the GameRules the game is played by."""
+        return self._rules
+
+    def _build_obj_dictionary(self):
+        """Returns a dictionary mapping the piece strings on the board to the piece objects which
+        validate their moves."""
+        return {
+            'rK': self._red_general,
+            'bK': self._black_general,
+            'rG': self._red_guard,
+            'bG': self._black_guard,
+            'rE': self._red_elephant,
+            'bE': self._black_elephant,
+            'rH': self._red_horse,
+            'bH': self._black_horse,
+            'rT': self._red_chariot,
+            'bT': self._black_chariot,
+            'rC': self._red_cannon,
+            'bC': self._black_cannon,
+            'rS': self._red_soldier,
+            'bS': self._black_soldier
+        }
 
     def get_turn(self):
         """Returns XiangqiGame's turn data member."""
@@ -64,6 +284,201 @@ class XiangqiGame:
         """Returns XiangqiGame's game_state data member."""
         return self._game_state
 
+    def get_board(self):
+        """Returns XiangqiGame's board data member."""
+        return self._board
+
+    def get_position_key(self):
+        """Returns a 64 bit integer identifying the position: the pieces on the board and the
+        player whose turn it is. Equal positions always have equal keys. The key is kept up to
+        date by make_move, so this takes constant time."""
+        return self._position_key
+
+    def set_position_key(self, key):
+        """Sets the position key. Code which moves pieces on get_board's board directly, such as a
+        search, must keep the key up to date with this (set_turn updates the turn's part)."""
+        self._position_key = key
+
+    def _build_position_key(self):
+        """Returns the position key worked out from the whole board and the turn."""
+        key = 0
+        for row in range(0, 10):
+            for column in range(0, 9):
+                piece = self._board[row][column]
+                if piece != '--':
+                    key ^= ZOBRIST_KEYS[piece][row * 9 + column]
+        if self._turn == 'black':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
+
+    def get_fen(self):
+        """Returns the position in Xiangqi FEN notation. FEN lists the ranks from black's back rank
+        (row 9) down to red's (row 0) and each rank from file 'a' (column 8) to file 'i'."""
+        ranks = []
+        for row in range(9, -1, -1):
+            rank = ''
+            empty = 0
+            for column in range(8, -1, -1):
+                piece = self._board[row][column]
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                letter = PIECE_FEN[piece[1]]
+                rank += letter if piece[0] == 'r' else letter.lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        side = 'w' if self._turn == 'red' else 'b'
+        return '/'.join(ranks) + ' ' + side + ' - - 0 1'
+
+    def set_fen(self, fen):
+        """Takes a position in Xiangqi FEN notation and sets up the board, the turn, the General
+        positions and the check flags from it. The game state is set to 'UNFINISHED'. Raises
+        ValueError if the FEN is malformed."""
+        fields = fen.split()
+        ranks = fields[0].split('/') if fields else []
+        if len(ranks) != 10:
+            raise ValueError('FEN must have 10 ranks: ' + fen)
+        board = [['--'] * 9 for num in range(10)]
+        for rank_num, rank in enumerate(ranks):
+            row = 9 - rank_num
+            column = 8
+            for letter in rank:
+                if letter.isdigit():
+                    column -= int(letter)
+                    continue
+                if letter.upper() not in FEN_PIECES or column < 0:
+                    raise ValueError('Invalid FEN rank: ' + rank)
+                color = 'r' if letter.isupper() else 'b'
+                board[row][column] = color + FEN_PIECES[letter.upper()]
+                if board[row][column] == 'rK':
+                    self.set_rk_position(row, column)
+                elif board[row][column] == 'bK':
+                    self.set_bk_position(row, column)
+                column -= 1
+            if column != -1:
+                raise ValueError('Invalid FEN rank: ' + rank)
+
+        self._board = board
+        self._file_masks = self._build_file_masks()
+        self._position_key = self._build_position_key()
+        if len(fields) > 1 and fields[1] == 'b':
+            self.set_turn('black')
+        else:
+            self.set_turn('red')
+        self.set_game_state('UNFINISHED')
+        self._red_in_check = self.square_attacked(self._rK_position[0], self._rK_position[1],
+                                                  'black')
+        self._black_in_check = self.square_attacked(self._bK_position[0], self._bK_position[1],
+                                                    'red')
+
+    def clone(self):
+        """Returns a copy of the game which can be moved independently of this one. Only the board
+        and the General positions are copied; the piece objects and the opening book are shared,
+        which makes cloning far cheaper than copy.deepcopy. Move listeners are not copied."""
+        game = XiangqiGame.__new__(XiangqiGame)
+        for name, value in self.__dict__.items():
+            # skips methods wrapped onto this instance, such as by MoveProfiler.attach
+            if not callable(value):
+                game.__dict__[name] = value
+        game._board = [row[:] for row in self._board]
+        game._file_masks = list(self._file_masks)
+        game._bK_position = list(self._bK_position)
+        game._rK_position = list(self._rK_position)
+        game._obj_dictionary = game._build_obj_dictionary()
+        game._hint_cache = {}
+        game._move_listeners = []
+        return game
+
+    def get_snapshot(self):
+        """Returns a PositionSnapshot of the board, the turn, the General positions, the check
+        flags and the game state."""
+        codes = SNAPSHOT_CODES
+        return PositionSnapshot(bytes([codes[piece] for row in self._board for piece in row]),
+                                self._turn, self._rK_position[0] * 9 + self._rK_position[1],
+                                self._bK_position[0] * 9 + self._bK_position[1],
+                                self._red_in_check, self._black_in_check, self._game_state)
+
+    def restore_snapshot(self, snapshot, position_key=None):
+        """Takes a PositionSnapshot and puts the game back in the position it was taken in, in
+        constant time: no moves are replayed. Callers which already know the snapshot's position
+        key, such as a GameStore, can pass it instead of having it worked out from the board."""
+        board = snapshot.board
+        pieces = SNAPSHOT_PIECES.__getitem__
+        self._board = [list(map(pieces, board[start:start + 9])) for start in range(0, 90, 9)]
+        self._file_masks = self._build_file_masks()
+        self._turn = snapshot.turn
+        self._rK_position = [snapshot.red_king // 9, snapshot.red_king % 9]
+        self._bK_position = [snapshot.black_king // 9, snapshot.black_king % 9]
+        self._red_in_check = snapshot.red_in_check
+        self._black_in_check = snapshot.black_in_check
+        self._game_state = snapshot.game_state
+        if position_key is None:
+            position_key = self._build_position_key()
+        self._position_key = position_key
+
+    def add_move_listener(self, listener):
+        """Takes a function which make_move calls with a MoveEvent after every accepted move.
+        Listeners are called in the order they were added, before make_move returns."""
+        self._move_listeners.append(listener)
+
+    def remove_move_listener(self, listener):
+        """Stops calling a function added by add_move_listener. Does nothing if it was not
+        added."""
+        if listener in self._move_listeners:
+            self._move_listeners.remove(listener)
+
+    def _build_file_masks(self):
+        """Returns the occupancy mask of every file (column) of the board: bit n is set if row n
+        of the file holds a piece."""
+        masks = [0] * 9
+        for row in range(0, 10):
+            for column in range(0, 9):
+                if self._board[row][column] != '--':
+                    masks[column] |= 1 << row
+        return masks
+
+    def get_file_occupancy(self):
+        """Returns the list of the nine files' occupancy masks (bit n set if row n of the file
+        holds a piece), which make_move keeps up to date. Code which moves pieces on get_board's
+        board directly, such as a search, must update the masks as well."""
+        return self._file_masks
+
+    def get_file_count(self, column):
+        """Returns the number of pieces on a file (column)."""
+        return bin(self._file_masks[column]).count('1')
+
+    def are_generals_facing(self):
+        """Returns True if the two Generals stand on the same file with no piece between them,
+        which no legal move may leave behind. Takes constant time."""
+        red_row, red_column = self._rK_position
+        black_row, black_column = self._bK_position
+        return red_column == black_column and \
+            not self._file_masks[red_column] & BETWEEN_MASKS[red_row][black_row]
+
+    def move_faces_generals(self, from_row, from_column, to_row, to_column):
+        """Takes the list coordinates of a move and returns True if making it would leave the
+        Generals facing each other, whether it moves a General onto the other's file or moves the
+        last piece between them away. Takes constant time and does not change the board."""
+        red_row, red_column = self._rK_position
+        black_row, black_column = self._bK_position
+        piece = self._board[from_row][from_column]
+        if piece == 'rK':
+            red_row, red_column = to_row, to_column
+        elif piece == 'bK':
+            black_row, black_column = to_row, to_column
+        if red_column != black_column:
+            return False
+        mask = self._file_masks[red_column]
+        if from_column == red_column:
+            mask &= ~(1 << from_row)
+        if to_column == red_column:
+            mask |= 1 << to_row
+        return not mask & BETWEEN_MASKS[red_row][black_row]
+
     def get_bk_position(self):
         """Returns the bK's (Black King/General) position."""
         return self._bK_position
@@ -88,8 +503,26 @@ class XiangqiGame:
         """Sets the rK's (Red King/General) position."""
         self._rK_position = [row, column]
 
+    def get_opening_book(self):
+        """Returns the opening book used by get_book_move, or None."""
+        return self._opening_book
+
+    def set_opening_book(self, opening_book):
+        """Sets the opening book (an OpeningBook, or None) queried by get_book_move."""
+        self._opening_book = opening_book
+
+    def get_book_move(self):
+        """Returns a (from_square, to_square) move chosen from the opening book for the current
+        position, or None if there is no book, the game is over or the position is not in it.
+        Callers choosing a move should try this before searching."""
+        if self._opening_book is None or self.get_game_state() != 'UNFINISHED':
+            return None
+        return self._opening_book.choose_move(self)
+
     def set_turn(self, turn):
-        """Sets XiangqiGame's turn data member."""
+        """Sets XiangqiGame's turn data member, and the turn's part of the position key."""
+        if turn != self._turn:
+            self._position_key ^= ZOBRIST_BLACK_TO_MOVE
         self._turn = turn
 
     def set_game_state(self, new_state):
@@ -127,6 +560,112 @@ class XiangqiGame:
             # Game is over
             return False
 
+        coordinates = self._parse_move(from_square, to_square)
+        if coordinates is None:
+            return False
+        from_row_coordinate, from_column_coordinate, to_row_coordinate, to_column_coordinate = \
+            coordinates
+
+        # *****************************************************************************************
+        # This section calls the piece's move method for additional move validation
+        # *****************************************************************************************
+        valid_move = self._validate_move(from_row_coordinate, from_column_coordinate,
+                                         to_row_coordinate, to_column_coordinate)
+        # if valid move was set to True from piece's move method then does not return
+        if valid_move == False:
+            # The object's move method returned False for invalid move
+            return False
+
+        # *****************************************************************************************
+        # Moves piece and checks if it places current player's King in check, if yes, reverses move.
+        # Test pieces and coordinates are used in order to avoid making unwanted changes to objects.
+        # *****************************************************************************************
+
+        # runs the self_in_check method with coordinates for the red kind or black king, depending
+        # on the who's turn it is
+        if self.get_turn() == 'red':
+            placed_myself_in_check = self.self_in_check(from_row_coordinate,
+                                                        from_column_coordinate,
+                                                        to_row_coordinate, to_column_coordinate,
+                                                        int(int(self.get_rk_position()[0])),
+                                                        int(int(self.get_rk_position()[1])))
+        else:
+            placed_myself_in_check = self.self_in_check(from_row_coordinate,
+                                                        from_column_coordinate,
+                                                        to_row_coordinate, to_column_coordinate,
+                                                        int(int(self.get_bk_position()[0])),
+                                                        int(int(self.get_bk_position()[1])))
+
+        # You cannot make a move which places yourself in check
+        if placed_myself_in_check is True:
+            return False
+
+        # *****************************************************************************************
+        # Moves the piece from one 'square' to the next. The validity of the move should be checked
+        # before this block of code is reached.
+        # *****************************************************************************************
+        piece = self._board[from_row_coordinate][from_column_coordinate]
+        captured = self._board[to_row_coordinate][to_column_coordinate]
+        self._board[from_row_coordinate][from_column_coordinate] = '--'
+        self._board[to_row_coordinate][to_column_coordinate] = piece
+        self._file_masks[from_column_coordinate] &= ~(1 << from_row_coordinate)
+        self._file_masks[to_column_coordinate] |= 1 << to_row_coordinate
+        from_index = from_row_coordinate * 9 + from_column_coordinate
+        to_index = to_row_coordinate * 9 + to_column_coordinate
+        self._position_key ^= ZOBRIST_KEYS[piece][from_index] ^ ZOBRIST_KEYS[piece][to_index]
+        if captured != '--':
+            self._position_key ^= ZOBRIST_KEYS[captured][to_index]
+        self.end_turn()
+
+        # Updates the location of rK and bK if moved
+        if self._board[to_row_coordinate][to_column_coordinate] == 'rK':
+            self.set_rk_position(to_row_coordinate, to_column_coordinate)
+        elif self._board[to_row_coordinate][to_column_coordinate] == 'bK':
+            self.set_bk_position(to_row_coordinate, to_column_coordinate)
+
+        # ****************************************************************************************
+        # Checks if move just made places opponent in check. If black moved, then calls each black
+        # piece move method with the 'to coordinates' for the red General. If any move returns True,
+        # red is in check. Runs the same procedure if red moved with red pieces and black General
+        # coordinates.
+        # ****************************************************************************************
+
+        # runs the opponent_in_check method
+        self.opponent_in_check(to_row_coordinate, to_column_coordinate)
+
+        # *****************************************************************************************
+        # If a piece is in check. This block will check for check mate.
+        # *****************************************************************************************
+        self._checkmate_scan()
+
+        # *****************************************************************************************
+        # This section checks for stalemate. If the player has no valid moves they lose, unless the
+        # rules make stalemate a draw.
+        # *****************************************************************************************
+        self._stalemate_scan()
+
+        # house rules may adjudicate the game, such as drawing it when neither side can mate
+        if self._adjudicators and self._game_state == 'UNFINISHED':
+            for adjudicator in self._adjudicators:
+                result = adjudicator(self)
+                if result is not None:
+                    self.set_game_state(result)
+                    break
+
+        if self._move_listeners:
+            event = MoveEvent(from_square, to_square, piece, captured, self._red_in_check,
+                              self._black_in_check, self._game_state)
+            for listener in self._move_listeners:
+                listener(event)
+
+        # last line of code to run for the move method, returns True per assignment
+        return True
+
+    def _parse_move(self, from_square, to_square):
+        """Takes make_move's two square strings and returns the move as (from_row, from_column,
+        to_row, to_column) list coordinates, or None if the squares are invalid, the 'from square'
+        does not hold a piece of the player whose turn it is or the 'to square' holds one."""
+
         input_validation = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10']
 
         move_dictionary = {
@@ -151,81 +690,61 @@ class XiangqiGame:
         else:
             row = (int(from_square[1]) - 1)
         if self._board[row][column][0] != self.get_turn()[0]:
-            return False
+            return None
 
         # checks to make sure the 'from square' is different from the 'to square'
         if from_square == to_square:
-            return False
+            return None
 
         # checks if the letter given is a valid file/column
         if from_square[0] not in move_dictionary or to_square[0] not in move_dictionary:
-            return False
+            return None
 
         # if the length of the coordinate is greater than 3 or less than 2, it is an invalid move
         if len(from_square) > 3 or len(to_square) > 3 or len(from_square) < 2 or len(to_square) < 2:
-            return False
+            return None
 
         # if coordinate length is 3, then the row must be equal to 10 to be a valid move
         if len(from_square) == 3:
             if int(from_square[1:3]) != 10:
-                return False
+                return None
         if len(to_square) == 3:
             if int(to_square[1:3]) != 10:
-                return False
+                return None
 
         # checks if invalid string characters are used
         if from_square[1] not in input_validation or to_square[1] not in input_validation:
-            return False
+            return None
 
         # checks if the 'from square' is empty
         if len(from_square) == 3:
             if self._board[9][move_dictionary[from_square[0]]] == '--':
                 # The 'move from' coordinates point to an empty square
-                return False
+                return None
         else:
             if self._board[int(from_square[1]) - 1][move_dictionary[from_square[0]]] == '--':
                 # The 'move from' coordinates point to an empty square
-                return False
+                return None
 
         # checks if the 'to square' has your own piece
         if len(to_square) == 3:
             if self._board[9][move_dictionary[to_square[0]]][0] == 'r':
                 if self.get_turn() == 'red':
                     # Red piece cannot move to position occupied by red piece
-                    return False
+                    return None
             if self._board[9][move_dictionary[to_square[0]]][0] == 'b':
                 if self.get_turn() == 'black':
                     # Black piece cannot move to position occupied by black piece
-                    return False
+                    return None
         else:
             if self._board[int(to_square[1]) - 1][move_dictionary[to_square[0]]][0] == 'r':
                 if self.get_turn() == 'red':
                     # Red piece cannot move to position occupied by red piece
-                    return False
+                    return None
             if self._board[int(to_square[1]) - 1][move_dictionary[to_square[0]]][0] == 'b':
                 if self.get_turn() == 'black':
                     # Black piece cannot move to position occupied by black piece
-                    return False
-
-        # *****************************************************************************************
-        # This section calls the piece's move method for additional move validation
-        # *****************************************************************************************
-        obj_dictionary = {
-            'rK': self._red_general,
-            'bK': self._black_general,
-            'rG': self._red_guard,
-            'bG': self._black_guard,
-            'rE': self._red_elephant,
-            'bE': self._black_elephant,
-            'rH': self._red_horse,
-            'bH': self._black_horse,
-            'rT': self._red_chariot,
-            'bT': self._black_chariot,
-            'rC': self._red_cannon,
-            'bC': self._black_cannon,
-            'rS': self._red_soldier,
-            'bS': self._black_soldier
-        }
+                    return None
 
         # converts from_square and to_square to list coordinates
         if len(from_square) == 3:
@@ -239,161 +758,20 @@ class XiangqiGame:
         else:
             to_row_coordinate = (int(to_square[1]) - 1)
         to_column_coordinate = move_dictionary[to_square[0]]
+        return from_row_coordinate, from_column_coordinate, to_row_coordinate, to_column_coordinate
 
-        # access the object being moved and call it's move method passing coordinates for the move
-        valid_move = obj_dictionary[self._board[from_row_coordinate][from_column_coordinate]].move(
-            from_row_coordinate, from_column_coordinate, to_row_coordinate, to_column_coordinate,
-            self._board)
-        # if valid move was set to True from piece's move method then does not return
-        if valid_move == False:
-            # The object's move method returned False for invalid move
-            return False
-
-        # *****************************************************************************************
-        # Moves piece and checks if it places current player's King in check, if yes, reverses move.
-        # Test pieces and coordinates are used in order to avoid making unwanted changes to objects.
-        # *****************************************************************************************
-
-        def self_in_check(from_row, from_column, to_row, to_column, king_row, king_column):
-
-            test_piece = str(self._board[from_row][from_column])    # string at the 'from' location
-            to_position = str(self._board[to_row][to_column])       # string at the 'to' location
-            self._board[from_row][from_column] = '--'
-            self._board[to_row][to_column] = str(test_piece)
-
-            # position of the General/King
-            k_position = [int(king_row), int(king_column)]
-
-            if test_piece == 'rK' or test_piece == 'bK':
-                # Updates the location of rK and bK if moved
-                original_king_row = int(king_row)
-                original_king_col = int(king_column)
-
-                if test_piece == 'rK' or test_piece == 'bK':
-                    k_position = [to_row, to_column]
-
-            # Tests for self check. Calls the move method for all offensive opposing pieces using
-            # the General's coordinates for the 'to square' coordinates. If True is returned, an
-            # opposing player's move to your king is valid and you would be in check.
-
-            self_check = None
-            check_counter = 0
-            if test_piece[0] == 'b':
-                for rows in range(0, 10):
-                    for col in range(0, 9):
-                        if self._board[rows][col][0] == 'r':
-                            self_check = obj_dictionary[self._board[rows][col]].move(rows, col,
-                                k_position[0], k_position[1], self._board)
-                            if self_check is True:        # you've placed yourself in check
-                                check_counter += 1
-
-            elif test_piece[0] == 'r':
-                for rows in range(0, 10):
-                    for col in range(0, 9):
-                        if self._board[rows][col][0] == 'b':
-                            self_check = obj_dictionary[self._board[rows][col]].move(rows, col,
-                                k_position[0], k_position[1], self._board)
-
-                            if self_check is True:        # you've placed yourself in check
-                                check_counter += 1
-
-            # reverse test_piece move, as you cannot place yourself in check
-            self._board[to_row][to_column] = str(to_position)
-            self._board[from_row][from_column] = str(test_piece)
-
-            if check_counter > 0:
-                # print("You cannot place yourself in check.")
-                return True
-
-            return False
+    def _validate_move(self, from_row, from_column, to_row, to_column):
+        """Takes the list coordinates of a move and returns the result of the moving piece's move
+        method, which checks the move against the piece's movement rules."""
 
-        # runs the self_in_check method with coordinates for the red kind or black king, depending
-        # on the who's turn it is
-        if self.get_turn() == 'red':
-            placed_myself_in_check = self_in_check(from_row_coordinate, from_column_coordinate,
-                                                   to_row_coordinate, to_column_coordinate,
-                                                   int(int(self.get_rk_position()[0])),
-                                                   int(int(self.get_rk_position()[1])))
-        else:
-            placed_myself_in_check = self_in_check(from_row_coordinate, from_column_coordinate,
-                                                   to_row_coordinate, to_column_coordinate,
-                                                   int(int(self.get_bk_position()[0])),
-                                                   int(int(self.get_bk_position()[1])))
-
-        # You cannot make a move which places yourself in check
-        if placed_myself_in_check is True:
-            return False
-
-        # *****************************************************************************************
-        # Moves the piece from one 'square' to the next. The validity of the move should be checked
-        # before this block of code is reached.
-        # *****************************************************************************************
-        if len(from_square) == 3:
-            piece = self._board[9][move_dictionary[from_square[0]]]
-            self._board[9][move_dictionary[from_square[0]]] = '--'
-        else:
-            piece = self._board[int(from_square[1]) - 1][move_dictionary[from_square[0]]]
-            self._board[int(from_square[1]) - 1][move_dictionary[from_square[0]]] = '--'
-
-        if len(to_square) == 3:
-            self._board[9][move_dictionary[to_square[0]]] = piece
-            self.end_turn()
-        else:
-            self._board[int(to_square[1]) - 1][move_dictionary[to_square[0]]] = piece
-            self.end_turn()
-
-        # Updates the location of rK and bK if moved
-        if self._board[to_row_coordinate][to_column_coordinate] == 'rK':
-            self.set_rk_position(to_row_coordinate, to_column_coordinate)
-        elif self._board[to_row_coordinate][to_column_coordinate] == 'bK':
-            self.set_bk_position(to_row_coordinate, to_column_coordinate)
-
-        # ****************************************************************************************
-        # Checks if move just made places opponent in check. If black moved, then calls each black
-        # piece move method with the 'to coordinates' for the red General. If any move returns True,
-        # red is in check. Runs the same procedure if red moved with red pieces and black General
-        # coordinates.
-        # ****************************************************************************************
-
-        def opponent_in_check(to_row, to_column):
-
-            r_check = 0
-            b_check = 0
-            if self._board[to_row][to_column][0] == 'b':
-                for row in range(0, 10):
-                    for square in range(0, 9):
-                        if self._board[row][square][0] == 'b':
-                            if obj_dictionary[self._board[row][square]].move(row, square,
-                                    self.get_rk_position()[0], self.get_rk_position()[1],
-                                                                             self._board):
-                                r_check += 1  # you've placed opponent in check
-
-            elif self._board[to_row][to_column][0] == 'r':
-                for row in range(0, 10):
-                    for square in range(0, 9):
-                        if self._board[row][square][0] == 'r':
-                            if obj_dictionary[self._board[row][square]].move(row, square,
-                                    self.get_bk_position()[0], self.get_bk_position()[1],
-                                                                             self._board):
-                                b_check += 1  # you've placed opponent in check
-
-            # Sets r_check or b_check to True if check was identified above.
-            if r_check > 0:
-                self._red_in_check = True
-            else:
-                self._red_in_check = False
-            if b_check > 0:
-                self._black_in_check = True
-            else:
-                self._black_in_check = False
-
-        # runs opponent in check method defined above
-        opponent_in_check(to_row_coordinate, to_column_coordinate)
+        # access the object being moved and call it's move method passing coordinates for the move
+        return self._obj_dictionary[self._board[from_row][from_column]].move(
+            from_row, from_column, to_row, to_column, self._board)
 
-        # *****************************************************************************************
-        # If a piece is in check. This block will check for check mate.
-        # *****************************************************************************************
+    def _checkmate_scan(self):
+        """Sets the game state if the player in check has no move which gets them out of check."""
 
+        obj_dictionary = self._obj_dictionary
         if self.get_red_in_check(): # if red is in check this block runs
             num_moves_escape_check = 0
             rk_row = int(self.get_rk_position()[0])
@@ -410,8 +788,9 @@ class XiangqiGame:
                                                                     a_row, a_square, self._board):
                                         # test move with still_in_check method to verify if it gets
                                         # you out of check
-                                        still_in_check = self_in_check(row, square, a_row, a_square,
-                                                                       rk_row, rk_col)
+                                        still_in_check = self.self_in_check(row, square, a_row,
+                                                                            a_square, rk_row,
+                                                                            rk_col)
                                         # makes sure the rk position wasn't inadvertently changed
                                         self.set_rk_position(rk_row, rk_col)
 
@@ -437,8 +816,9 @@ class XiangqiGame:
                                                                     a_row, a_square, self._board):
                                         # test move with still_in_check method to verify if it gets
                                         # you out of check
-                                        still_in_check = self_in_check(row, square, a_row, a_square,
-                                                                       bk_row, bk_col)
+                                        still_in_check = self.self_in_check(row, square, a_row,
+                                                                            a_square, bk_row,
+                                                                            bk_col)
                                         # makes sure the bk position wasn't inadvertently changed
                                         self.set_bk_position(bk_row, bk_col)
 
@@ -448,10 +828,11 @@ class XiangqiGame:
             if num_moves_escape_check == 0:
                 self.set_game_state('RED_WON')
 
-        # *****************************************************************************************
-        # This last section checks for stalemate. If the player has no valid moves they lose.
-        # *****************************************************************************************
+    def _stalemate_scan(self):
+        """Sets the game state if either player has no legal moves remaining, which loses, or
+        under the 'draw' stalemate rule draws if they are not in check."""
 
+        obj_dictionary = self._obj_dictionary
         red_moves_remaining = 0
         rk_row = int(self.get_rk_position()[0])
         rk_col = int(self.get_rk_position()[1])
@@ -467,8 +848,8 @@ class XiangqiGame:
                                                                                  a_row, a_square,
                                                                                  self._board):
                                     # test move to verify if it places you in check
-                                    if not self_in_check(row, square, a_row, a_square,
-                                                                   rk_row, rk_col):
+                                    if not self.self_in_check(row, square, a_row, a_square,
+                                                              rk_row, rk_col):
                                         # moves remain for red
                                         red_moves_remaining += 1
                                     # makes sure the rk position wasn't inadvertently changed
@@ -493,33 +874,265 @@ class XiangqiGame:
                                                                                  a_row, a_square,
                                                                                  self._board):
                                     # test move to verify if it places you in check
-                                    if not self_in_check(row, square, a_row, a_square,
-                                                                   bk_row, bk_col):
+                                    if not self.self_in_check(row, square, a_row, a_square,
+                                                              bk_row, bk_col):
                                         # moves remain for black
                                         black_moves_remaining += 1
                                     # makes sure the bk position wasn't inadvertently changed
                                     self.set_bk_position(bk_row, bk_col)
 
-        if red_moves_remaining == 0:        # if red has no remaining moves, stalemate & black wins
-            self.set_game_state('BLACK_WON')
-        elif black_moves_remaining == 0:    # if black has no remaining moves, stalemate & red wins
-            self.set_game_state('RED_WON')
+        if red_moves_remaining == 0:        # if red has no remaining moves, stalemate
+            self.set_game_state(self._stalemate_results[0][self._red_in_check])
+        elif black_moves_remaining == 0:    # if black has no remaining moves, stalemate
+            self.set_game_state(self._stalemate_results[1][self._black_in_check])
 
-        # last line of code to run for the move method, returns True per assignment
-        return True
+    def self_in_check(self, from_row, from_column, to_row, to_column, king_row, king_column):
+        """Takes the list coordinates of a move and of the moving player's General. Temporarily
+        makes the move on the board and returns True if it would leave that General in check or the
+        two Generals facing each other, otherwise returns False. The board is restored before
+        returning."""
+
+        # the Generals may not face each other on an open file
+        if self.move_faces_generals(from_row, from_column, to_row, to_column):
+            return True
+
+        test_piece = str(self._board[from_row][from_column])    # string at the 'from' location
+        to_position = str(self._board[to_row][to_column])       # string at the 'to' location
+        self._board[from_row][from_column] = '--'
+        self._board[to_row][to_column] = str(test_piece)
+
+        # position of the General/King
+        k_position = [int(king_row), int(king_column)]
+
+        if test_piece == 'rK' or test_piece == 'bK':
+            # Updates the location of rK and bK if moved
+            original_king_row = int(king_row)
+            original_king_col = int(king_column)
+
+            if test_piece == 'rK' or test_piece == 'bK':
+                k_position = [to_row, to_column]
+
+        # Tests for self check. Calls the move method for all offensive opposing pieces using
+        # the General's coordinates for the 'to square' coordinates. If True is returned, an
+        # opposing player's move to your king is valid and you would be in check.
+
+        self_check = None
+        check_counter = 0
+        if test_piece[0] == 'b':
+            for rows in range(0, 10):
+                for col in range(0, 9):
+                    if self._board[rows][col][0] == 'r':
+                        self_check = self._obj_dictionary[self._board[rows][col]].move(rows, col,
+                            k_position[0], k_position[1], self._board)
+                        if self_check is True:        # you've placed yourself in check
+                            check_counter += 1
+
+        elif test_piece[0] == 'r':
+            for rows in range(0, 10):
+                for col in range(0, 9):
+                    if self._board[rows][col][0] == 'b':
+                        self_check = self._obj_dictionary[self._board[rows][col]].move(rows, col,
+                            k_position[0], k_position[1], self._board)
+
+                        if self_check is True:        # you've placed yourself in check
+                            check_counter += 1
+
+        # reverse test_piece move, as you cannot place yourself in check
+        self._board[to_row][to_column] = str(to_position)
+        self._board[from_row][from_column] = str(test_piece)
+
+        if check_counter > 0:
+            # print("You cannot place yourself in check.")
+            return True
+
+        return False
+
+    def opponent_in_check(self, to_row, to_column):
+        """Takes the list coordinates of the square just moved to. Calls the move method of every
+        piece belonging to the player who moved using the opposing General's coordinates and
+        updates red_in_check and black_in_check accordingly."""
+
+        r_check = 0
+        b_check = 0
+        if self._board[to_row][to_column][0] == 'b':
+            for row in range(0, 10):
+                for square in range(0, 9):
+                    if self._board[row][square][0] == 'b':
+                        if self._obj_dictionary[self._board[row][square]].move(row, square,
+                                self.get_rk_position()[0], self.get_rk_position()[1],
+                                                                         self._board):
+                            r_check += 1  # you've placed opponent in check
+
+        elif self._board[to_row][to_column][0] == 'r':
+            for row in range(0, 10):
+                for square in range(0, 9):
+                    if self._board[row][square][0] == 'r':
+                        if self._obj_dictionary[self._board[row][square]].move(row, square,
+                                self.get_bk_position()[0], self.get_bk_position()[1],
+                                                                         self._board):
+                            b_check += 1  # you've placed opponent in check
+
+        # Sets r_check or b_check to True if check was identified above.
+        if r_check > 0:
+            self._red_in_check = True
+        else:
+            self._red_in_check = False
+        if b_check > 0:
+            self._black_in_check = True
+        else:
+            self._black_in_check = False
+
+    def square_attacked(self, row, column, red_or_black):
+        """Takes list coordinates and either 'red' or 'black' and returns True if any piece of
+        that player could move to the square according to its move method, otherwise False."""
+        color = red_or_black[0]
+        for from_row in range(0, 10):
+            for from_column in range(0, 9):
+                piece = self._board[from_row][from_column]
+                if piece[0] == color:
+                    if self._obj_dictionary[piece].move(from_row, from_column, row, column,
+                                                        self._board):
+                        return True
+        return False
+
+    def get_legal_moves(self, red_or_black):
+        """Takes as a parameter either 'red' or 'black' and returns a list of every move that player
+        could legally make, as (from_row, from_column, to_row, to_column) list coordinates. Uses the
+        pieces' move methods and self_in_check, so it accepts exactly the moves make_move accepts.
+        coordinates_to_square converts the coordinates to make_move's notation."""
+
+        color = red_or_black[0]
+        if color == 'r':
+            king_row, king_column = self.get_rk_position()
+        else:
+            king_row, king_column = self.get_bk_position()
 
-    def display_board(self):
-        """Method which displays the board in its current state."""
-        print('\n')
-        print('   ', ' 0', '  1', '  2', '  3', '  4', '  5', '  6', '  7', '  8')
-        row_num = 1
-        for row in self._board:
-            print(str(row_num).rjust(2), " ", end='')
-            for square in row:
-                print(square, " ", end='')
-            print(row_num - 1)
-            row_num += 1
-        print('   ', ' i', '  h', '  g', '  f', '  e', '  d', '  c', '  b', '  a')
+        legal_moves = []
+        for row in range(0, 10):
+            for column in range(0, 9):
+                piece = self._board[row][column]
+                if piece[0] != color:
+                    continue
+                piece_obj = self._obj_dictionary[piece]
+                for to_row, to_column in candidate_squares(piece, row, column):
+                    # cannot move to a square occupied by your own piece
+                    if self._board[to_row][to_column][0] == color:
+                        continue
+                    if not piece_obj.move(row, column, to_row, to_column, self._board):
+                        continue
+                    if self.self_in_check(row, column, to_row, to_column, king_row, king_column):
+                        continue
+                    legal_moves.append((row, column, to_row, to_column))
+        return legal_moves
+
+    def attacked_squares(self, red_or_black):
+        """Takes as a parameter either 'red' or 'black' and returns the [row, column] list
+        coordinates, as (row, column) tuples in board order, of every square that player's pieces
+        could capture on, including squares of their own pieces (which they defend). Results are
+        cached per position key, like those of the other hint methods."""
+        return self._get_hint('attacked_squares', red_or_black)
+
+    def hanging_pieces(self, red_or_black):
+        """Takes as a parameter either 'red' or 'black' and returns the squares of that player's
+        pieces, other than the General, which the opponent attacks and no piece of their own
+        defends."""
+        return self._get_hint('hanging_pieces', red_or_black)
+
+    def checking_moves(self, red_or_black):
+        """Takes as a parameter either 'red' or 'black' and returns that player's legal moves,
+        as (from_row, from_column, to_row, to_column) list coordinates, which put the opposing
+        General in check."""
+        return self._get_hint('checking_moves', red_or_black)
+
+    def captures(self, red_or_black):
+        """Takes as a parameter either 'red' or 'black' and returns that player's legal moves
+        which capture an opposing piece."""
+        return self._get_hint('captures', red_or_black)
+
+    def _get_hint(self, name, red_or_black):
+        """Returns a hint method's result from the cache, working it out on a miss."""
+        key = (self._position_key, name, red_or_black)
+        hint = self._hint_cache.get(key)
+        if hint is None:
+            if len(self._hint_cache) >= HINT_CACHE_SIZE:
+                self._hint_cache = {}
+            hint = getattr(self, '_find_' + name)(red_or_black)
+            self._hint_cache[key] = hint
+        return hint
+
+    def _find_attacked_squares(self, red_or_black):
+        """Works out attacked_squares. Every square a piece could reach is probed with the piece's
+        move method while an opposing piece stands on it, since cannons only move there by
+        capturing."""
+        color = red_or_black[0]
+        enemy = 'bS' if color == 'r' else 'rS'
+        board = self._board
+        squares = set()
+        for row in range(0, 10):
+            for column in range(0, 9):
+                piece = board[row][column]
+                if piece[0] != color:
+                    continue
+                piece_obj = self._obj_dictionary[piece]
+                for to_row, to_column in candidate_squares(piece, row, column):
+                    if (to_row, to_column) in squares:
+                        continue
+                    original = board[to_row][to_column]
+                    board[to_row][to_column] = enemy
+                    if piece_obj.move(row, column, to_row, to_column, board):
+                        squares.add((to_row, to_column))
+                    board[to_row][to_column] = original
+        return tuple(sorted(squares))
+
+    def _find_hanging_pieces(self, red_or_black):
+        """Works out hanging_pieces from both players' attacked squares."""
+        color = red_or_black[0]
+        attacked = set(self.attacked_squares('black' if color == 'r' else 'red'))
+        defended = set(self.attacked_squares(red_or_black))
+        return tuple((row, column) for row, column in sorted(attacked - defended)
+                     if self._board[row][column][0] == color and
+                     self._board[row][column][1] != 'K')
+
+    def _find_checking_moves(self, red_or_black):
+        """Works out checking_moves by making each legal move on the board and probing the
+        opposing General's square."""
+        if red_or_black == 'red':
+            king_row, king_column = self.get_bk_position()
+        else:
+            king_row, king_column = self.get_rk_position()
+        board = self._board
+        moves = []
+        for from_row, from_column, to_row, to_column in self.get_legal_moves(red_or_black):
+            piece = board[from_row][from_column]
+            captured = board[to_row][to_column]
+            board[from_row][from_column] = '--'
+            board[to_row][to_column] = piece
+            if self.square_attacked(king_row, king_column, red_or_black):
+                moves.append((from_row, from_column, to_row, to_column))
+            board[to_row][to_column] = captured
+            board[from_row][from_column] = piece
+        return tuple(moves)
+
+    def _find_captures(self, red_or_black):
+        """Works out captures from the legal moves."""
+        return tuple(move for move in self.get_legal_moves(red_or_black)
+                     if self._board[move[2]][move[3]] != '--')
+
+    def get_board_text(self):
+        """Returns the board as display_board shows it: one line per row, with the list column
+        numbers above and the file letters below."""
+        lines = ['     0   1   2   3   4   5   6   7   8']
+        for row_num, row in enumerate(self._board):
+            lines.append('%2d  %s  %d' % (row_num + 1, '  '.join(row), row_num))
+        lines.append('     i   h   g   f   e   d   c   b   a')
+        return '\n'.join(lines) + '\n'
+
+    def display_board(self, stream=None):
+        """Method which displays the board in its current state, on stream (standard output if
+        None) with a single write."""
+        if stream is None:
+            stream = sys.stdout
+        stream.write('\n\n' + self.get_board_text())
 
 
 class Piece:
@@ -584,8 +1197,9 @@ class General(Piece):
         intervening_pieces = False      # this flags if intervening pieces exist between Generals
         # Identifies if the red General is being moved.
         if board[from_row][from_column] == 'rK':
-            for num in range(0, 10):
+            for num in range(7, 10):
                 # If the red General is being moved, checks if the to_column contains black General
+                # (which never leaves its palace)
                 if board[num][to_column] == 'bK':
                     for rows_to_bK in range(from_row+1, num):
                         # If the to_column contains the black General, checks if the column has any
@@ -597,8 +1211,9 @@ class General(Piece):
                         return False
         # Identifies if the black General is being moved.
         if board[from_row][from_column] == 'bK':
-            for num in range(0, 10):
-                # If the red General is being moved, checks if the to_column contains black General
+            for num in range(0, 3):
+                # If the black General is being moved, checks if the to_column contains red General
+                # (which never leaves its palace)
                 if board[num][to_column] == 'rK':
                     for rows_to_rK in range(from_row-1, num, -1):
                         # If the to_column contains the black General, checks if the column has any
@@ -973,9 +1588,31 @@ class Horse(Piece):
             return False
 
 
-game = XiangqiGame()
+# the Piece classes of the standard game, which GameRules piece_classes can replace
+STANDARD_PIECES = {'K': General, 'G': Guard, 'E': Elephant, 'H': Horse, 'T': Chariot, 'C': Cannon,
+                   'S': Soldier}
+
+
+if __name__ == '__main__':
+    game = XiangqiGame()
+
+    while game.get_game_state() == 'UNFINISHED':
+
+        print("\n--------------------------------")
+        print("Player's turn: ", game.get_turn())
+        print("Red is in check? ", game.is_in_check('red'))
+        print("Black is in check? ", game.is_in_check('black'))
+        print("Game state:", game.get_game_state())
+        print("--------------------------------")
+        game.display_board()
 
-while game.get_game_state() == 'UNFINISHED':
+        print("\n")
+        from_move = input("From: ")
+        to_move = input("To: ")
+
+        game.make_move(from_move, to_move)
+
+    print("GAME OVER")
 
     print("\n--------------------------------")
     print("Player's turn: ", game.get_turn())
@@ -985,22 +1622,6 @@ while game.get_game_state() == 'UNFINISHED':
     print("--------------------------------")
     game.display_board()
 
-    print("\n")
-    from_move = input("From: ")
-    to_move = input("To: ")
-
-    game.make_move(from_move, to_move)
-
-print("GAME OVER")
-
-print("\n--------------------------------")
-print("Player's turn: ", game.get_turn())
-print("Red is in check? ", game.is_in_check('red'))
-print("Black is in check? ", game.is_in_check('black'))
-print("Game state:", game.get_game_state())
-print("--------------------------------")
-game.display_board()
-
 
 """
 print(